@@ -1,11 +1,55 @@
+import functools
 import json
 import os
-from typing import List
-
-from rich import print
-from thefuzz import fuzz
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional
 
 from .llm_backends.llmBackendBase import LLMBase
+from .tokens import chunk_text, estimate_tokens, pack_texts
+
+
+def print(*args, **kwargs):
+    # rich is only used for the verbose output, so it is imported on first use
+    from rich import print as rich_print
+
+    rich_print(*args, **kwargs)
+
+
+SYSTEM_MESSAGE = "You're a helpful AI, please help the user the best you can. Be as concise and short as possible."
+
+
+def completion_tokens(backend: LLMBase, prompt: str, max_tokens: int) -> int:
+    """
+    Sizes the completion of a request to the model of the backend, ie. at most
+    `max_tokens`, at most what the model generates in one completion and at most what
+    is left of its context once the prompt is in.
+
+    Parameters
+    ----------
+    backend : LLMBase
+        The backend the request is sent to.
+    prompt : str
+        The prompt of the request.
+    max_tokens : int
+        The number of tokens the caller would like at most.
+
+    Returns
+    -------
+    int
+        The max_tokens of the request.
+    """
+    model = getattr(backend, "model", None)
+    max_tokens = min(max_tokens, getattr(model, "max_output_tokens", max_tokens))
+
+    context_length = getattr(model, "context_length", None)
+    if context_length is not None:
+        room = (
+            context_length - estimate_tokens(prompt) - estimate_tokens(SYSTEM_MESSAGE)
+        )
+        max_tokens = min(max_tokens, room)
+    return max(1, max_tokens)
 
 
 def filter_section_names(
@@ -44,11 +88,12 @@ def filter_section_names(
         print("Computed prompt " + prompt)
 
     # Ask to LLM backend to filter the section names
+    max_tokens = completion_tokens(backend, prompt, 512)
     res = backend.completion(
         prompt=prompt,
-        max_tokens=512,
+        max_tokens=max_tokens,
         temperature=0.8,
-        override_system_message="You're a helpful AI, please help the user the best you can. Be as concise and short as possible.",
+        override_system_message=SYSTEM_MESSAGE,
     )
 
     if is_verbose:
@@ -61,46 +106,185 @@ def filter_section_names(
         except json.decoder.JSONDecodeError as e:
             print(e)
             print("Could not parse json")
+            backend.discard(prompt, max_tokens, 0.8, SYSTEM_MESSAGE)
             return
 
-    # Fuzzy match sections with ai_service_response
-    # Create each combination of sections and ai_text array elements
-    combinations = []
-    for section in maybe_sections:
-        for ai_text_element in res:
-            combinations.append((section, ai_text_element))
-
-    # Calculate the fuzz ratio for each combination
-    fuzz_ratios = []
-    for combination in combinations:
-        fuzz_ratios.append(fuzz.ratio(combination[0], combination[1]))
-
-    # Order the combinations by fuzz ratio and create a new list wher each element is a tuple of (fuzz_ratio, section, ai_text_element)
-    ordered_combinations = []
-    for i in range(len(combinations)):
-        ordered_combinations.append(
-            (fuzz_ratios[i], combinations[i][0], combinations[i][1])
-        )
-    ordered_combinations.sort(key=lambda tup: tup[0], reverse=True)
+    if not isinstance(res, list):
+        print("AI response is not a list")
+        backend.discard(prompt, max_tokens, 0.8, SYSTEM_MESSAGE)
+        return
+
+    matched = match_section_names(maybe_sections, [str(title) for title in res])
 
     if is_verbose:
-        print(ordered_combinations)
-
-    N = next(
-        (
-            i
-            for i, combination in enumerate(ordered_combinations)
-            if combination[0] < 75
-        ),
-        len(maybe_sections),
+        print(matched)
+
+    return matched
+
+
+def match_section_names(
+    maybe_sections: List[str], ai_titles: List[str], score_cutoff: int = 75
+) -> List[str]:
+    """
+    Maps the titles returned by the AI back to the original section names.
+
+    All the pairs are scored at once in a score matrix, pairs under the cutoff are
+    discarded early, then the pairs are assigned greedily from the best score down so
+    that every AI title maps to at most one original and the other way around.
+
+    Parameters
+    ----------
+    maybe_sections : List[str]
+        The original candidate section names, in document order.
+    ai_titles : List[str]
+        The section names the AI kept, possibly slightly rewritten.
+    score_cutoff : int
+        The minimum fuzz ratio (0-100) for a pair to match.
+
+    Returns
+    -------
+    List[str]
+        The matched original section names, in document order.
+    """
+    if not maybe_sections or not ai_titles:
+        return []
+
+    import numpy as np
+    from rapidfuzz import fuzz, process
+
+    # scores[i, j] is the ratio of ai_titles[i] and maybe_sections[j], or 0 when it is
+    # under the cutoff
+    scores = process.cdist(
+        ai_titles,
+        maybe_sections,
+        scorer=fuzz.ratio,
+        score_cutoff=score_cutoff,
+        dtype=np.uint8,
+        workers=-1,
     )
 
-    # Print the first N elements of the ordered combinations where N is the number of elements in original sections array that have a fuzz ratio of greater than 75
-    if is_verbose:
-        print(ordered_combinations[:N])
+    rows, columns = np.nonzero(scores)
+    order = np.argsort(-scores[rows, columns].astype(np.int16), kind="stable")
+
+    assigned_titles = set()
+    assigned_sections = set()
+    for k in order:
+        row, column = rows[k], columns[k]
+        if row in assigned_titles or column in assigned_sections:
+            continue
+        assigned_titles.add(row)
+        assigned_sections.add(column)
+        if len(assigned_titles) == len(ai_titles):
+            # Every AI title found its original
+            break
 
-    # Create a list of the sections that have a fuzz ratio of greater than 75
-    return [ordered_combinations[i][1] for i in range(N)]
+    return [maybe_sections[column] for column in sorted(assigned_sections)]
+
+
+@functools.lru_cache(maxsize=None)
+def _read_prompt(name: str) -> str:
+    # Get path for this file
+    path = os.path.dirname(os.path.abspath(__file__))
+
+    # join the path with the prompts file
+    path = os.path.join(path, "prompts", name)
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _build_summarize_prompt(section_text: str) -> str:
+    return _read_prompt("summarize_section_prompt.txt") + section_text
+
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9-]{3,}")
+_STOPWORDS = frozenset(
+    """
+    about above after again also because been before being between both could does
+    doing during each from further have having here into itself just more most other
+    over same should some such than that their them then there these they this those
+    through under until very were what when where which while with would your
+    """.split()
+)
+# A summary ending on one of these stopped in the middle of a sentence
+_UNFINISHED = ",;:-(["
+_SUMMARY_PROMPTS = (
+    "summarize_section_prompt.txt",
+    "summarize_multiple_sections_prompt.txt",
+    "reduce_summaries_prompt.txt",
+)
+
+
+def key_terms(text: str, count: int = 10) -> List[str]:
+    """
+    Returns the most frequent words of a text that are not stop words, lowercased.
+    """
+    counts = Counter(word.lower() for word in _WORD.findall(text))
+    for stopword in _STOPWORDS:
+        counts.pop(stopword, None)
+    return [term for term, _ in counts.most_common(count)]
+
+
+def accept_summary(
+    prompt: str,
+    summary: str,
+    max_tokens: int,
+    min_coverage: float = 0.3,
+    key_term_count: int = 10,
+) -> Optional[str]:
+    """
+    Checks a summary locally, so that only the summaries failing the checks are sent
+    again to a larger model, see `CascadeBackend`.
+
+    A summary is rejected when it is empty, truncated (it used up `max_tokens` or
+    stops in the middle of a sentence), too short for its text or longer than it, or
+    when it misses most of the key terms of its text, ie. its most frequent words.
+    The answers to prompts that are not summary prompts are not checked.
+
+    Parameters
+    ----------
+    prompt : str
+        The prompt of the call.
+    summary : str
+        The answer of the model.
+    max_tokens : int
+        The max_tokens of the call.
+    min_coverage : float
+        The share of the key terms the summary has to mention.
+    key_term_count : int
+        The number of key terms of the text.
+
+    Returns
+    -------
+    Optional[str]
+        None if the summary is acceptable, otherwise why it is not.
+    """
+    for name in _SUMMARY_PROMPTS:
+        template = _read_prompt(name)
+        if prompt.startswith(template):
+            text = prompt[len(template) :]
+            break
+    else:
+        return None
+
+    summary = summary.strip()
+    if not summary:
+        return "empty"
+
+    tokens = estimate_tokens(summary)
+    if tokens >= max_tokens * 0.9 or summary[-1] in _UNFINISHED:
+        return "truncated"
+
+    text_tokens = estimate_tokens(text)
+    if tokens < min(16, text_tokens // 4):
+        return "too_short"
+    if text_tokens > 100 and tokens > text_tokens:
+        return "too_long"
+
+    terms = key_terms(text, key_term_count)
+    lowered = summary.lower()
+    if sum(term in lowered for term in terms) < min_coverage * len(terms):
+        return "low_coverage"
+    return None
 
 
 def summarize_section(section_text: str, backend: LLMBase, is_verbose: bool = False):
@@ -119,28 +303,314 @@ def summarize_section(section_text: str, backend: LLMBase, is_verbose: bool = Fa
     str
         The summary of the section.
     """
-    # Get path for this file
-    path = os.path.dirname(os.path.abspath(__file__))
+    prompt = _build_summarize_prompt(section_text)
 
-    # join the path with the prompts file
-    path = os.path.join(path, "prompts/summarize_section_prompt.txt")
-    with open(path, "r") as f:
-        prompt = f.read()
+    if is_verbose:
+        print("Computed prompt " + prompt)
 
-    prompt += section_text
+    # Ask to LLM backend to summarize the section
+    res = backend.completion(
+        prompt=prompt,
+        max_tokens=completion_tokens(backend, prompt, 2048),
+        temperature=0.8,
+        override_system_message=SYSTEM_MESSAGE,
+    )
+
+    if is_verbose:
+        print("AI response " + res)
+
+    return res
+
+
+def summarize_section_stream(
+    section_text: str, backend: LLMBase, is_verbose: bool = False
+) -> Iterator[str]:
+    """
+    Summarizes a section using the AI, yielding the summary as it is generated.
+
+    Parameters
+    ----------
+    section_text : str
+        The text of the section to summarize.
+    backend : LLMBase
+        The backend to use for the AI operations.
+
+    Yields
+    ------
+    str
+        The text deltas of the summary of the section.
+    """
+    prompt = _build_summarize_prompt(section_text)
 
     if is_verbose:
         print("Computed prompt " + prompt)
 
-    # Ask to LLM backend to summarize the section
+    yield from backend.stream_completion(
+        prompt=prompt,
+        max_tokens=completion_tokens(backend, prompt, 2048),
+        temperature=0.8,
+        override_system_message=SYSTEM_MESSAGE,
+    )
+
+
+def summarize_sections(
+    sections: Dict[str, str],
+    backend: LLMBase,
+    max_concurrency: int = 4,
+    is_verbose: bool = False,
+    on_result: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, str]:
+    """
+    Summarizes many sections concurrently.
+
+    The calls are spread over a thread pool, pacing and rate limit handling is left to
+    the backend, wrap it in a `RateLimitedBackend` to respect the provider limits.
+
+    Parameters
+    ----------
+    sections : Dict[str, str]
+        The section names and their texts, in document order.
+    backend : LLMBase
+        The backend to use for the AI operations.
+    max_concurrency : int
+        The maximum number of calls in flight at the same time.
+    on_result : Optional[Callable[[str, str], None]]
+        Called with the section name and its summary as soon as a summary is ready.
+
+    Returns
+    -------
+    Dict[str, str]
+        The summaries keyed by section name, in document order.
+    """
+    summaries = dict()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {
+            executor.submit(summarize_section, text, backend, is_verbose): section
+            for section, text in sections.items()
+        }
+
+        for future in as_completed(futures):
+            section = futures[future]
+            summaries[section] = future.result()
+            if on_result:
+                on_result(section, summaries[section])
+
+    # The summaries complete out of order, put them back in document order
+    return {section: summaries[section] for section in sections}
+
+
+def _complete(backend: LLMBase, prompt: str, max_tokens: int, is_verbose: bool) -> str:
+    if is_verbose:
+        print("Computed prompt " + prompt)
+
     res = backend.completion(
         prompt=prompt,
-        max_tokens=2048,
+        max_tokens=completion_tokens(backend, prompt, max_tokens),
         temperature=0.8,
-        override_system_message="You're a helpful AI, please help the user the best you can. Be as concise and short as possible.",
+        override_system_message=SYSTEM_MESSAGE,
     )
 
     if is_verbose:
         print("AI response " + res)
 
     return res
+
+
+def summarize_sections_within_budget(
+    sections: Dict[str, str],
+    backend: LLMBase,
+    max_concurrency: int = 4,
+    is_verbose: bool = False,
+    on_result: Optional[Callable[[str, str], None]] = None,
+    max_tokens: int = 2048,
+    chunk_overlap_tokens: int = 200,
+    pack_below_tokens: int = 256,
+) -> Dict[str, str]:
+    """
+    Summarizes many sections while fitting every request in the model's context.
+
+    The prompt budget comes from the context length of the backend's model:
+    - sections larger than the budget are split into overlapping chunks that are
+      summarized in parallel, then the partial summaries are reduced into one,
+    - sections smaller than `pack_below_tokens` are packed together and summarized
+      in a single request,
+    - every other section is summarized on its own.
+
+    Parameters
+    ----------
+    sections : Dict[str, str]
+        The section names and their texts, in document order.
+    backend : LLMBase
+        The backend to use for the AI operations.
+    max_concurrency : int
+        The maximum number of calls in flight at the same time.
+    on_result : Optional[Callable[[str, str], None]]
+        Called with the section name and its summary as soon as a summary is ready.
+    max_tokens : int
+        The maximum number of tokens of a completion, capped by the model's limit.
+    chunk_overlap_tokens : int
+        The number of tokens consecutive chunks of a section share.
+    pack_below_tokens : int
+        Sections under this many tokens are packed with their neighbours.
+
+    Returns
+    -------
+    Dict[str, str]
+        The summaries keyed by section name, in document order.
+    """
+    model = getattr(backend, "model", None)
+    context_length = getattr(model, "context_length", 4096)
+    max_tokens = min(max_tokens, getattr(model, "max_output_tokens", max_tokens))
+
+    summarize_template = _read_prompt("summarize_section_prompt.txt")
+    reduce_template = _read_prompt("reduce_summaries_prompt.txt")
+    pack_template = _read_prompt("summarize_multiple_sections_prompt.txt")
+
+    # What is left of the context for the text once the completion, the system message
+    # and the longest template are accounted for, with some slack for the estimate.
+    # Without key=len max() picks the alphabetically last template, not the longest
+    budget = (
+        context_length
+        - max_tokens
+        - estimate_tokens(SYSTEM_MESSAGE)
+        - estimate_tokens(
+            max(summarize_template, reduce_template, pack_template, key=len)
+        )
+    )
+    budget = max(256, int(budget * 0.9))
+
+    tiny = dict()
+    chunked = dict()
+    single = dict()
+    for section, text in sections.items():
+        tokens = estimate_tokens(text)
+        if tokens > budget:
+            chunked[section] = chunk_text(text, budget, chunk_overlap_tokens)
+        elif tokens < pack_below_tokens:
+            tiny[section] = text
+        else:
+            single[section] = text
+
+    summaries = dict()
+
+    def done(section: str, summary: str):
+        summaries[section] = summary
+        if on_result:
+            on_result(section, summary)
+
+    def reduce(partials: List[str]) -> str:
+        # Reduce in rounds until the partial summaries fit in a single request
+        while len(partials) > 1:
+            groups = pack_texts(
+                {str(i): partial for i, partial in enumerate(partials)},
+                budget,
+                max_items=len(partials),
+            )
+            if len(groups) == len(partials):
+                # No two partial summaries fit in one request, keep them as they are
+                break
+
+            partials = [
+                _complete(
+                    backend,
+                    reduce_template + "\n\n".join(partials[int(i)] for i in group),
+                    max_tokens,
+                    is_verbose,
+                )
+                if len(group) > 1
+                else partials[int(group[0])]
+                for group in groups
+            ]
+        return "\n\n".join(partials)
+
+    def summarize_pack(names: List[str]) -> Dict[str, str]:
+        if len(names) == 1:
+            name = names[0]
+            return {
+                name: _complete(
+                    backend, summarize_template + tiny[name], max_tokens, is_verbose
+                )
+            }
+
+        prompt = pack_template + "\n\n".join(
+            f"### {name}\n{tiny[name]}" for name in names
+        )
+        res = _complete(backend, prompt, max_tokens, is_verbose)
+        try:
+            packed = json.loads(res)
+        except json.decoder.JSONDecodeError:
+            packed = None
+
+        if not isinstance(packed, dict) or not all(name in packed for name in names):
+            # The model did not follow the format, fall back to one request each
+            backend.discard(
+                prompt,
+                completion_tokens(backend, prompt, max_tokens),
+                0.8,
+                SYSTEM_MESSAGE,
+            )
+            return {
+                name: _complete(
+                    backend, summarize_template + tiny[name], max_tokens, is_verbose
+                )
+                for name in names
+            }
+        return {name: str(packed[name]) for name in names}
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = dict()
+
+        for section, text in single.items():
+            future = executor.submit(
+                _complete, backend, summarize_template + text, max_tokens, is_verbose
+            )
+            futures[future] = ("single", section)
+
+        for names in pack_texts(tiny, budget):
+            futures[executor.submit(summarize_pack, names)] = ("pack", names)
+
+        chunk_futures = {
+            section: [
+                executor.submit(
+                    _complete,
+                    backend,
+                    summarize_template + chunk,
+                    max_tokens,
+                    is_verbose,
+                )
+                for chunk in chunks
+            ]
+            for section, chunks in chunked.items()
+        }
+
+        # A failed request does not stop the others, so every summary that can be
+        # generated reaches `on_result` before the first error is raised
+        errors = []
+
+        for future in as_completed(futures):
+            kind, key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            if kind == "single":
+                done(key, result)
+            else:
+                for name, summary in result.items():
+                    done(name, summary)
+
+        # The reduce steps are run from this thread, the map steps have been queued
+        # first so they keep the pool busy meanwhile
+        for section, partials in chunk_futures.items():
+            try:
+                done(section, reduce([future.result() for future in partials]))
+            except Exception as e:
+                errors.append(e)
+
+    if errors:
+        raise errors[0]
+
+    # The summaries complete out of order, put them back in document order
+    return {section: summaries[section] for section in sections}
@@ -0,0 +1,240 @@
+"""
+Summarizes many PDFs with one shared backend, rate limiter and extraction pool.
+
+Usage: python -m aipdf.batch <directory | glob | manifest> ... --output <directory>
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+from rich import print
+
+from .cli import (
+    add_backend_arguments,
+    add_metrics_arguments,
+    backend_from_args,
+    enable_metrics,
+    extraction_cache_from_args,
+    write_metrics,
+)
+from .llm_backends.llmBackendBase import LLMBase
+from .metrics import metrics
+from .pdf_tools.cache import ExtractionCache
+from .pdf_tools.document import ingest_pdf
+from .pipeline import summarize_document
+
+
+def collect_pdfs(inputs: List[str]) -> List[str]:
+    """
+    Expands the inputs into a list of PDF paths.
+
+    Every input is either a directory (searched recursively for PDFs), a manifest
+    (a .txt file with one path per line, or a .json list of paths) or a glob.
+
+    Parameters
+    ----------
+    inputs : List[str]
+        The directories, manifests and globs.
+
+    Returns
+    -------
+    List[str]
+        The PDF paths, without duplicates, in the order they were found.
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(
+                sorted(glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True))
+            )
+        elif item.endswith(".json") and os.path.isfile(item):
+            with open(item, "r") as f:
+                paths.extend(json.load(f))
+        elif item.endswith(".txt") and os.path.isfile(item):
+            with open(item, "r") as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        else:
+            paths.extend(sorted(glob.glob(item, recursive=True)))
+
+    return list(dict.fromkeys(paths))
+
+
+def result_path(output_dir: str, pdf_path: str) -> str:
+    """
+    Returns where the result of a PDF is written, the name carries a hash of the path
+    so PDFs with the same name in different directories do not collide.
+    """
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    digest = hashlib.sha1(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_dir, f"{stem}-{digest}.json")
+
+
+def write_result(path: str, result: dict):
+    """
+    Writes a result atomically, so an interrupted run never leaves a partial result
+    that would be skipped on resume.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _ingest(pdf_path: str, cache: Optional[ExtractionCache]):
+    return ingest_pdf(pdf_path, cache=cache)
+
+
+def run_batch(
+    pdf_paths: List[str],
+    output_dir: str,
+    backend: LLMBase,
+    extract_workers: int = 2,
+    max_concurrency: int = 4,
+    is_verbose: bool = False,
+    cache: Optional[ExtractionCache] = None,
+) -> Iterator[str]:
+    """
+    Summarizes the PDFs, writing one JSON result per document.
+
+    The extraction of the next documents runs in a process pool while the LLM calls
+    of the current one are in flight, every document goes through the same backend so
+    they share its connections, cache and rate limiter. Documents whose result already
+    exists are skipped, so an interrupted batch resumes where it stopped. A document
+    that fails, or in which no section is found, gets no result so the next run
+    retries it.
+
+    Parameters
+    ----------
+    pdf_paths : List[str]
+        The PDFs to summarize.
+    output_dir : str
+        The directory the results are written to.
+    backend : LLMBase
+        The backend shared by all documents.
+    extract_workers : int
+        The number of processes extracting documents ahead of the summarization.
+    max_concurrency : int
+        The maximum number of summaries generated at the same time.
+    cache : Optional[ExtractionCache]
+        The cache of ingested documents, shared by the extraction workers.
+
+    Yields
+    ------
+    str
+        The paths of the results written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    todo = [
+        path for path in pdf_paths if not os.path.exists(result_path(output_dir, path))
+    ]
+    if len(todo) < len(pdf_paths):
+        print(f"Skipping {len(pdf_paths) - len(todo)} already summarized documents")
+
+    with ProcessPoolExecutor(max_workers=extract_workers) as executor:
+        remaining = iter(todo)
+        extracting = deque()
+
+        def prefetch():
+            # Keep every extraction worker busy, but do not hold more extracted
+            # documents than that in memory
+            while len(extracting) < extract_workers:
+                path = next(remaining, None)
+                if path is None:
+                    return
+                extracting.append((path, executor.submit(_ingest, path, cache)))
+
+        prefetch()
+        while extracting:
+            path, future = extracting.popleft()
+            try:
+                document = future.result()
+            except Exception as e:
+                print(f"[red]Could not read {path}: {e}[/red]")
+                prefetch()
+                continue
+
+            # The next documents are extracted while this one is being summarized
+            prefetch()
+            # The extraction spans are recorded in the workers, count the pages here
+            metrics.incr("documents")
+            metrics.incr("pages", document.page_count)
+
+            try:
+                sections, summaries = summarize_document(
+                    document, backend, max_concurrency, is_verbose, cache=cache
+                )
+            except Exception as e:
+                print(f"[red]Could not summarize {path}: {e}[/red]")
+                continue
+            if not sections:
+                # Usually the section filter failed, do not skip the document forever
+                print(f"[red]Found no sections in {path}, it will be retried[/red]")
+                continue
+
+            output = result_path(output_dir, path)
+            write_result(
+                output,
+                {
+                    "pdf": path,
+                    "pages": document.page_count,
+                    "tokens_saved_by_cleaning": (
+                        document.cleaning.tokens_saved if document.cleaning else 0
+                    ),
+                    "sections": list(sections),
+                    "summaries": summaries,
+                },
+            )
+            yield output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize many PDF files.")
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Directories, globs or manifests (.txt or .json) of PDF files.",
+    )
+    parser.add_argument(
+        "--output", "-o", help="Directory to write the results to.", required=True
+    )
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Verbose mode.", default=False
+    )
+    parser.add_argument(
+        "--extract_workers",
+        type=int,
+        help="Number of processes extracting documents ahead of summarization.",
+        default=2,
+    )
+    add_backend_arguments(parser)
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    enable_metrics(args)
+    backend = backend_from_args(parser, args)
+
+    pdf_paths = collect_pdfs(args.inputs)
+    print(f"Found {len(pdf_paths)} documents")
+
+    for output in run_batch(
+        pdf_paths,
+        args.output,
+        backend,
+        extract_workers=args.extract_workers,
+        max_concurrency=args.concurrency,
+        is_verbose=args.verbose,
+        cache=extraction_cache_from_args(args),
+    ):
+        print(f"Wrote {output}")
+
+    write_metrics(args)
+
+
+if __name__ == "__main__":
+    main()
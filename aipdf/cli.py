@@ -0,0 +1,193 @@
+"""
+The command line options shared by `main.py`, `aipdf.batch` and `aipdf.service`.
+
+Only the modules needed to parse the arguments are imported here, the pipeline is
+imported when the backend is created so `--help` starts fast.
+"""
+import argparse
+from typing import Optional
+
+from .llm_backends import openrouter_models
+from .llm_backends.cachedBackend import DEFAULT_CACHE_PATH
+from .llm_backends.llmBackendBase import LLMBase
+from .metrics import metrics
+from .pdf_tools.cache import DEFAULT_EXTRACTION_CACHE_DIR, ExtractionCache
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the options of the models, their limits and the caches to a parser, they are
+    read back by `backend_from_args` and `extraction_cache_from_args`.
+    """
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        help="Maximum number of summaries generated at the same time, by default "
+        "what the models serve at the same time according to the model registry.",
+        default=None,
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        help="Requests per minute limit of the account, on top of the limits of "
+        "every model.",
+        default=None,
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        help="Tokens per minute limit of the account, on top of the limits of every "
+        "model.",
+        default=None,
+    )
+    parser.add_argument(
+        "--model_config",
+        help='JSON file overriding the capabilities of the models, eg. {"Zephyr7b": '
+        '{"requests_per_minute": 200, "max_concurrency": 16}}.',
+        default=None,
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=openrouter_models.__all__,
+        help="The models to use, with more than one model every call goes to the "
+        "fastest healthy one.",
+        default=["Mixtral8x7bInstructBeta"],
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="With more than one model, send a duplicate of the calls slower than "
+        "usual to another model and use the first answer.",
+        default=False,
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="With more than one model, summarize with the fastest model first and "
+        "send only the summaries failing the local checks to the next models.",
+        default=False,
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Number of seconds an LLM call may take before it is retried.",
+        default=180.0,
+    )
+    parser.add_argument(
+        "--cache_path",
+        help="Where the LLM responses are cached.",
+        default=DEFAULT_CACHE_PATH,
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Do not cache the LLM responses.",
+        default=False,
+    )
+    parser.add_argument(
+        "--extraction_cache_dir",
+        help="Where the extracted documents are cached.",
+        default=DEFAULT_EXTRACTION_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no_extraction_cache",
+        action="store_true",
+        help="Always extract the documents, without caching them.",
+        default=False,
+    )
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the options writing the stage timings and counters to a parser, they are read
+    back by `enable_metrics` and `write_metrics`.
+    """
+    parser.add_argument(
+        "--metrics_json",
+        help="Write a JSON report of the stage timings and counters to this file.",
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics_prom",
+        help="Write the stage timings and counters in Prometheus text format to "
+        "this file.",
+        default=None,
+    )
+
+
+def backend_from_args(
+    parser: argparse.ArgumentParser, args: argparse.Namespace, workers: int = 1
+) -> LLMBase:
+    """
+    Creates the backend of the options added by `add_backend_arguments`.
+
+    Without --concurrency every model is sized with its own max_concurrency and
+    `args.concurrency` is set to what all the models serve at the same time, shared by
+    the workers.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        The parser the arguments come from, it reports the invalid options.
+    args : argparse.Namespace
+        The parsed arguments.
+    workers : int
+        The number of workers sharing the backend, each of them runs up to
+        --concurrency calls at the same time.
+
+    Returns
+    -------
+    LLMBase
+        The backend.
+    """
+    if args.hedge and args.cascade:
+        parser.error("--hedge cannot be used with --cascade")
+
+    from .llm_backends.modelRegistry import registry
+    from .pipeline import create_backend, default_concurrency
+
+    if args.model_config:
+        registry.load(args.model_config)
+
+    backend = create_backend(
+        concurrency=args.concurrency * workers if args.concurrency else None,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        cache_path=None if args.no_cache else args.cache_path,
+        models=args.models,
+        hedge=args.hedge,
+        cascade=args.cascade,
+        timeout=args.timeout,
+    )
+    if args.concurrency is None:
+        args.concurrency = max(1, default_concurrency(args.models) // workers)
+    return backend
+
+
+def extraction_cache_from_args(args: argparse.Namespace) -> Optional[ExtractionCache]:
+    """
+    Returns the cache of ingested documents, None with --no_extraction_cache.
+    """
+    if args.no_extraction_cache:
+        return None
+    return ExtractionCache(args.extraction_cache_dir)
+
+
+def enable_metrics(args: argparse.Namespace):
+    """
+    Records the stage timings and counters if a metrics file is requested.
+    """
+    if args.metrics_json or args.metrics_prom:
+        metrics.enable()
+
+
+def write_metrics(args: argparse.Namespace):
+    """
+    Writes the metrics files requested by the options of `add_metrics_arguments`.
+    """
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
@@ -0,0 +1,344 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from .ai_helpers import summarize_sections_within_budget
+from .llm_backends.llmBackendBase import LLMBase
+from .metrics import metrics
+from .pdf_tools.document import (
+    Document,
+    PageRanges,
+    PageRecord,
+    PdfSource,
+    TextRun,
+    extract_page,
+    select_pages,
+)
+
+
+def _resolve(value):
+    # The repr of an indirect reference holds the id of the reader, hash its target
+    if isinstance(value, list):
+        return [_resolve(item) for item in value]
+    return value.get_object() if hasattr(value, "get_object") else value
+
+
+def _hash_font(digest, font):
+    """
+    Hashes what the text of a font maps to, ie. its name, its encoding and its
+    ToUnicode map, and the same for the descendants of a composite font.
+    """
+    font = font.get_object()
+    digest.update(f"{font.get('/BaseFont')}/{font.get('/Subtype')};".encode())
+
+    encoding = _resolve(font.get("/Encoding"))
+    if hasattr(encoding, "items"):
+        # A differences array remaps the codes of a base encoding
+        base = _resolve(encoding.get("/BaseEncoding"))
+        differences = _resolve(encoding.get("/Differences"))
+        digest.update(f"{base}{differences};".encode())
+    elif encoding is not None:
+        digest.update(f"{encoding};".encode())
+
+    to_unicode = font.get("/ToUnicode")
+    if to_unicode is not None:
+        digest.update(to_unicode.get_object().get_data())
+
+    for descendant in _resolve(font.get("/DescendantFonts")) or []:
+        _hash_font(digest, descendant)
+
+
+def _hash_resources(digest, resources, seen: set):
+    """
+    Hashes the fonts of a resource dictionary and the form XObjects it draws, with
+    their own resources, recursively. The images are left out, no text is extracted
+    from them.
+    """
+    if resources is None:
+        return
+    idnum = getattr(resources, "idnum", None)
+    if idnum is not None:
+        # Resource dictionaries are shared and forms may draw each other
+        if idnum in seen:
+            return
+        seen.add(idnum)
+    resources = resources.get_object()
+
+    fonts = resources.get("/Font")
+    if fonts:
+        for name, font in sorted(fonts.get_object().items()):
+            digest.update(f"{name}=".encode())
+            _hash_font(digest, font)
+
+    xobjects = resources.get("/XObject")
+    if xobjects:
+        for name, xobject in sorted(xobjects.get_object().items()):
+            form = xobject.get_object()
+            if form.get("/Subtype") != "/Form":
+                continue
+            digest.update(f"{name}=".encode())
+            digest.update(form.get_data())
+            _hash_resources(digest, form.get("/Resources"), seen)
+
+
+def page_fingerprint(page) -> str:
+    """
+    Returns a fingerprint of a page, a hash of its content stream, of the fonts it
+    uses with their encodings and ToUnicode maps and of the form XObjects it draws,
+    ie. of everything the text extraction depends on.
+
+    Parameters
+    ----------
+    page : PyPDF2.PageObject
+        The page to fingerprint.
+
+    Returns
+    -------
+    str
+        The fingerprint.
+    """
+    digest = hashlib.sha256()
+
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+
+    _hash_resources(digest, page.get("/Resources"), set())
+
+    return digest.hexdigest()
+
+
+def section_fingerprint(section: str, text: str) -> str:
+    """
+    Returns a fingerprint of the name and text of a section.
+    """
+    return hashlib.sha256(f"{section}\0{text}".encode("utf-8")).hexdigest()
+
+
+class IncrementalState:
+    def __init__(self, path: str):
+        """
+        What a previous run of a document left behind: the extracted pages keyed by
+        page fingerprint and the summaries keyed by section fingerprint.
+
+        Only the entries of the latest run are kept, so the state never grows past
+        the size of one document.
+
+        Parameters
+        ----------
+        path : str
+            The path of the JSON file the state is stored in, it is created on save.
+        """
+        self.path = path
+        self.pages: Dict[str, dict] = dict()
+        self.summaries: Dict[str, str] = dict()
+
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                state = json.load(f)
+            self.pages = state.get("pages", dict())
+            self.summaries = state.get("summaries", dict())
+
+        self._used_pages: Dict[str, dict] = dict()
+        self._used_summaries: Dict[str, str] = dict()
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+
+    def get_page(self, fingerprint: str, number: int) -> Optional[PageRecord]:
+        stored = self.pages.get(fingerprint)
+        if stored is None:
+            return None
+
+        self._used_pages[fingerprint] = stored
+        return PageRecord(
+            number, stored["text"], [TextRun(*run) for run in stored["runs"]]
+        )
+
+    def put_page(self, fingerprint: str, page: PageRecord):
+        self._used_pages[fingerprint] = {
+            "text": page.text,
+            "runs": [list(run) for run in page.runs],
+        }
+
+    def get_summary(self, fingerprint: str) -> Optional[str]:
+        summary = self.summaries.get(fingerprint)
+        if summary is not None:
+            self._used_summaries[fingerprint] = summary
+        return summary
+
+    def put_summary(self, fingerprint: str, summary: str):
+        self._used_summaries[fingerprint] = summary
+
+    def save(self):
+        """
+        Writes the entries used by this run, atomically.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {
+                        "pages": dict(self._used_pages),
+                        "summaries": dict(self._used_summaries),
+                    },
+                    f,
+                )
+            os.replace(tmp_path, self.path)
+            self._saved_at = time.monotonic()
+
+    def checkpoint(self, min_interval: float = 5.0):
+        """
+        Saves the state if it has not been saved for `min_interval` seconds, so an
+        interrupted run loses at most that much work and continues where it stopped.
+        """
+        if time.monotonic() - self._saved_at >= min_interval:
+            self.save()
+
+
+def ingest_pdf_incremental(
+    pdf_file, state: IncrementalState, pages: Optional[PageRanges] = None
+) -> Document:
+    """
+    Builds a `Document` like `ingest_pdf`, but only extracts the pages whose
+    fingerprint is not in the state of the previous run.
+
+    Parameters
+    ----------
+    pdf_file : Union[str, BufferedReader]
+        The path of the PDF file or the PDF file itself.
+    state : IncrementalState
+        The state of the previous run, the extracted pages are added to it.
+    pages : Optional[PageRanges]
+        The page ranges to ingest, see `page_ranges`, None for every page.
+
+    Returns
+    -------
+    Document
+        The ingested document.
+    """
+    records = []
+    with metrics.span("extraction"), PdfSource(pdf_file) as source:
+        for number in select_pages(pages, source.page_count):
+            page = source.reader.pages[number]
+            fingerprint = page_fingerprint(page)
+
+            record = state.get_page(fingerprint, number)
+            if record is None:
+                record = extract_page(page, number)
+                state.put_page(fingerprint, record)
+                metrics.incr("pages_extracted")
+            else:
+                metrics.incr("pages_reused")
+
+            records.append(record)
+
+    metrics.incr("pages", len(records))
+    return Document(records)
+
+
+def stored_summaries(
+    sections: Dict[str, str], state: IncrementalState
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Looks up the stored summaries of the sections that did not change.
+
+    They are all marked as used up front, so a checkpoint or a failure before the
+    run reaches them does not drop them from the state.
+
+    Parameters
+    ----------
+    sections : Dict[str, str]
+        The section names and their texts, in document order.
+    state : IncrementalState
+        The state of the previous run.
+
+    Returns
+    -------
+    Tuple[Dict[str, str], Dict[str, str]]
+        The fingerprints of every section, and the stored summaries of the unchanged
+        ones, keyed by section name.
+    """
+    fingerprints = {
+        section: section_fingerprint(section, text) for section, text in sections.items()
+    }
+    summaries = dict()
+    for section in sections:
+        summary = state.get_summary(fingerprints[section])
+        if summary is not None:
+            summaries[section] = summary
+    return fingerprints, summaries
+
+
+def summarize_changed_sections(
+    sections: Dict[str, str],
+    backend: LLMBase,
+    state: IncrementalState,
+    max_concurrency: int = 4,
+    is_verbose: bool = False,
+    on_result: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, str]:
+    """
+    Summarizes only the sections whose name or text changed since the previous run,
+    the stored summaries are reused for the others.
+
+    The state is checkpointed as the summaries come in and saved when the function
+    returns or fails, so a failed run is resumed by running it again.
+
+    Parameters
+    ----------
+    sections : Dict[str, str]
+        The section names and their texts, in document order.
+    backend : LLMBase
+        The backend to use for the AI operations.
+    state : IncrementalState
+        The state of the previous run, the new summaries are added to it.
+    max_concurrency : int
+        The maximum number of calls in flight at the same time.
+    on_result : Optional[Callable[[str, str], None]]
+        Called with the section name and its summary as soon as a summary is ready.
+
+    Returns
+    -------
+    Dict[str, str]
+        The summaries keyed by section name, in document order.
+    """
+    fingerprints, summaries = stored_summaries(sections, state)
+
+    changed = dict()
+    for section, text in sections.items():
+        if section not in summaries:
+            changed[section] = text
+        else:
+            metrics.incr("sections_reused")
+            if on_result:
+                on_result(section, summaries[section])
+
+    def record(section: str, summary: str):
+        state.put_summary(fingerprints[section], summary)
+        state.checkpoint()
+        if on_result:
+            on_result(section, summary)
+
+    if changed:
+        metrics.incr("sections_summarized", len(changed))
+        try:
+            summaries.update(
+                summarize_sections_within_budget(
+                    changed,
+                    backend,
+                    max_concurrency=max_concurrency,
+                    is_verbose=is_verbose,
+                    on_result=record,
+                )
+            )
+        finally:
+            state.save()
+
+    return {section: summaries[section] for section in sections}
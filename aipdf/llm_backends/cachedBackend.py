@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from .llmBackendBase import LLMBase
+from ..metrics import metrics
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "aipdf", "llm_cache.sqlite3"
+)
+
+
+class CachedBackend(LLMBase):
+    def __init__(
+        self,
+        backend: LLMBase,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: Optional[float] = 30 * 24 * 60 * 60,
+        max_size: Optional[int] = 256 * 1024 * 1024,
+    ):
+        """
+        Wraps any backend with a persistent, content addressed response cache.
+
+        The responses are stored in a SQLite database keyed by a hash of the model
+        name, the system message, the prompt, the temperature and max_tokens, so
+        re-running the pipeline only pays for the prompts that changed. A backend
+        answering with several models, eg. a `RouterBackend`, names itself with its
+        `cache_name` attribute instead of the model name.
+
+        Parameters
+        ----------
+        backend : LLMBase
+            The backend to wrap.
+        path : str
+            The path of the SQLite database.
+        ttl : Optional[float]
+            The number of seconds a response is kept, None to keep them forever.
+        max_size : Optional[int]
+            The maximum total size of the cached responses in bytes, the least
+            recently used responses are evicted first. None for no limit.
+        """
+        self.backend = backend
+        self.model = getattr(backend, "model", None)
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The backend may be called from many threads, so the connection is shared
+        # and guarded by a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._connection.commit()
+        self.evict()
+
+    def cache_key(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        override_system_message: Optional[str],
+    ) -> str:
+        """
+        Returns the cache key of a completion request.
+        """
+        model_name = getattr(self.backend, "cache_name", None) or (
+            self.model.name if self.model else type(self.backend).__name__
+        )
+        payload = json.dumps(
+            [model_name, override_system_message, prompt, temperature, max_tokens]
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Returns the cached response of the request, or forwards it to the wrapped
+        backend and caches the response.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt to send to the backend.
+        max_tokens : int
+            The maximum number of tokens to generate.
+        temperature : float
+            The temperature to use for the generation.
+        override_system_message : Optional[str]
+            The system message to use for the generation.
+        **kwargs
+            Additional arguments to pass to the backend.
+        """
+        key = self.cache_key(prompt, max_tokens, temperature, override_system_message)
+
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        res = self.backend.completion(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            override_system_message=override_system_message,
+            **kwargs
+        )
+
+        if isinstance(res, str):
+            self.put(key, res)
+
+        return res
+
+    def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Yields the cached response of the request at once, or streams it from the
+        wrapped backend and caches the response once the stream is complete.
+
+        A stream that raised, was closed by the caller before its end or produced no
+        text is not cached.
+        """
+        key = self.cache_key(prompt, max_tokens, temperature, override_system_message)
+
+        cached = self.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        deltas = []
+        for delta in self.backend.stream_completion(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            override_system_message=override_system_message,
+            **kwargs
+        ):
+            deltas.append(delta)
+            yield delta
+
+        res = "".join(deltas)
+        if res:
+            self.put(key, res)
+
+    def discard(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+    ):
+        """
+        Drops the cached response of a request the caller could not use, so the next
+        identical request asks the wrapped backend again instead of getting the same
+        unusable response forever.
+        """
+        key = self.cache_key(prompt, max_tokens, temperature, override_system_message)
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached response for the key, None if there is no live entry.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or (self.ttl is not None and row[1] < now - self.ttl):
+                self.misses += 1
+                metrics.incr("cache_misses")
+                return None
+
+            self.hits += 1
+            metrics.incr("cache_hits")
+            self._connection.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """
+        Stores a response and evicts old entries if the cache grew too large.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now),
+            )
+            self._connection.commit()
+        self.evict()
+
+    def evict(self):
+        """
+        Drops the expired responses, then the least recently used ones until the
+        cache fits in `max_size`.
+        """
+        with self._lock:
+            if self.ttl is not None:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)
+                )
+
+            if self.max_size is not None:
+                (total,) = self._connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+
+                if total > self.max_size:
+                    rows = self._connection.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed"
+                    ).fetchall()
+                    for key, size in rows:
+                        if total <= self.max_size:
+                            break
+                        self._connection.execute(
+                            "DELETE FROM responses WHERE key = ?", (key,)
+                        )
+                        total -= size
+
+            self._connection.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counters and the number of cached responses.
+        """
+        with self._lock:
+            (entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
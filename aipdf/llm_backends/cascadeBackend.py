@@ -0,0 +1,148 @@
+import threading
+from typing import Callable, Dict, Optional, Sequence
+
+from .llmBackendBase import LLMBase
+from ..metrics import metrics
+
+
+class CascadeBackend(LLMBase):
+    def __init__(
+        self,
+        backends: Sequence[LLMBase],
+        accept: Callable[[str, str, int], Optional[str]],
+        names: Optional[Sequence[str]] = None,
+    ):
+        """
+        Sends every call to the cheapest backend first and escalates it to the next
+        ones only when its answer fails the acceptance checks.
+
+        A tier that raises is escalated too, its error is counted as the "error"
+        reason and in the `errors` of its `tier_stats`, only the errors of the last
+        tier are raised. The number of
+        calls accepted and rejected by every tier is recorded in the
+        `cascade.<name>.accepted` and `cascade.<name>.rejected` counters, and the
+        reasons of the rejections in the `cascade.rejected.<reason>` counters.
+
+        Any tier may answer, so the answers are cached under the `cache_name` of the
+        cascade, ie. its tiers in order, see `CachedBackend`.
+
+        Note: The answer has to be checked before it is used, so streamed calls are
+        yielded at once.
+
+        Parameters
+        ----------
+        backends : Sequence[LLMBase]
+            The tiers, from the cheapest and fastest to the most capable.
+        accept : Callable[[str, str, int], Optional[str]]
+            Called with the prompt, the answer and the max_tokens of a call, returns
+            None to accept the answer or a short reason to reject it, eg.
+            "truncated".
+        names : Optional[Sequence[str]]
+            The names of the tiers in the metrics, the model names by default.
+        """
+        if not backends:
+            raise ValueError("CascadeBackend needs at least one backend")
+
+        self.backends = list(backends)
+        self.accept = accept
+        self.names = list(names) if names else [
+            getattr(getattr(backend, "model", None), "name", None) or f"tier-{i}"
+            for i, backend in enumerate(self.backends)
+        ]
+
+        # The prompts are sized for the smallest model of the tiers
+        models = [
+            backend.model
+            for backend in self.backends
+            if getattr(backend, "model", None) is not None
+        ]
+        self.model = (
+            min(models, key=lambda model: model.context_length) if models else None
+        )
+        self.cache_name = "cascade:" + ",".join(self.names)
+
+        self._lock = threading.Lock()
+        self._accepted = [0] * len(self.backends)
+        self._rejected = [0] * len(self.backends)
+        self._errors = [0] * len(self.backends)
+
+    def _count(self, tier: int, accepted: bool, error: bool = False):
+        with self._lock:
+            if error:
+                self._errors[tier] += 1
+            if accepted:
+                self._accepted[tier] += 1
+            else:
+                self._rejected[tier] += 1
+        outcome = "accepted" if accepted else "rejected"
+        metrics.incr(f"cascade.{self.names[tier]}.{outcome}")
+
+    def completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Sends the call to the tiers in order until one of them gives an acceptable
+        answer. The answer of the last tier is always accepted.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt to send to the backend.
+        max_tokens : int
+            The maximum number of tokens to generate.
+        temperature : float
+            The temperature to use for the generation.
+        override_system_message : Optional[str]
+            The system message to use for the generation.
+        **kwargs
+            Additional arguments to pass to the backend.
+        """
+        last = len(self.backends) - 1
+        for tier, backend in enumerate(self.backends):
+            try:
+                res = backend.completion(
+                    prompt=prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    override_system_message=override_system_message,
+                    **kwargs
+                )
+            except Exception:
+                if tier == last:
+                    raise
+                self._count(tier, False, error=True)
+                metrics.incr("cascade.rejected.error")
+                continue
+
+            reason = None if tier == last else self.accept(prompt, res, max_tokens)
+            if reason is None:
+                self._count(tier, True)
+                return res
+            self._count(tier, False)
+            metrics.incr(f"cascade.rejected.{reason}")
+
+    def tier_stats(self) -> Dict[str, dict]:
+        """
+        Returns the number of calls every tier answered, the number of them that
+        failed with an error and its hit rate, ie. the share of the calls it got that
+        it answered acceptably.
+        """
+        with self._lock:
+            return {
+                name: {
+                    "accepted": accepted,
+                    "rejected": rejected,
+                    "errors": errors,
+                    "hit_rate": accepted / (accepted + rejected)
+                    if accepted + rejected
+                    else None,
+                }
+                for name, accepted, rejected, errors in zip(
+                    self.names, self._accepted, self._rejected, self._errors
+                )
+            }
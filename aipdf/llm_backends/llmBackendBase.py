@@ -1,5 +1,40 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Iterator, Optional
+
+
+class LLMBackendError(Exception):
+    """
+    Base class for the errors raised by the LLM backends.
+    """
+
+
+class TransientBackendError(LLMBackendError):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        """
+        Raised when a request failed in a way that retrying it later may fix, eg. a
+        server error, a timeout, a dropped connection or a malformed response.
+
+        Parameters
+        ----------
+        message : str
+            The error message.
+        retry_after : Optional[float]
+            The number of seconds the provider asked us to wait, if it told us.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitError(TransientBackendError):
+    """
+    Raised when the provider rejects a request due to rate limits, ie. HTTP 429.
+    """
+
+
+class CircuitOpenError(LLMBackendError):
+    """
+    Raised without calling the provider while it is considered down.
+    """
 
 
 class LLMBase(ABC):
@@ -31,3 +66,67 @@ class LLMBase(ABC):
             Additional arguments to pass to the backend.
         """
         pass
+
+    def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Generates text from a prompt and yields it incrementally as it is generated.
+
+        Backends that can stream should override this, by default the whole completion
+        is yielded at once.
+
+        Parameters:
+        -----------
+        prompt : str
+            The prompt to send to the backend.
+        max_tokens : int
+            The maximum number of tokens to generate.
+        temperature : float
+            The temperature to use for the generation.
+        override_system_message : Optional[str]
+            The system message to use for the generation.
+        **kwargs
+            Additional arguments to pass to the backend.
+
+        Yields:
+        -------
+        str
+            The text deltas of the completion.
+        """
+        yield self.completion(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            override_system_message=override_system_message,
+            **kwargs
+        )
+
+    def discard(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+    ):
+        """
+        Tells the backend that the response of a request could not be used, eg. it
+        was not the JSON the prompt asked for, so a backend that caches its responses
+        drops it instead of serving it again. Does nothing by default.
+
+        Parameters:
+        -----------
+        prompt : str
+            The prompt of the request.
+        max_tokens : int
+            The maximum number of tokens of the request.
+        temperature : float
+            The temperature of the request.
+        override_system_message : Optional[str]
+            The system message of the request.
+        """
@@ -0,0 +1,169 @@
+import json
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from .llmBackendBase import LLMBase, RateLimitError, TransientBackendError
+from .local_models import LocalStandIn
+from .modelBase import ModelBase
+from ..metrics import metrics
+from ..tokens import estimate_tokens
+
+
+class LocalBackend(LLMBase):
+    def __init__(
+        self,
+        model: Optional[ModelBase] = None,
+        responses: Optional[Dict[str, str]] = None,
+        template: Optional[Callable[[str], str]] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: Optional[float] = None,
+        seed: int = 0,
+    ):
+        """
+        A deterministic, offline stand-in for a remote backend, to benchmark and load
+        test the pipeline without network access or API keys.
+
+        Without canned responses it answers the prompts of `ai_helpers` in the format
+        they expect: the section filter gets the candidate list back as JSON, packed
+        sections get a JSON object and everything else gets the last 64 words of the
+        prompt, ie. the end of the section text that follows the instructions, as its
+        "summary".
+
+        Parameters
+        ----------
+        model : Optional[ModelBase]
+            The model the backend pretends to be, `LocalStandIn` by default.
+        responses : Optional[Dict[str, str]]
+            Canned responses, the first one whose key is found in the prompt is
+            returned.
+        template : Optional[Callable[[str], str]]
+            Builds the response from the prompt, used when no canned response matches.
+        latency : float
+            The number of seconds a completion takes.
+        jitter : float
+            A random number of seconds, up to this value, added to the latency.
+        error_rate : float
+            The probability that a completion fails with a `TransientBackendError`,
+            like a server error.
+        rate_limit_rate : float
+            The probability that a completion fails with a `RateLimitError`.
+        retry_after : Optional[float]
+            The Retry-After the injected rate limit errors carry.
+        seed : int
+            The seed of the random generator, runs with the same seed and call order
+            see the same failures.
+        """
+        self.model = model if model else LocalStandIn()
+        self.responses = responses or dict()
+        self.template = template if template else self.default_template
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_template(prompt: str) -> str:
+        """
+        Answers the prompts of `ai_helpers` in the format they expect, the last 64
+        words of the prompt for the summaries.
+        """
+        if "Real list:" in prompt:
+            candidates = prompt.split("Real list:", 1)[1].splitlines()
+            return json.dumps([line for line in candidates if line.strip()])
+
+        if "JSON object" in prompt:
+            names = re.findall(r"^### (.*)$", prompt, flags=re.MULTILINE)
+            return json.dumps({name: f"Summary of {name}" for name in names})
+
+        words = prompt.split()
+        return " ".join(words[-64:])
+
+    def _simulate(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            roll = self._random.random()
+
+        time.sleep(delay)
+
+        if roll < self.rate_limit_rate:
+            raise RateLimitError("Injected rate limit", self.retry_after)
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise TransientBackendError("Injected server error")
+
+    def _respond(self, prompt: str) -> str:
+        for key, response in self.responses.items():
+            if key in prompt:
+                return response
+        return self.template(prompt)
+
+    def completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Returns the canned or templated response after the simulated latency.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt to send to the backend.
+        max_tokens : int
+            The maximum number of tokens to generate, the response is cut to it.
+        temperature : float
+            Ignored.
+        override_system_message : Optional[str]
+            Ignored.
+        **kwargs
+            Ignored.
+        """
+        with metrics.span("backend.completion"):
+            self._simulate()
+        metrics.incr("llm_calls")
+
+        res = self._respond(prompt)[: max_tokens * 4]
+        metrics.incr("prompt_tokens", estimate_tokens(prompt))
+        metrics.incr("completion_tokens", estimate_tokens(res))
+        return res
+
+    def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Yields the response word by word, the simulated latency is paid before the
+        first word. The stream is timed and counted like the ones of `OpenRouter`.
+        """
+        started = time.perf_counter()
+        self._simulate()
+        metrics.incr("llm_calls")
+
+        res = self._respond(prompt)[: max_tokens * 4]
+        metrics.incr("prompt_tokens", estimate_tokens(prompt))
+        metrics.incr("completion_tokens", estimate_tokens(res))
+        for i, word in enumerate(re.findall(r"\S+\s*", res)):
+            if i == 0:
+                metrics.observe(
+                    "backend.time_to_first_token", time.perf_counter() - started
+                )
+            yield word
+        metrics.observe("backend.stream", time.perf_counter() - started)
@@ -0,0 +1 @@
+from .standIn import LocalStandIn as LocalStandIn
@@ -0,0 +1,5 @@
+from ..modelBase import ModelBase
+
+class LocalStandIn(ModelBase):
+    def __init__(self, **kwargs):
+        super().__init__("local/stand-in", False, ["local"], **kwargs)
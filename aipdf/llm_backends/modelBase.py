@@ -1,14 +1,25 @@
 from abc import ABC
-from typing import List
+from typing import List, Optional
+
+from .modelRegistry import registry
 
 
 class ModelBase(ABC):
     def __init__(
-        self, name: str, requires_auth: bool, supported_backends: List[str], **kwargs
+        self,
+        name: str,
+        requires_auth: bool,
+        supported_backends: List[str],
+        context_length: Optional[int] = None,
+        max_output_tokens: Optional[int] = None,
+        **kwargs
     ):
         """
         A base class for models.
 
+        The capabilities of the model come from the `ModelRegistry`, under the name of
+        its class.
+
         Parameters
         ----------
         name : str
@@ -17,6 +28,12 @@ class ModelBase(ABC):
             Whether the model requires authentication.
         supported_backends : List[str]
             The supported backends for the model.
+        context_length : Optional[int]
+            The number of tokens the model can attend to, prompt and completion. By
+            default the one of the registry.
+        max_output_tokens : Optional[int]
+            The maximum number of tokens the model generates in one completion. By
+            default the one of the registry.
         **kwargs
             Additional arguments to pass to the model.
         """
@@ -24,6 +41,18 @@ class ModelBase(ABC):
         self.requires_auth = requires_auth
         self.supported_backends = supported_backends
 
+        self.capabilities = registry.get(type(self).__name__)
+        if context_length is not None:
+            self.capabilities = self.capabilities._replace(
+                context_length=context_length
+            )
+        if max_output_tokens is not None:
+            self.capabilities = self.capabilities._replace(
+                max_output_tokens=max_output_tokens
+            )
+        self.context_length = self.capabilities.context_length
+        self.max_output_tokens = self.capabilities.max_output_tokens
+
         for key, value in kwargs.items():
             setattr(self, key, value)
 
@@ -0,0 +1,135 @@
+import threading
+from typing import Dict, NamedTuple, Optional
+
+
+class ModelCapabilities(NamedTuple):
+    # The number of tokens the model can attend to, prompt and completion
+    context_length: int = 4096
+    # The maximum number of tokens the model generates in one completion
+    max_output_tokens: int = 2048
+    # The rate limits of the model, None for no limit
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    # The number of calls the model serves at the same time without slowing down
+    max_concurrency: int = 4
+    # The rough generation speed, used to rank the models before their latency has
+    # been measured
+    tokens_per_second: float = 30.0
+
+
+# Conservative defaults for the models of the OpenRouter free and pay as you go tiers,
+# override them with `ModelRegistry.load` to drive a model at the limits of your
+# account
+DEFAULT_CAPABILITIES: Dict[str, ModelCapabilities] = {
+    "Capybara7b": ModelCapabilities(
+        context_length=4096,
+        max_output_tokens=2048,
+        requests_per_minute=60,
+        max_concurrency=8,
+        tokens_per_second=80.0,
+    ),
+    "GPT4_Turbo": ModelCapabilities(
+        context_length=128000,
+        max_output_tokens=4096,
+        requests_per_minute=20,
+        tokens_per_minute=150000,
+        max_concurrency=4,
+        tokens_per_second=25.0,
+    ),
+    "Mixtral8x7bInstructBeta": ModelCapabilities(
+        context_length=32768,
+        max_output_tokens=4096,
+        requests_per_minute=40,
+        max_concurrency=6,
+        tokens_per_second=50.0,
+    ),
+    "Zephyr7b": ModelCapabilities(
+        context_length=4096,
+        max_output_tokens=2048,
+        requests_per_minute=60,
+        max_concurrency=8,
+        tokens_per_second=80.0,
+    ),
+    "LocalStandIn": ModelCapabilities(
+        context_length=8192,
+        max_output_tokens=2048,
+        max_concurrency=32,
+        tokens_per_second=1000.0,
+    ),
+}
+
+
+class ModelRegistry:
+    def __init__(self, capabilities: Optional[Dict[str, ModelCapabilities]] = None):
+        """
+        The capabilities of every model, ie. its context window, maximum output, rate
+        limits, concurrency and speed, keyed by the name of its class.
+
+        The models read their capabilities from the registry when they are created,
+        so the overrides have to be loaded before the backends are created.
+
+        Parameters
+        ----------
+        capabilities : Optional[Dict[str, ModelCapabilities]]
+            The capabilities of the models, `DEFAULT_CAPABILITIES` by default.
+        """
+        self._capabilities = dict(
+            DEFAULT_CAPABILITIES if capabilities is None else capabilities
+        )
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> ModelCapabilities:
+        """
+        Returns the capabilities of a model, the defaults of `ModelCapabilities` for
+        a model that is not registered.
+        """
+        with self._lock:
+            return self._capabilities.get(name, ModelCapabilities())
+
+    def override(self, name: str, **fields) -> ModelCapabilities:
+        """
+        Overrides some capabilities of a model, eg.
+        `registry.override("Zephyr7b", requests_per_minute=200)`.
+
+        Returns
+        -------
+        ModelCapabilities
+            The new capabilities of the model.
+        """
+        unknown = set(fields) - set(ModelCapabilities._fields)
+        if unknown:
+            raise ValueError(
+                f"Unknown capabilities for {name}: {', '.join(sorted(unknown))}"
+            )
+
+        with self._lock:
+            capabilities = self._capabilities.get(name, ModelCapabilities())
+            capabilities = capabilities._replace(**fields)
+            self._capabilities[name] = capabilities
+            return capabilities
+
+    def load(self, path: str):
+        """
+        Loads overrides from a JSON file mapping the model names to the capabilities
+        to override, eg. {"Zephyr7b": {"requests_per_minute": 200}}.
+
+        Parameters
+        ----------
+        path : str
+            The path of the JSON file.
+        """
+        import json
+
+        with open(path, "r") as f:
+            overrides = json.load(f)
+
+        if not isinstance(overrides, dict):
+            raise ValueError(f"{path} does not map model names to capabilities")
+        for name, fields in overrides.items():
+            if not isinstance(fields, dict):
+                raise ValueError(f"The capabilities of {name} in {path} are not a map")
+            self.override(name, **fields)
+
+
+# The registry the models read their capabilities from
+registry = ModelRegistry()
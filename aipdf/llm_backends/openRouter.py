@@ -1,11 +1,20 @@
 import json
-from typing import Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Iterator, Optional
 
-import requests
-
-from .llmBackendBase import LLMBase
+from .llmBackendBase import (
+    LLMBackendError,
+    LLMBase,
+    RateLimitError,
+    TransientBackendError,
+)
 from .modelBase import ModelBase
-from ..secrets import get_secret
+from ..metrics import metrics
+
+if TYPE_CHECKING:
+    import requests
+
 
 class OpenRouter(LLMBase):
     def __init__(
@@ -13,10 +22,18 @@ class OpenRouter(LLMBase):
         model: ModelBase,
         referer: Optional[str] = None,
         x_title: Optional[str] = None,
+        pool_size: int = 10,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
     ):
         """
         A backend for Open Router's API.
 
+        The backend owns a keep-alive connection pool, so the TCP and TLS handshakes
+        are paid once per connection instead of once per request. The connection pool
+        is created and the API key is read from the keyring once, on the first
+        request, so a run answered from the cache never loads the HTTP stack.
+
         Parameters
         ----------
         model : ModelBase
@@ -25,10 +42,150 @@ class OpenRouter(LLMBase):
             The referer to use for the backend.
         x_title : Optional[str]
             The x-title to use for the backend.
+        pool_size : int
+            The maximum number of pooled connections, ie. concurrent requests that do
+            not have to open a new connection.
+        connect_timeout : float
+            The number of seconds to wait for a connection to be established.
+        read_timeout : float
+            The number of seconds to wait for the server between two bytes of the
+            response.
         """
         self.model = model
         self.referer = referer
         self.x_title = x_title
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+
+        self._session = None
+        self._api_key = None
+        self._lock = threading.Lock()
+
+    def _get_session(self) -> "requests.Session":
+        """
+        Returns the pooled session, it is created on the first call.
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    session.mount(
+                        "https://",
+                        HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size),
+                    )
+                    self._session = session
+        return self._session
+
+    def _get_api_key(self) -> str:
+        """
+        Returns the API key, it is read from the keyring only on the first call.
+        """
+        if self._api_key is None:
+            with self._lock:
+                if self._api_key is None:
+                    # Imported here, the secrets CLI pulls in typer and keyring
+                    from ..secrets import get_secret
+
+                    self._api_key = get_secret("AI_PDF_OPEN_ROUTER_API_KEY")
+        return self._api_key
+
+    def close(self):
+        """
+        Closes the pooled connections of the backend.
+        """
+        if self._session is not None:
+            self._session.close()
+
+    def _post(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        override_system_message: Optional[str],
+        stream: bool = False,
+    ) -> "requests.Response":
+        """
+        Sends a chat completion request and returns the response.
+        """
+        # Unfortunatly the API requires a bearer token to be passed in the header, so no need to check the model for auth
+        # https://openrouter.ai/docs
+
+        base_headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer " + self._get_api_key(),
+        }
+
+        # These are optional headers acording to the API docs
+        # https://openrouter.ai/docs
+        # Setting them I think would make your request more unique and more indexable by the API ??
+        if self.referer:
+            base_headers["HTTP-Referer"] = self.referer
+        if self.x_title:
+            base_headers["x-title"] = self.x_title
+
+        body = {
+            "model": self.model.name,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": override_system_message
+                    if override_system_message
+                    else "You're a helpful coding assistant, that helps with repetitive tasks. Only answer the question below, do not add any additional information. Expect output to be processed by a script and not a human. Do not add characters for lists such as '*'",
+                },
+                {"role": "user", "content": prompt},
+            ],
+        }
+        if stream:
+            body["stream"] = True
+
+        import requests
+
+        try:
+            response = self._get_session().post(
+                url="https://openrouter.ai/api/v1/chat/completions",
+                headers=base_headers,
+                timeout=self.timeout,
+                data=json.dumps(body),
+                stream=stream,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransientBackendError(f"OpenRouter request failed: {e}") from e
+
+        if response.status_code < 400:
+            return response
+
+        retry_after = response.headers.get("Retry-After")
+        retry_after = (
+            float(retry_after) if retry_after and retry_after.isdigit() else None
+        )
+        message = f"OpenRouter returned HTTP {response.status_code}"
+        if not stream:
+            message += f": {response.text[:200]}"
+        response.close()
+
+        if response.status_code == 429:
+            raise RateLimitError("OpenRouter rate limit reached", retry_after)
+        if response.status_code >= 500 or response.status_code == 408:
+            raise TransientBackendError(message, retry_after)
+        raise LLMBackendError(message)
+
+    @staticmethod
+    def _iter_lines(response: "requests.Response") -> Iterator[str]:
+        """
+        Yields the lines of a streamed response, a dropped connection is reported as
+        a transient error.
+        """
+        import requests
+
+        try:
+            yield from response.iter_lines(decode_unicode=True)
+        except requests.RequestException as e:
+            raise TransientBackendError(f"OpenRouter stream failed: {e}") from e
 
     def completion(
         self,
@@ -53,41 +210,108 @@ class OpenRouter(LLMBase):
         **kwargs
             Additional arguments to pass to the backend.
         """
-        # Unfortunatly the API requires a bearer token to be passed in the header, so no need to check the model for auth
-        # https://openrouter.ai/docs
+        with metrics.span("backend.completion"):
+            response = self._post(
+                prompt, max_tokens, temperature, override_system_message
+            )
+            try:
+                body = response.json()
+            except ValueError as e:
+                raise TransientBackendError(
+                    f"OpenRouter returned a malformed response: {e}"
+                ) from e
 
-        base_headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer " + get_secret("AI_PDF_OPEN_ROUTER_API_KEY"),
-        }
+        metrics.incr("llm_calls")
+        usage = body.get("usage") or dict()
+        metrics.incr("prompt_tokens", usage.get("prompt_tokens", 0))
+        metrics.incr("completion_tokens", usage.get("completion_tokens", 0))
 
-        # These are optional headers acording to the API docs
-        # https://openrouter.ai/docs
-        # Setting them I think would make your request more unique and more indexable by the API ??
-        if self.referer:
-            base_headers["HTTP-Referer"] = self.referer
-        if self.x_title:
-            base_headers["x-title"] = self.x_title
+        try:
+            content = body["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            content = None
+        if content is None:
+            # OpenRouter reports the errors of the upstream provider in the body of
+            # an HTTP 200 response
+            error = body.get("error") or "no completion in the response"
+            raise TransientBackendError(f"OpenRouter returned no completion: {error}")
+        return content
 
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers=base_headers,
-            data=json.dumps(
-                {
-                    "model": self.model.name,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": override_system_message
-                            if override_system_message
-                            else "You're a helpful coding assistant, that helps with repetitive tasks. Only answer the question below, do not add any additional information. Expect output to be processed by a script and not a human. Do not add characters for lists such as '*'",
-                        },
-                        {"role": "user", "content": prompt},
-                    ],
-                }
-            ),
+    def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Streams a completion using a provided model, the text deltas are yielded as the
+        server sends them as server-sent events.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt to send to the backend.
+        max_tokens : int
+            The maximum number of tokens to generate.
+        temperature : float
+            The temperature to use for the generation.
+        override_system_message : Optional[str]
+            The system message to use for the generation.
+
+        Yields
+        ------
+        str
+            The text deltas of the completion.
+        """
+        started = time.perf_counter()
+        response = self._post(
+            prompt, max_tokens, temperature, override_system_message, stream=True
         )
-        # I don't really like this, but I don't want to write a bunch of code to handle errors on a toy project
-        return response.json()["choices"][0]["message"]["content"]
+        metrics.incr("llm_calls")
+        first_token = True
+        done = False
+
+        with response:
+            for line in self._iter_lines(response):
+                # Lines starting with ':' are SSE comments, OpenRouter sends them as
+                # keep-alives while the model is still processing
+                if not line or not line.startswith("data:"):
+                    continue
+
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    done = True
+                    break
+
+                try:
+                    chunk = json.loads(data)
+                except ValueError as e:
+                    raise TransientBackendError(
+                        f"OpenRouter sent a malformed event: {e}"
+                    ) from e
+                usage = chunk.get("usage") or dict()
+                metrics.incr("prompt_tokens", usage.get("prompt_tokens", 0))
+                metrics.incr("completion_tokens", usage.get("completion_tokens", 0))
+                if chunk.get("error"):
+                    # The errors of the upstream provider that happen once the stream
+                    # started are sent as an event, the HTTP status is already 200
+                    raise TransientBackendError(
+                        f"OpenRouter stream failed: {chunk['error']}"
+                    )
+                if not chunk.get("choices"):
+                    continue
+
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    if first_token:
+                        metrics.observe(
+                            "backend.time_to_first_token",
+                            time.perf_counter() - started,
+                        )
+                        first_token = False
+                    yield delta
+
+        if not done:
+            raise TransientBackendError("OpenRouter stream ended before [DONE]")
+        metrics.observe("backend.stream", time.perf_counter() - started)
@@ -1,4 +1,26 @@
-from .capybara import Capybara7b as Capybara7b
-from .gpt4 import GPT4_Turbo as GPT4_Turbo
-from .mixtralInstruct import Mixtral8x7bInstructBeta as Mixtral8x7bInstructBeta
-from .zephyr import Zephyr7b as Zephyr7b
+# The models are imported on first access, so importing one of them does not import
+# all the others
+_MODELS = {
+    "Capybara7b": ".capybara",
+    "GPT4_Turbo": ".gpt4",
+    "Mixtral8x7bInstructBeta": ".mixtralInstruct",
+    "Zephyr7b": ".zephyr",
+}
+
+__all__ = list(_MODELS)
+
+
+def __getattr__(name: str):
+    module = _MODELS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
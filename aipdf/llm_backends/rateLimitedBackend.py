@@ -0,0 +1,161 @@
+import threading
+from typing import Iterator, Optional
+
+from .llmBackendBase import LLMBase, RateLimitError
+from .rateLimiter import RateLimiter
+from ..metrics import metrics
+from ..tokens import estimate_tokens
+
+
+class RateLimitedBackend(LLMBase):
+    def __init__(
+        self,
+        backend: LLMBase,
+        rate_limiter: RateLimiter,
+        max_retries: int = 5,
+        max_concurrency: Optional[int] = None,
+    ):
+        """
+        Wraps any backend so that its calls go through a shared `RateLimiter`.
+
+        Rate limit errors of the wrapped backend make the limiter back off and the
+        call is retried, instead of sleeping a fixed interval before every call.
+
+        With `max_concurrency`, the calls over that number wait for a call to finish
+        before they acquire from the limiter, streams hold their slot until they are
+        consumed or closed.
+
+        Parameters
+        ----------
+        backend : LLMBase
+            The backend to wrap.
+        rate_limiter : RateLimiter
+            The limiter to acquire from, it can be shared between backends.
+        max_retries : int
+            How many times a rate limited call is retried before giving up.
+        max_concurrency : Optional[int]
+            The maximum number of calls in flight at the same time, None for no limit.
+        """
+        self.backend = backend
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.model = getattr(backend, "model", None)
+
+        self._slots = (
+            threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        )
+
+    def _acquire_slot(self):
+        if self._slots is not None:
+            self._slots.acquire()
+
+    def _release_slot(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def _estimate_request_tokens(
+        self, prompt: str, max_tokens: int, override_system_message: Optional[str]
+    ) -> int:
+        tokens = estimate_tokens(prompt) + max_tokens
+        if override_system_message:
+            tokens += estimate_tokens(override_system_message)
+        return tokens
+
+    def completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Acquires from the rate limiter and forwards the call to the wrapped backend.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt to send to the backend.
+        max_tokens : int
+            The maximum number of tokens to generate.
+        temperature : float
+            The temperature to use for the generation.
+        override_system_message : Optional[str]
+            The system message to use for the generation.
+        **kwargs
+            Additional arguments to pass to the backend.
+        """
+        tokens = self._estimate_request_tokens(
+            prompt, max_tokens, override_system_message
+        )
+
+        self._acquire_slot()
+        try:
+            attempt = 0
+            while True:
+                self.rate_limiter.acquire(tokens)
+                try:
+                    res = self.backend.completion(
+                        prompt=prompt,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        override_system_message=override_system_message,
+                        **kwargs
+                    )
+                except RateLimitError as e:
+                    metrics.incr("rate_limited")
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise
+                    self.rate_limiter.backoff(e.retry_after)
+                else:
+                    self.rate_limiter.success()
+                    return res
+        finally:
+            self._release_slot()
+
+    def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Acquires from the rate limiter and streams the call from the wrapped backend.
+
+        A rate limited call is only retried if nothing has been yielded yet.
+        """
+        tokens = self._estimate_request_tokens(
+            prompt, max_tokens, override_system_message
+        )
+
+        self._acquire_slot()
+        try:
+            attempt = 0
+            while True:
+                self.rate_limiter.acquire(tokens)
+                yielded = False
+                try:
+                    for delta in self.backend.stream_completion(
+                        prompt=prompt,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        override_system_message=override_system_message,
+                        **kwargs
+                    ):
+                        yielded = True
+                        yield delta
+                except RateLimitError as e:
+                    metrics.incr("rate_limited")
+                    attempt += 1
+                    if yielded or attempt > self.max_retries:
+                        raise
+                    self.rate_limiter.backoff(e.retry_after)
+                else:
+                    self.rate_limiter.success()
+                    return
+        finally:
+            self._release_slot()
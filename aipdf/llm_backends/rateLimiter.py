@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+from typing import Optional
+
+from ..metrics import metrics
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        """
+        A classic token bucket, it holds at most `capacity` tokens and refills at a
+        constant rate.
+
+        Note: This class is not thread safe on its own, `RateLimiter` guards it.
+
+        Parameters
+        ----------
+        capacity : float
+            The maximum number of tokens the bucket can hold, ie. the allowed burst.
+        refill_per_second : float
+            The number of tokens added to the bucket every second.
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+
+    def _refill(self, now: float, scale: float):
+        elapsed = now - self._last_refill
+        self._tokens = min(
+            self.capacity, self._tokens + elapsed * self.refill_per_second * scale
+        )
+        self._last_refill = now
+
+    def wait_time(self, amount: float, now: float, scale: float = 1.0) -> float:
+        """
+        Returns how many seconds to wait until `amount` tokens are available.
+
+        Requests larger than the capacity are clamped to the capacity, otherwise they
+        would wait forever.
+        """
+        self._refill(now, scale)
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / (self.refill_per_second * scale)
+
+    def take(self, amount: float):
+        self._tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """
+        A thread safe limiter for requests and tokens per minute.
+
+        When the provider still answers with HTTP 429 the limiter backs off, every
+        caller is paused for the time the provider asked for (or an exponentially
+        growing delay if it did not say) and the refill rate is halved. Every
+        successful request then slowly brings the rate back up.
+
+        Parameters
+        ----------
+        requests_per_minute : Optional[float]
+            The number of requests allowed per minute, None for no limit.
+        tokens_per_minute : Optional[float]
+            The number of prompt + completion tokens allowed per minute, None for no
+            limit.
+        base_backoff : float
+            The first backoff delay in seconds when the provider does not send a
+            Retry-After.
+        max_backoff : float
+            The maximum backoff delay in seconds.
+        """
+        self.requests = (
+            TokenBucket(requests_per_minute, requests_per_minute / 60)
+            if requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+            if tokens_per_minute
+            else None
+        )
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._consecutive_limits = 0
+        self._rate_scale = 1.0
+
+    def acquire(self, tokens: int = 0):
+        """
+        Blocks until one request carrying `tokens` tokens is allowed to go out.
+
+        Parameters
+        ----------
+        tokens : int
+            The estimated number of prompt + completion tokens of the request.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if self.requests:
+                    wait = max(wait, self.requests.wait_time(1, now, self._rate_scale))
+                if self.tokens:
+                    wait = max(
+                        wait, self.tokens.wait_time(tokens, now, self._rate_scale)
+                    )
+
+                if wait <= 0:
+                    if self.requests:
+                        self.requests.take(1)
+                    if self.tokens:
+                        self.tokens.take(tokens)
+                    return
+
+            metrics.incr("rate_limit_wait_seconds", wait)
+            time.sleep(wait)
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        """
+        Registers a rate limit response from the provider and pauses every caller.
+
+        Parameters
+        ----------
+        retry_after : Optional[float]
+            The number of seconds the provider asked us to wait, if it told us.
+
+        Returns
+        -------
+        float
+            The number of seconds the callers are paused for.
+        """
+        with self._lock:
+            self._consecutive_limits += 1
+            self._rate_scale = max(0.1, self._rate_scale / 2)
+
+            if retry_after is None:
+                delay = min(
+                    self.max_backoff,
+                    self.base_backoff * 2 ** (self._consecutive_limits - 1),
+                )
+                # Add some jitter so the paused callers do not all wake up at once
+                delay *= random.uniform(0.5, 1.0)
+            else:
+                delay = retry_after
+
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            return delay
+
+    def success(self):
+        """
+        Registers a successful request, slowly bringing the rate back to its limit.
+        """
+        with self._lock:
+            self._consecutive_limits = 0
+            self._rate_scale = min(1.0, self._rate_scale + 0.05)
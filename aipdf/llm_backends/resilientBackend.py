@@ -0,0 +1,281 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Iterator, Optional
+
+from .llmBackendBase import (
+    CircuitOpenError,
+    LLMBackendError,
+    LLMBase,
+    RateLimitError,
+    TransientBackendError,
+)
+from ..metrics import metrics
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Fails fast while a provider is down, instead of letting every call wait for its
+        own timeouts and retries.
+
+        The circuit opens after `failure_threshold` consecutive failures, every call
+        is then rejected for `reset_timeout` seconds. After that one trial call is let
+        through: if it succeeds the circuit closes, otherwise it opens again.
+
+        Parameters
+        ----------
+        failure_threshold : int
+            The number of consecutive failures that open the circuit.
+        reset_timeout : float
+            The number of seconds the circuit stays open.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_call(self):
+        """
+        Raises `CircuitOpenError` if the call is not allowed to go out.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("The provider is considered down")
+            if self._trial_in_flight:
+                raise CircuitOpenError("The provider is being probed")
+            self._trial_in_flight = True
+
+    def success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                metrics.incr("circuit_closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """
+        Ends a call whose outcome says nothing about the provider, eg. it failed
+        before reaching it, a trial call in flight lets the next call probe instead.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    metrics.incr("circuit_opened")
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class ResilientBackend(LLMBase):
+    def __init__(
+        self,
+        backend: LLMBase,
+        timeout: Optional[float] = 180.0,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        retry_rate_limits: bool = True,
+        max_workers: int = 32,
+    ):
+        """
+        Wraps any backend with per-call timeouts, retries and a circuit breaker.
+
+        Transient errors (server errors, timeouts, dropped connections, malformed
+        responses) are retried with a bounded exponential backoff with jitter, or
+        after the Retry-After the provider sent. Other errors are raised right away.
+        Only the transient errors count as failures for the circuit breaker, a
+        rejected request, eg. HTTP 401, never opens the circuit.
+
+        Parameters
+        ----------
+        backend : LLMBase
+            The backend to wrap.
+        timeout : Optional[float]
+            The number of seconds a call may take before it is given up and retried,
+            None for no timeout. The call itself can not be interrupted, it keeps
+            running in the background and its result is ignored.
+        max_retries : int
+            How many times a call is retried before giving up.
+        base_delay : float
+            The delay in seconds before the first retry, it doubles on every retry.
+        max_delay : float
+            The maximum delay in seconds between two tries.
+        circuit_breaker : Optional[CircuitBreaker]
+            The circuit breaker of the provider, it can be shared between backends
+            calling the same provider. By default the backend has its own.
+        retry_rate_limits : bool
+            Whether to retry rate limit errors, disable it when a
+            `RateLimitedBackend` wraps this backend and backs off for them.
+        max_workers : int
+            The number of threads the calls with a timeout run in.
+        """
+        self.backend = backend
+        self.model = getattr(backend, "model", None)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.retry_rate_limits = retry_rate_limits
+        self.max_workers = max_workers
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="aipdf-call"
+                )
+            return self._executor
+
+    def _delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        # Full jitter, so the callers that failed together do not retry together
+        return random.uniform(0, delay)
+
+    def _record(self, error: Exception):
+        """
+        Records a failed call in the circuit breaker. Only the transient errors count
+        as failures, and only a rate limit or a rejected request, eg. HTTP 400 or
+        401, counts as a success since the provider answered. Any other error, eg. a
+        bug parsing the response, says nothing about the provider.
+        """
+        if isinstance(error, RateLimitError):
+            self.circuit_breaker.success()
+        elif isinstance(error, TransientBackendError):
+            self.circuit_breaker.failure()
+        elif isinstance(error, LLMBackendError) and not isinstance(
+            error, CircuitOpenError
+        ):
+            self.circuit_breaker.success()
+        else:
+            self.circuit_breaker.release()
+
+    def _is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, RateLimitError):
+            return self.retry_rate_limits
+        return isinstance(error, TransientBackendError)
+
+    def _call_with_timeout(self, **kwargs):
+        if self.timeout is None:
+            return self.backend.completion(**kwargs)
+
+        future = self._get_executor().submit(self.backend.completion, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            metrics.incr("llm_timeouts")
+            raise TransientBackendError(
+                f"The call did not finish within {self.timeout}s"
+            ) from None
+
+    def completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Forwards the call to the wrapped backend, retrying it on transient errors.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt to send to the backend.
+        max_tokens : int
+            The maximum number of tokens to generate.
+        temperature : float
+            The temperature to use for the generation.
+        override_system_message : Optional[str]
+            The system message to use for the generation.
+        **kwargs
+            Additional arguments to pass to the backend.
+        """
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_call()
+            try:
+                res = self._call_with_timeout(
+                    prompt=prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    override_system_message=override_system_message,
+                    **kwargs
+                )
+            except Exception as e:
+                self._record(e)
+                if not self._is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                metrics.incr("llm_retries")
+                time.sleep(self._delay(attempt, getattr(e, "retry_after", None)))
+                attempt += 1
+            else:
+                self.circuit_breaker.success()
+                return res
+
+    def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Streams the call from the wrapped backend, a failed stream is only retried if
+        nothing has been yielded yet. Streams are not subject to the call timeout, the
+        backend's read timeout applies between two deltas.
+        """
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_call()
+            yielded = False
+            try:
+                for delta in self.backend.stream_completion(
+                    prompt=prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    override_system_message=override_system_message,
+                    **kwargs
+                ):
+                    yielded = True
+                    yield delta
+            except Exception as e:
+                self._record(e)
+                if (
+                    yielded
+                    or not self._is_retryable(e)
+                    or attempt >= self.max_retries
+                ):
+                    raise
+                metrics.incr("llm_retries")
+                time.sleep(self._delay(attempt, getattr(e, "retry_after", None)))
+                attempt += 1
+            else:
+                self.circuit_breaker.success()
+                return
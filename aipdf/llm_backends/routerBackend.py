@@ -0,0 +1,365 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from .llmBackendBase import LLMBase
+from ..metrics import metrics
+
+
+class RouteStats:
+    def __init__(self, window: int = 100):
+        """
+        The latencies and outcomes of the latest calls of a route.
+
+        Note: This class is not thread safe on its own, `RouterBackend` guards it.
+
+        Parameters
+        ----------
+        window : int
+            The number of latest calls the statistics are computed over.
+        """
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.calls = 0
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok:
+            # Failures are often fast, they would make a broken route look fast
+            self.latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Returns the q-th quantile (0-1) of the latencies, None without samples.
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class RouterBackend(LLMBase):
+    def __init__(
+        self,
+        backends: Sequence[LLMBase],
+        names: Optional[Sequence[str]] = None,
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        min_samples: int = 5,
+        max_error_rate: float = 0.5,
+        cooldown: float = 30.0,
+        window: int = 100,
+        max_workers: int = 32,
+    ):
+        """
+        Routes every call to the fastest healthy backend out of several, typically one
+        backend per model.
+
+        The latency percentiles and the error rate of every route are tracked over its
+        latest calls. A call goes to the healthy route with the lowest median latency,
+        routes without enough samples are tried first so every route gets measured. A
+        route whose error rate goes over `max_error_rate` is skipped for `cooldown`
+        seconds. A failed call fails over to the next route.
+
+        With hedging, when a call has not answered after the p95 latency of its route
+        a duplicate is sent to the next best route and whichever answers first is
+        used, this cuts the tail latency caused by a few stragglers.
+
+        Parameters
+        ----------
+        backends : Sequence[LLMBase]
+            The backends to route between.
+        names : Optional[Sequence[str]]
+            The names of the routes for the statistics, by default the model names.
+        hedge : bool
+            Whether to send a duplicate request after the p95 latency.
+        hedge_percentile : float
+            The latency quantile (0-1) after which a call is hedged.
+        min_samples : int
+            The number of calls a route needs before its latency is trusted.
+        max_error_rate : float
+            The error rate (0-1) over which a route is considered unhealthy.
+        cooldown : float
+            The number of seconds an unhealthy route is skipped for.
+        window : int
+            The number of latest calls the statistics of a route are computed over.
+        max_workers : int
+            The number of threads the calls run in when hedging.
+        """
+        if not backends:
+            raise ValueError("RouterBackend needs at least one backend")
+
+        self.backends = list(backends)
+        self.names = list(names) if names else [
+            getattr(getattr(backend, "model", None), "name", None) or f"route-{i}"
+            for i, backend in enumerate(self.backends)
+        ]
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.max_workers = max_workers
+
+        # The prompts are sized for the smallest model of the routes
+        models = [
+            backend.model
+            for backend in self.backends
+            if getattr(backend, "model", None) is not None
+        ]
+        self.model = (
+            min(models, key=lambda model: model.context_length) if models else None
+        )
+        # Any of the routes may answer, so the answers are cached under all of them
+        # and not under the model the prompts are sized for
+        self.cache_name = "router:" + ",".join(sorted(self.names))
+
+        self.stats = [RouteStats(window) for _ in self.backends]
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="aipdf-router"
+                )
+            return self._executor
+
+    def _ranked_routes(self, exclude: Sequence[int] = ()) -> List[int]:
+        """
+        Returns the routes from the best to the worst one.
+        """
+        now = time.monotonic()
+        with self._lock:
+
+            def rank(i: int):
+                stats = self.stats[i]
+                healthy = stats.cooldown_until <= now
+                capabilities = getattr(
+                    getattr(self.backends[i], "model", None), "capabilities", None
+                )
+                # A model serving as many calls as it can is only used when all are
+                saturated = (
+                    capabilities is not None
+                    and stats.in_flight >= capabilities.max_concurrency
+                )
+                measured = len(stats.latencies) >= self.min_samples
+                # Unmeasured routes first, least used first and the fastest on paper
+                # first, then the fastest measured
+                latency = stats.percentile(0.5) if measured else stats.calls
+                speed = capabilities.tokens_per_second if capabilities else 0.0
+                return (
+                    not healthy,
+                    saturated,
+                    measured,
+                    latency,
+                    -speed,
+                    stats.in_flight,
+                )
+
+            return sorted(
+                (i for i in range(len(self.backends)) if i not in exclude), key=rank
+            )
+
+    def _hedge_delay(self, route: int) -> Optional[float]:
+        with self._lock:
+            stats = self.stats[route]
+            if len(stats.latencies) < self.min_samples:
+                return None
+            return stats.percentile(self.hedge_percentile)
+
+    def _record(self, route: int, latency: float, ok: bool):
+        with self._lock:
+            stats = self.stats[route]
+            stats.record(latency, ok)
+            if (
+                not ok
+                and len(stats.outcomes) >= self.min_samples
+                and stats.error_rate() > self.max_error_rate
+            ):
+                stats.cooldown_until = time.monotonic() + self.cooldown
+                # Give the route a fresh start once its cooldown is over
+                stats.outcomes.clear()
+                metrics.incr("router.cooldowns")
+
+        metrics.observe(f"route.{self.names[route]}", latency)
+
+    def _call(self, route: int, **kwargs):
+        with self._lock:
+            self.stats[route].in_flight += 1
+        started = time.perf_counter()
+        try:
+            res = self.backends[route].completion(**kwargs)
+        except Exception:
+            self._record(route, time.perf_counter() - started, False)
+            raise
+        else:
+            self._record(route, time.perf_counter() - started, True)
+            return res
+        finally:
+            with self._lock:
+                self.stats[route].in_flight -= 1
+
+    def completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Sends the call to the best route, failing over to the next routes on errors.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt to send to the backend.
+        max_tokens : int
+            The maximum number of tokens to generate.
+        temperature : float
+            The temperature to use for the generation.
+        override_system_message : Optional[str]
+            The system message to use for the generation.
+        **kwargs
+            Additional arguments to pass to the backend.
+        """
+        request = dict(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            override_system_message=override_system_message,
+            **kwargs
+        )
+        if self.hedge and len(self.backends) > 1:
+            return self._hedged_completion(request)
+
+        error = None
+        for attempt, route in enumerate(self._ranked_routes()):
+            if attempt:
+                metrics.incr("router.failovers")
+            try:
+                return self._call(route, **request)
+            except Exception as e:
+                error = e
+        raise error
+
+    def _hedged_completion(self, request: dict):
+        executor = self._get_executor()
+        tried = []
+        pending = dict()
+        error = None
+
+        def launch() -> bool:
+            routes = self._ranked_routes(exclude=tried)
+            if not routes:
+                return False
+            tried.append(routes[0])
+            pending[executor.submit(self._call, routes[0], **request)] = routes[0]
+            return True
+
+        launch()
+        while pending:
+            timeout = None
+            if len(tried) < len(self.backends):
+                # Hedge once the first call is slower than its route usually is
+                timeout = self._hedge_delay(tried[-1])
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                metrics.incr("router.hedged")
+                launch()
+                continue
+
+            for future in done:
+                route = pending.pop(future)
+                try:
+                    res = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if route != tried[0]:
+                    metrics.incr("router.hedge_wins")
+                # The other calls are left to finish, their latency is still recorded
+                return res
+
+            # Every finished call failed, fail over if nothing else is in flight
+            if not pending:
+                if not launch():
+                    break
+                metrics.incr("router.failovers")
+
+        raise error
+
+    def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 2048,
+        temperature: float = 0.8,
+        override_system_message: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Streams the call from the best route, it fails over to the next route only if
+        nothing has been yielded yet. Streams are never hedged.
+        """
+        error = None
+        for attempt, route in enumerate(self._ranked_routes()):
+            if attempt:
+                metrics.incr("router.failovers")
+
+            started = time.perf_counter()
+            yielded = False
+            try:
+                for delta in self.backends[route].stream_completion(
+                    prompt=prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    override_system_message=override_system_message,
+                    **kwargs
+                ):
+                    yielded = True
+                    yield delta
+            except Exception as e:
+                self._record(route, time.perf_counter() - started, False)
+                if yielded:
+                    raise
+                error = e
+            else:
+                self._record(route, time.perf_counter() - started, True)
+                return
+        raise error
+
+    def route_stats(self) -> Dict[str, dict]:
+        """
+        Returns the latency percentiles and the error rate of every route.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "calls": stats.calls,
+                    "p50": stats.percentile(0.5),
+                    "p95": stats.percentile(0.95),
+                    "error_rate": stats.error_rate(),
+                    "healthy": stats.cooldown_until <= now,
+                }
+                for name, stats in zip(self.names, self.stats)
+            }
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -0,0 +1,124 @@
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict
+
+# Returned by `Metrics.span` while disabled, so a disabled span costs one attribute
+# lookup and one branch
+_NULL_SPAN = nullcontext()
+
+
+class Metrics:
+    def __init__(self):
+        """
+        A tiny registry of timed spans and counters for a pipeline run.
+
+        It is disabled by default, in which case spans and counters do nothing.
+        """
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.spans: Dict[str, Dict[str, float]] = dict()
+        self.counters: Dict[str, float] = dict()
+        self._started = time.time()
+
+    def enable(self):
+        self.enabled = True
+        self._started = time.time()
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.spans = dict()
+            self.counters = dict()
+            self._started = time.time()
+
+    def span(self, name: str):
+        """
+        Returns a context manager that times its block under `name`.
+
+        Parameters
+        ----------
+        name : str
+            The name of the span, spans with the same name are aggregated.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def observe(self, name: str, seconds: float):
+        """
+        Records a duration under the span `name`.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {"count": 0, "total": 0.0, "max": 0.0}
+            span["count"] += 1
+            span["total"] += seconds
+            span["max"] = max(span["max"], seconds)
+
+    def incr(self, name: str, value: float = 1):
+        """
+        Adds `value` to the counter `name`.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self) -> dict:
+        """
+        Returns the spans and counters of the run as a JSON serializable dict.
+        """
+        with self._lock:
+            return {
+                "started": self._started,
+                "wall_time": time.time() - self._started,
+                "spans": {name: dict(span) for name, span in self.spans.items()},
+                "counters": dict(self.counters),
+            }
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def to_prometheus(self, prefix: str = "aipdf") -> str:
+        """
+        Returns the spans and counters in the Prometheus text exposition format.
+        """
+        report = self.report()
+        lines = [f"# TYPE {prefix}_span_seconds summary"]
+        for name, span in sorted(report["spans"].items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            series = f'{prefix}_span_seconds_%s{{span="{label}"}}'
+            lines.append(f"{series % 'count'} {span['count']}")
+            lines.append(f"{series % 'sum'} {span['total']}")
+
+        for name, value in sorted(report["counters"].items()):
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.to_prometheus())
+
+
+# The registry the pipeline reports to
+metrics = Metrics()
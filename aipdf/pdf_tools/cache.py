@@ -0,0 +1,338 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .. import __version__
+from .document import Document, PageRanges
+from .fontruns import COLUMNS, FontRunStore
+
+DEFAULT_EXTRACTION_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "aipdf", "documents"
+)
+
+# Bumped whenever the layout of the cache files changes
+FORMAT_VERSION = 1
+
+_MAGIC = b"AIPDFDOC"
+# magic, format version, byte order, page count, run count, then the byte length of
+# the font names, the page offsets, every column, the run text and the page texts
+_HEADER = struct.Struct("<8sIBxxxQQ" + "Q" * (4 + len(COLUMNS)))
+
+_SPANS_MAGIC = b"AIPDFSPN"
+# magic, format version, section count, byte length of the headers
+_SPANS_HEADER = struct.Struct("<8sIIQ")
+
+_BYTE_ORDER = 0 if sys.byteorder == "little" else 1
+
+
+def file_digest(pdf_file) -> str:
+    """
+    Returns the sha256 of the content of a PDF file, read in chunks.
+
+    Parameters
+    ----------
+    pdf_file : Union[str, BufferedReader]
+        The path of the PDF file or the PDF file itself.
+    """
+    digest = hashlib.sha256()
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    else:
+        position = pdf_file.tell()
+        pdf_file.seek(0)
+        for chunk in iter(lambda: pdf_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+        pdf_file.seek(position)
+    return digest.hexdigest()
+
+
+def _write_atomically(path: str, chunks: Iterable[bytes]):
+    """
+    Writes a file atomically through a temporary file of its own, so the threads and
+    processes writing the same file at the same time never share one. The temporary
+    file is removed if the write fails.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ExtractionCache:
+    def __init__(
+        self,
+        directory: str = DEFAULT_EXTRACTION_CACHE_DIR,
+        ttl: Optional[float] = 30 * 24 * 60 * 60,
+        max_size: Optional[int] = 1024 * 1024 * 1024,
+    ):
+        """
+        A persistent cache of ingested documents and of their section spans.
+
+        Every document is stored in one binary file keyed by the hash of the PDF and
+        the version of the tool: a fixed header followed by the raw bytes of the
+        `FontRunStore` columns and the texts. Loading memory maps the file and copies
+        the columns straight into arrays, so a cached document loads in milliseconds
+        instead of being parsed again.
+
+        Parameters
+        ----------
+        directory : str
+            The directory the cache files are stored in.
+        ttl : Optional[float]
+            The number of seconds a file is kept after it was last written or read,
+            None to keep them forever.
+        max_size : Optional[int]
+            The maximum total size of the cache files in bytes, the least recently
+            used files are evicted first. None for no limit.
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.evict()
+
+    def key(self, pdf_file, pages: Optional[PageRanges] = None) -> str:
+        """
+        Returns the cache key of a PDF file, a new version of the tool never reads the
+        artifacts of an older one. A document restricted to page ranges has its own
+        key.
+        """
+        key = f"{file_digest(pdf_file)}:{__version__}:{FORMAT_VERSION}"
+        if pages is not None:
+            key += ":" + ",".join(f"{start}-{stop}" for start, stop in pages)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def load(self, key: str) -> Optional[Document]:
+        """
+        Returns the cached document of the key, None if there is none or it can not
+        be read.
+        """
+        path = self._path(key, ".doc")
+        try:
+            with open(path, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                document = self._decode(data)
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            return None
+
+        if document is not None:
+            document.cache_key = key
+            self._touch(path)
+        return document
+
+    @staticmethod
+    def _touch(path: str):
+        # The modification time is the last use of the file for the eviction, the
+        # access time is not updated on most mounts
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        Drops the files that were not used for `ttl` seconds, then the least recently
+        used ones until the cache fits in `max_size`.
+        """
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith((".doc", ".spans")):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        # Another process may be evicting the same files, they may be gone already
+        for used, size, path in sorted(entries):
+            expired = self.ttl is not None and used < now - self.ttl
+            too_large = self.max_size is not None and total > self.max_size
+            if not expired and not too_large:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def store(self, key: str, document: Document):
+        """
+        Writes a document to the cache, atomically.
+        """
+        runs = document.runs
+        fonts = "\0".join(runs.fonts).encode("utf-8")
+        run_text = runs.text.encode("utf-8")
+        page_text = "".join(document.page_texts).encode("utf-8")
+
+        # The page texts are stored as one buffer, split on these character offsets
+        offsets = array("Q", [0])
+        for text in document.page_texts:
+            offsets.append(offsets[-1] + len(text))
+
+        columns = [getattr(runs, name) for name in COLUMNS]
+        header = _HEADER.pack(
+            _MAGIC,
+            FORMAT_VERSION,
+            _BYTE_ORDER,
+            document.page_count,
+            len(runs),
+            len(fonts),
+            len(offsets) * offsets.itemsize,
+            *[len(column) * column.itemsize for column in columns],
+            len(run_text),
+            len(page_text),
+        )
+
+        _write_atomically(
+            self._path(key, ".doc"),
+            [
+                header,
+                fonts,
+                offsets.tobytes(),
+                *[column.tobytes() for column in columns],
+                run_text,
+                page_text,
+            ],
+        )
+        self.evict()
+
+    @staticmethod
+    def _decode(data) -> Optional[Document]:
+        (
+            magic,
+            version,
+            byte_order,
+            page_count,
+            run_count,
+            *lengths,
+        ) = _HEADER.unpack_from(data)
+        if (
+            magic != _MAGIC
+            or version != FORMAT_VERSION
+            or byte_order != _BYTE_ORDER
+        ):
+            return None
+
+        position = _HEADER.size
+
+        def take(length: int) -> bytes:
+            nonlocal position
+            if position + length > len(data):
+                raise ValueError("Truncated cache file")
+            chunk = data[position : position + length]
+            position += length
+            return chunk
+
+        fonts_length, offsets_length, *column_lengths = lengths[: 2 + len(COLUMNS)]
+        run_text_length, page_text_length = lengths[2 + len(COLUMNS) :]
+
+        fonts = take(fonts_length).decode("utf-8")
+        offsets = array("Q")
+        offsets.frombytes(take(offsets_length))
+
+        columns = dict()
+        for (name, typecode), length in zip(COLUMNS.items(), column_lengths):
+            column = array(typecode)
+            column.frombytes(take(length))
+            if len(column) != run_count:
+                raise ValueError("Corrupt cache file")
+            columns[name] = column
+
+        run_text = take(run_text_length).decode("utf-8")
+        page_text = take(page_text_length).decode("utf-8")
+        if len(offsets) != page_count + 1:
+            raise ValueError("Corrupt cache file")
+
+        page_texts = [
+            page_text[offsets[i] : offsets[i + 1]] for i in range(page_count)
+        ]
+        runs = FontRunStore.from_columns(
+            fonts.split("\0") if fonts else [], columns, run_text
+        )
+        return Document.from_parts(page_texts, runs)
+
+    def _spans_key(self, key: str, section_headers: List[str]) -> str:
+        digest = hashlib.sha256("\0".join(section_headers).encode("utf-8"))
+        return f"{key}-{digest.hexdigest()[:16]}"
+
+    def load_spans(
+        self, key: str, section_headers: List[str]
+    ) -> Optional[Dict[str, Tuple[int, int]]]:
+        """
+        Returns the cached section spans of a document for the given headers, in the
+        format of `find_section_spans`, None if there are none.
+        """
+        path = self._path(self._spans_key(key, section_headers), ".spans")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            magic, version, count, headers_length = _SPANS_HEADER.unpack_from(data)
+            if magic != _SPANS_MAGIC or version != FORMAT_VERSION:
+                return None
+
+            position = _SPANS_HEADER.size
+            headers = data[position : position + headers_length].decode("utf-8")
+            offsets = array("Q")
+            offsets.frombytes(data[position + headers_length :])
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            return None
+
+        headers = headers.split("\0") if count else []
+        if len(headers) != count or len(offsets) != 2 * count:
+            return None
+        self._touch(path)
+        return {
+            header: (offsets[2 * i], offsets[2 * i + 1])
+            for i, header in enumerate(headers)
+        }
+
+    def store_spans(
+        self,
+        key: str,
+        section_headers: List[str],
+        spans: Dict[str, Tuple[int, int]],
+    ):
+        """
+        Writes the section spans of a document for the given headers, atomically.
+        """
+        headers = "\0".join(spans).encode("utf-8")
+        offsets = array("Q", [offset for span in spans.values() for offset in span])
+
+        _write_atomically(
+            self._path(self._spans_key(key, section_headers), ".spans"),
+            [
+                _SPANS_HEADER.pack(
+                    _SPANS_MAGIC, FORMAT_VERSION, len(spans), len(headers)
+                ),
+                headers,
+                offsets.tobytes(),
+            ],
+        )
+        self.evict()
@@ -0,0 +1,189 @@
+import re
+from collections import Counter
+from typing import Iterable, List, NamedTuple, Tuple
+
+from ..tokens import estimate_tokens
+
+_DIGITS = re.compile(r"\d+")
+# Every horizontal whitespace, including the non breaking spaces PDFs are fond of
+_SPACES = re.compile(r"[^\S\n]+")
+_LINE_EDGES = re.compile(r" ?\n ?")
+_BLANK_LINES = re.compile(r"\n{3,}")
+# A word broken over two lines, eg. "summa-\nrization", the second half must start
+# lowercase so that "Figure 3-\nA" or a dash ending a line are left alone
+_HYPHENATED = re.compile(r"(\w)-\n([a-z])")
+
+
+class CleaningReport(NamedTuple):
+    tokens_before: int
+    tokens_after: int
+    # The running headers, footers and page numbers that were removed
+    lines_removed: int
+    hyphenations_joined: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+def _line_key(line: str) -> str:
+    # Running headers and footers often only differ by their page number
+    return _DIGITS.sub("#", _SPACES.sub(" ", line).strip().lower())
+
+
+def collapse_spaces(text: str) -> str:
+    """
+    Collapses every run of horizontal whitespace into a single space.
+    """
+    return _SPACES.sub(" ", text)
+
+
+class PageFurniture:
+    def __init__(
+        self,
+        page_texts: Iterable[str],
+        min_share: float = 0.5,
+        min_pages: int = 3,
+        edge_lines: int = 3,
+    ):
+        """
+        A frequency index of the lines at the top and bottom of the pages, to find
+        the page furniture, ie. running headers, footers, page numbers, journal names
+        and copyright lines.
+
+        A line is furniture when it is among the first or last `edge_lines` lines of
+        at least `min_share` of the pages, and of at least `min_pages` pages. The
+        lines are compared case insensitively and with their numbers masked, so
+        "Page 3 of 12" and "Page 4 of 12" are the same line. Only the edges of the
+        pages are looked at, so a short line that is common in the body, eg. "where"
+        in a paper full of equations, is never taken for furniture.
+
+        Parameters
+        ----------
+        page_texts : Iterable[str]
+            The texts of the pages the index is built from, a sample of the pages is
+            enough.
+        min_share : float
+            The share of the pages a line has to repeat on.
+        min_pages : int
+            The number of pages a line has to repeat on, so that short documents keep
+            their lines.
+        edge_lines : int
+            The number of non blank lines at the top and at the bottom of a page that
+            can be furniture.
+        """
+        self.edge_lines = edge_lines
+
+        counts = Counter()
+        page_count = 0
+        for text in page_texts:
+            page_count += 1
+            lines = text.split("\n")
+            counts.update({_line_key(lines[i]) for i in self._edges(lines)})
+        counts.pop("", None)
+
+        threshold = max(min_pages, min_share * page_count)
+        self.lines = {line for line, count in counts.items() if count >= threshold}
+
+    def _edges(self, lines: List[str]) -> List[int]:
+        """
+        Returns the indices of the first and last non blank lines of a page.
+        """
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        if len(filled) <= 2 * self.edge_lines:
+            return filled
+        return filled[: self.edge_lines] + filled[-self.edge_lines :]
+
+    def strip(self, text: str) -> Tuple[str, int]:
+        """
+        Removes the furniture from the edges of a page.
+
+        Parameters
+        ----------
+        text : str
+            The text of the page.
+
+        Returns
+        -------
+        Tuple[str, int]
+            The text of the page without its furniture, and the number of lines that
+            were removed.
+        """
+        if not self.lines:
+            return text, 0
+
+        lines = text.split("\n")
+        removed = {i for i in self._edges(lines) if _line_key(lines[i]) in self.lines}
+        if not removed:
+            return text, 0
+
+        stripped = "\n".join(line for i, line in enumerate(lines) if i not in removed)
+        # The pages are concatenated as they are, keep the last word of this page
+        # apart from the first word of the next one
+        ends_line = text.endswith("\n") or len(lines) - 1 in removed
+        if ends_line and not stripped.endswith("\n"):
+            stripped += "\n"
+        return stripped, len(removed)
+
+
+def normalize_text(text: str) -> Tuple[str, int]:
+    """
+    Rejoins the words hyphenated at a line break and collapses the whitespace, ie.
+    runs of spaces become one space and runs of blank lines one blank line.
+
+    Parameters
+    ----------
+    text : str
+        The text to normalize.
+
+    Returns
+    -------
+    Tuple[str, int]
+        The normalized text, and the number of hyphenated words that were rejoined.
+    """
+    text = _LINE_EDGES.sub("\n", collapse_spaces(text))
+    text, joined = _HYPHENATED.subn(r"\1\2", text)
+    return _BLANK_LINES.sub("\n\n", text), joined
+
+
+def clean_pages(
+    page_texts: List[str], min_share: float = 0.5, edge_lines: int = 3
+) -> Tuple[str, CleaningReport]:
+    """
+    Cleans the text of a document before the prompts are built from it, ie. removes
+    the page furniture and normalizes the text, see `PageFurniture` and
+    `normalize_text`.
+
+    Parameters
+    ----------
+    page_texts : List[str]
+        The texts of the pages, in document order.
+    min_share : float
+        The share of the pages a line has to repeat on to be furniture.
+    edge_lines : int
+        The number of lines at the top and at the bottom of a page that can be
+        furniture.
+
+    Returns
+    -------
+    Tuple[str, CleaningReport]
+        The cleaned text of the whole document, and how much it saved.
+    """
+    furniture = PageFurniture(page_texts, min_share, edge_lines=edge_lines)
+
+    stripped = []
+    lines_removed = 0
+    for text in page_texts:
+        text, removed = furniture.strip(text)
+        stripped.append(text)
+        lines_removed += removed
+
+    # Normalized as a whole, so a word hyphenated at the end of a page is rejoined
+    text, joined = normalize_text("".join(stripped))
+
+    return text, CleaningReport(
+        estimate_tokens("".join(page_texts)),
+        estimate_tokens(text),
+        lines_removed,
+        joined,
+    )
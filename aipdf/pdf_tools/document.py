@@ -0,0 +1,429 @@
+import math
+import mmap
+import os
+from io import BytesIO
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .fontruns import FontRunStore
+from ..metrics import metrics
+
+if TYPE_CHECKING:
+    from PyPDF2 import PdfReader
+
+    from .cleaning import CleaningReport
+
+
+class TextRun(NamedTuple):
+    """
+    A single run of text as reported by the PyPDF2 text visitor.
+
+    Attributes:
+    ----------
+    text: str
+        The text of the run.
+    font: str
+        The base font name of the run, ie. "/BaseFont" of the font dictionary.
+    size: float
+        The font size of the run.
+    x: float
+        The horizontal position of the run in user space.
+    y: float
+        The vertical position of the run in user space.
+    """
+
+    text: str
+    font: str
+    size: float
+    x: float
+    y: float
+
+
+class PageRecord(NamedTuple):
+    """
+    Everything that is extracted from a single page in one pass.
+
+    Attributes:
+    ----------
+    number: int
+        The zero based index of the page in the document.
+    text: str
+        The plain text of the page, as returned by `page.extract_text()`.
+    runs: List[TextRun]
+        The text runs of the page that have a font and a font size.
+    """
+
+    number: int
+    text: str
+    runs: List[TextRun]
+
+
+def extract_page(page, number: int) -> PageRecord:
+    """
+    Extracts the plain text and the text runs of a single page.
+
+    The content stream of the page is decoded only once, the visitor collects the
+    text runs while `extract_text` builds the plain text.
+
+    Parameters:
+    ----------
+    page: PyPDF2.PageObject
+        The page to extract.
+    number: int
+        The zero based index of the page in the document.
+
+    Returns:
+    ----------
+    PageRecord
+        The extracted page.
+    """
+    runs = []
+
+    def visitor_function(text, cm, tm, fontDict, fontsize):
+        """
+        Collects the text runs of the page, for details on the visitor pattern see:
+        https://pypdf2.readthedocs.io/en/3.0.0/user/extract-text.html#using-a-visitor
+        """
+        if fontDict and fontsize and not text.isspace():
+            # Position of the text origin in user space, ie. tm x cm
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            runs.append(
+                TextRun(text, str(fontDict["/BaseFont"]), float(fontsize), x, y)
+            )
+
+    text = page.extract_text(visitor_text=visitor_function)
+
+    return PageRecord(number, text, runs)
+
+
+class Document:
+    def __init__(self, pages: List[PageRecord]):
+        """
+        A PDF document that has been walked exactly once.
+
+        It holds the per page plain text and the positioned text runs in a columnar
+        `FontRunStore`, so the rest of the pipeline never has to parse the PDF again.
+
+        Parameters
+        ----------
+        pages : List[PageRecord]
+            The extracted pages, in document order.
+        """
+        self.page_texts = [page.text for page in pages]
+        self.runs = FontRunStore().extend(pages)
+        # The key of the document in an `ExtractionCache`, if it went through one
+        self.cache_key: Optional[str] = None
+        # How much the boilerplate stripping of `find_sections` saved, if it ran
+        self.cleaning: Optional["CleaningReport"] = None
+
+    @classmethod
+    def from_parts(cls, page_texts: List[str], runs: FontRunStore) -> "Document":
+        """
+        Builds a document out of already extracted page texts and runs, eg. loaded
+        from a cache.
+        """
+        document = cls([])
+        document.page_texts = page_texts
+        document.runs = runs
+        return document
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_texts)
+
+    @property
+    def text(self) -> str:
+        """
+        Returns the whole text of the document, ie. all the page texts concatenated.
+        """
+        return "".join(self.page_texts)
+
+    @property
+    def fonts(self) -> Dict[str, Dict[str, Union[set, Dict[float, List[str]]]]]:
+        """
+        Returns the font map as a nested dict, prefer querying `runs` directly.
+        """
+        return self.runs.to_fontmap()
+
+
+# Zero based, half open page ranges, a stop of None runs to the last page
+PageRanges = Sequence[Tuple[int, Optional[int]]]
+
+
+def page_ranges(spec: str) -> List[Tuple[int, Optional[int]]]:
+    """
+    Parses a page range spec like "1-10,15,20-", the page numbers are one based and
+    the ranges inclusive like in a print dialog. "20-" runs to the last page and "-5"
+    starts at the first one.
+
+    Parameters:
+    ----------
+    spec: str
+        The comma separated page ranges.
+
+    Returns:
+    ----------
+    List[Tuple[int, Optional[int]]]
+        The zero based, half open page ranges.
+    """
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        start = int(first) if first.strip() else 1
+        stop = (int(last) if last.strip() else None) if dash else start
+        if start < 1 or (stop is not None and stop < start):
+            raise ValueError(f"Invalid page range {part!r}")
+        ranges.append((start - 1, stop))
+    if not ranges:
+        raise ValueError(f"No page in {spec!r}")
+    return ranges
+
+
+def select_pages(ranges: Optional[PageRanges], page_count: int) -> List[int]:
+    """
+    Returns the zero based page numbers in the given page ranges, in document order
+    and without duplicates. Pages past the end of the document are left out.
+    """
+    if ranges is None:
+        return list(range(page_count))
+
+    selected = set()
+    for start, stop in ranges:
+        stop = page_count if stop is None else min(stop, page_count)
+        selected.update(range(start, stop))
+    return sorted(selected)
+
+
+class PdfSource:
+    def __init__(self, pdf_file):
+        """
+        Lazy, page level access to a PDF file.
+
+        A file on disk is memory mapped instead of read, so only the parts PyPDF2
+        actually touches, ie. the cross reference table, the page tree and the content
+        streams of the requested pages, are read from disk. The pages are extracted on
+        demand, a caller that only needs a few of them never parses the others.
+
+        Parameters
+        ----------
+        pdf_file : Union[str, BufferedReader, bytes]
+            The path of the PDF file, the PDF file itself or its content.
+        """
+        self._file = None
+        self._map = None
+        self._reader = None
+
+        if isinstance(pdf_file, bytes):
+            self._stream = BytesIO(pdf_file)
+            return
+
+        if isinstance(pdf_file, (str, os.PathLike)):
+            pdf_file = self._file = open(pdf_file, "rb")
+        try:
+            self._map = mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # In memory files have no file descriptor, and empty files can not be
+            # mapped
+            self._stream = pdf_file
+        else:
+            self._stream = self._map
+
+    @property
+    def reader(self) -> "PdfReader":
+        if self._reader is None:
+            # PyPDF2 is only imported once a PDF is actually parsed, not by a cache hit
+            from PyPDF2 import PdfReader
+
+            self._reader = PdfReader(self._stream)
+        return self._reader
+
+    @property
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    def page(self, number: int) -> PageRecord:
+        """
+        Extracts a single page, by its zero based number.
+        """
+        return extract_page(self.reader.pages[number], number)
+
+    def iter_pages(self, pages: Optional[PageRanges] = None) -> Iterator[PageRecord]:
+        """
+        Yields the extracted pages in the given page ranges, all of them by default.
+        """
+        for number in select_pages(pages, self.page_count):
+            yield self.page(number)
+
+    def close(self):
+        self._reader = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "PdfSource":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_pages(pdf_file, pages: Optional[PageRanges] = None) -> Iterator[PageRecord]:
+    """
+    Yields the pages of a PDF file one at a time, so a caller that does not keep them
+    around only ever holds a single page in memory.
+
+    Parameters:
+    ----------
+    pdf_file: Union[str, BufferedReader]
+        The path of the PDF file or the PDF file itself.
+    pages: Optional[PageRanges]
+        The page ranges to extract, see `page_ranges`, None for every page.
+
+    Yields:
+    ----------
+    PageRecord
+        The extracted pages, in document order.
+    """
+    with PdfSource(pdf_file) as source:
+        yield from source.iter_pages(pages)
+
+
+# The PDF source of a worker process, opened once per worker by `_init_worker` so
+# that the file is neither pickled nor parsed again for every shard.
+_worker_source: Optional[PdfSource] = None
+
+
+def _init_worker(source: Union[str, bytes]):
+    global _worker_source
+    _worker_source = PdfSource(source)
+
+
+def _extract_page_numbers(numbers: List[int]) -> List[PageRecord]:
+    """
+    Extracts the given pages of the worker's PDF source.
+    """
+    return [_worker_source.page(number) for number in numbers]
+
+
+def _read_source(pdf_file) -> Union[str, bytes]:
+    """
+    Returns something a worker process can open the PDF from, ie. a path when there is
+    one and the raw bytes of the file otherwise.
+    """
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return os.fspath(pdf_file)
+
+    pdf_file.seek(0)
+    return pdf_file.read()
+
+
+def ingest_pdf(
+    pdf_file,
+    workers: int = 1,
+    pages_per_shard: Optional[int] = None,
+    cache=None,
+    pages: Optional[PageRanges] = None,
+) -> Document:
+    """
+    Reads a PDF file once and builds a `Document` out of it.
+
+    With more than one worker the pages are sharded into contiguous page ranges and
+    extracted in a process pool, the shards are merged back in page order so the
+    result is the same as the serial one.
+
+    With an `ExtractionCache` the document is loaded from the cache when the same file
+    has been ingested before by the same version, and stored in it otherwise.
+
+    Parameters:
+    ----------
+    pdf_file: Union[str, BufferedReader]
+        The path of the PDF file or the PDF file itself.
+    workers: int
+        The number of worker processes to use, 1 extracts the pages serially.
+    pages_per_shard: Optional[int]
+        The number of pages a worker extracts at a time, by default the pages are
+        split into about four shards per worker to even out slow pages.
+    cache: Optional[ExtractionCache]
+        The cache of ingested documents, None to always extract the pages.
+    pages: Optional[PageRanges]
+        The page ranges to extract, see `page_ranges`, None for every page. The other
+        pages are never parsed.
+
+    Returns:
+    ----------
+    Document
+        The ingested document.
+    """
+    key = None
+    if cache is not None:
+        key = cache.key(pdf_file, pages)
+        with metrics.span("extraction_cache_load"):
+            document = cache.load(key)
+        if document is not None:
+            metrics.incr("extraction_cache_hits")
+            return document
+        metrics.incr("extraction_cache_misses")
+
+    with metrics.span("extraction"):
+        document = Document(
+            _extract_pages(pdf_file, workers, pages_per_shard, pages)
+        )
+
+    metrics.incr("pages", document.page_count)
+
+    if cache is not None:
+        cache.store(key, document)
+        document.cache_key = key
+    return document
+
+
+def _extract_pages(
+    pdf_file,
+    workers: int,
+    pages_per_shard: Optional[int],
+    pages: Optional[PageRanges],
+) -> List[PageRecord]:
+    if workers <= 1:
+        return list(iter_pages(pdf_file, pages))
+
+    source = _read_source(pdf_file)
+    with PdfSource(source) as reader:
+        numbers = select_pages(pages, reader.page_count)
+    if not numbers:
+        return []
+
+    if pages_per_shard is None:
+        pages_per_shard = max(1, math.ceil(len(numbers) / (workers * 4)))
+
+    shards = [
+        numbers[start : start + pages_per_shard]
+        for start in range(0, len(numbers), pages_per_shard)
+    ]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    records = []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(source,)
+    ) as executor:
+        # map keeps the order of the shards, so the pages come back in page order
+        for shard in executor.map(_extract_page_numbers, shards):
+            records.extend(shard)
+
+    return records
@@ -0,0 +1,199 @@
+from array import array
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+# The typed array columns of a `FontRunStore` and their type codes
+COLUMNS = {
+    "font_ids": "I",
+    "sizes": "f",
+    "pages": "I",
+    "xs": "f",
+    "ys": "f",
+    "starts": "Q",
+    "ends": "Q",
+}
+
+
+def to_float32(value: float) -> float:
+    """
+    Rounds a float to the nearest float32, the precision the font sizes are stored in.
+    """
+    return array("f", [value])[0]
+
+
+class FontRunStore:
+    """
+    A columnar store of the text runs of a document.
+
+    Every run is one row spread over typed arrays: an interned font id, a float32 font
+    size, the page number, the position and the offsets of its text in one shared
+    text buffer. Compared to a dict of sets and lists of strings this takes a
+    fraction of the memory and scanning it does not chase pointers.
+    """
+
+    __slots__ = (
+        "fonts",
+        "font_ids",
+        "sizes",
+        "pages",
+        "xs",
+        "ys",
+        "starts",
+        "ends",
+        "_font_index",
+        "_parts",
+        "_length",
+        "_text",
+        "_groups",
+    )
+
+    def __init__(self):
+        # fonts[font_id] is the base font name of the id
+        self.fonts: List[str] = []
+        self.font_ids = array(COLUMNS["font_ids"])
+        self.sizes = array(COLUMNS["sizes"])
+        self.pages = array(COLUMNS["pages"])
+        self.xs = array(COLUMNS["xs"])
+        self.ys = array(COLUMNS["ys"])
+        self.starts = array(COLUMNS["starts"])
+        self.ends = array(COLUMNS["ends"])
+
+        self._font_index: Dict[str, int] = dict()
+        self._parts: List[str] = []
+        self._length = 0
+        self._text = ""
+        self._groups = None
+
+    @classmethod
+    def from_columns(
+        cls, fonts: List[str], columns: Dict[str, array], text: str
+    ) -> "FontRunStore":
+        """
+        Builds a store out of already filled columns, eg. loaded from a cache.
+
+        Parameters
+        ----------
+        fonts : List[str]
+            The base font names, indexed by font id.
+        columns : Dict[str, array]
+            The font_ids, sizes, pages, xs, ys, starts and ends columns.
+        text : str
+            The shared text buffer the starts and ends point into.
+        """
+        store = cls()
+        for font in fonts:
+            store.intern_font(font)
+        for name in COLUMNS:
+            setattr(store, name, columns[name])
+        store._text = text
+        store._length = len(text)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.font_ids)
+
+    def intern_font(self, font: str) -> int:
+        """
+        Returns the id of the font, registering it if it is new.
+        """
+        font_id = self._font_index.get(font)
+        if font_id is None:
+            font_id = len(self.fonts)
+            self.fonts.append(font)
+            self._font_index[font] = font_id
+        return font_id
+
+    def append(self, text: str, font: str, size: float, page: int, x: float, y: float):
+        """
+        Appends a run to the store, runs are expected to be appended in document order.
+        """
+        self.font_ids.append(self.intern_font(font))
+        self.sizes.append(size)
+        self.pages.append(page)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.starts.append(self._length)
+        self._length += len(text)
+        self.ends.append(self._length)
+        self._parts.append(text)
+        self._groups = None
+
+    def extend(self, pages: Iterable) -> "FontRunStore":
+        """
+        Appends the runs of the given `PageRecord`s.
+        """
+        for page in pages:
+            for run in page.runs:
+                self.append(run.text, run.font, run.size, page.number, run.x, run.y)
+        return self
+
+    @property
+    def text(self) -> str:
+        """
+        The shared text buffer, the text of run i is text[starts[i]:ends[i]].
+        """
+        if self._parts:
+            # Join the pending parts once, instead of growing a string run by run
+            self._text = "".join([self._text] + self._parts)
+            self._parts = []
+        return self._text
+
+    def run_text(self, i: int) -> str:
+        return self.text[self.starts[i] : self.ends[i]]
+
+    def groups(self) -> Dict[Tuple[int, float], array]:
+        """
+        Returns the indices of the runs of every (font id, size), in order of first
+        appearance in the document.
+        """
+        if self._groups is None:
+            groups = dict()
+            for i, key in enumerate(zip(self.font_ids, self.sizes)):
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = array("I")
+                group.append(i)
+            self._groups = groups
+        return self._groups
+
+    def families(self) -> List[str]:
+        """
+        Returns the base font names of the document, in order of first appearance.
+        """
+        return list(self.fonts)
+
+    def font_sizes(self, family: str) -> Set[float]:
+        """
+        Returns the sizes the given font family is used with.
+        """
+        font_id = self._font_index.get(family)
+        return {size for (f, size) in self.groups() if f == font_id}
+
+    def indices(self, family: str, size: float) -> array:
+        """
+        Returns the indices of the runs with the given font family and size.
+        """
+        font_id = self._font_index.get(family)
+        return self.groups().get((font_id, to_float32(size)), array("I"))
+
+    def texts(self, family: str, size: float) -> List[str]:
+        """
+        Returns the texts of the runs with the given font family and size, in
+        document order.
+        """
+        text = self.text
+        return [text[self.starts[i] : self.ends[i]] for i in self.indices(family, size)]
+
+    def to_fontmap(self) -> Dict[str, Dict[str, object]]:
+        """
+        Returns the runs as the nested dict font map `extract_fontmap_from_pdf` used to
+        build, ie. fonts[family]["fontsizes"] and fonts[family]["texts"][size].
+        """
+        fonts = dict()
+        for (font_id, size), indices in self.groups().items():
+            family = self.fonts[font_id]
+            if family not in fonts:
+                fonts[family] = {"fontsizes": set(), "texts": dict()}
+            fonts[family]["fontsizes"].add(size)
+            fonts[family]["texts"][size] = [self.run_text(i) for i in indices]
+        return fonts
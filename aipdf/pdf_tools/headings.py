@@ -0,0 +1,235 @@
+import re
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+from .fontruns import FontRunStore
+from .heuristics import KNOWN_TEXTS
+
+KNOWN_HEADINGS = KNOWN_TEXTS + [
+    "acknowledgments",
+    "appendix",
+    "background",
+    "conclusions",
+    "discussion",
+    "evaluation",
+    "experiments",
+    "limitations",
+    "method",
+    "related work",
+    "results",
+]
+
+# "3.", "3.2 ", "IV. ", "A. " followed by a capitalized word
+_NUMBERING = re.compile(
+    r"^(?:(\d{1,2}(?:\.\d{1,2})*)\.?|[IVX]{1,4}\.?|[A-Z]\.)\s+[A-Z]"
+)
+_DIGITS = re.compile(r"\d+")
+
+
+class Heading(NamedTuple):
+    text: str
+    # 1 for the top level headings, 2 for their subsections and so on
+    level: int
+    score: float
+    page: int
+
+
+class HeadingClassification(NamedTuple):
+    headings: List[Heading]
+    # How sure the classifier is about the headings as a whole, between 0 and 1
+    confidence: float
+
+
+def classify_headings(
+    runs: FontRunStore, threshold: float = 0.5, max_length: int = 120
+) -> HeadingClassification:
+    """
+    Finds the headings of a document locally, without asking the AI.
+
+    The body style is the (font, size) holding the most text, its runs are never
+    headings. The short runs of the other styles are scored on:
+
+    - their size relative to the body and whether their font differs from the body,
+    - a numbering prefix like "3.", "3.2" or "IV.", and known section titles,
+    - their frequency across pages, running headers and footers repeat on every page,
+    - their position, the top and bottom margins hold headers, footers and page
+      numbers,
+    - their shape, ie. length, capitalization, punctuation and digits,
+    - the other runs of their style, headings share their style with numbered or
+      known headings.
+
+    The level of a heading is the depth of its numbering, or the rank of its style by
+    size when it is not numbered.
+
+    Parameters
+    ----------
+    runs : FontRunStore
+        The text runs of the document.
+    threshold : float
+        The minimum score of a heading.
+    max_length : int
+        Runs longer than this many characters are never headings.
+
+    Returns
+    -------
+    HeadingClassification
+        The headings in document order, and the confidence of the classification.
+    """
+    if not len(runs):
+        return HeadingClassification([], 0.0)
+
+    text = runs.text
+    starts, ends = runs.starts, runs.ends
+
+    # One pass over the runs, grouped by style, to find the body style
+    styles = runs.groups()
+    style_chars = {
+        key: sum(ends[i] - starts[i] for i in indices)
+        for key, indices in styles.items()
+    }
+    body_key = max(style_chars, key=style_chars.get)
+    body_font, body_size = body_key
+
+    # The runs of the body style can not score as headings, only the other styles are
+    # looked at closely
+    text_pages: Dict[str, Set[int]] = dict()
+    candidates = []
+    for key, indices in styles.items():
+        if key == body_key:
+            continue
+        for i in indices:
+            if ends[i] - starts[i] > max_length:
+                continue
+            stripped = text[starts[i] : ends[i]].strip()
+            if len(stripped) < 2:
+                continue
+
+            # Running headers and footers often only differ by their page number
+            normalized = _DIGITS.sub("#", stripped.lower())
+            text_pages.setdefault(normalized, set()).add(runs.pages[i])
+            candidates.append((i, stripped, key, normalized))
+
+    # Back to document order
+    candidates.sort()
+
+    # The document may be restricted to some page ranges
+    first_page = runs.pages[0]
+    page_count = len(set(runs.pages))
+    run_count = len(runs)
+    y_min, y_max = min(runs.ys), max(runs.ys)
+    margin = (y_max - y_min) * 0.06
+    largest_size = max(size for _, size in styles)
+
+    scored = []
+    for i, stripped, key, normalized in candidates:
+        font_id, size = key
+        ratio = size / body_size if body_size else 1.0
+        lowered = stripped.lower()
+        numbering = _NUMBERING.match(stripped)
+        known = len(stripped) <= 50 and any(k in lowered for k in KNOWN_HEADINGS)
+
+        score = 0.0
+        if ratio >= 1.15:
+            score += 0.35
+        elif ratio >= 1.03:
+            score += 0.2
+        elif ratio < 0.97:
+            score -= 0.4
+
+        if font_id != body_font:
+            score += 0.25
+        elif ratio < 1.03:
+            # Same font and size as the body, ie. body text
+            score -= 0.5
+
+        if numbering:
+            score += 0.3
+        if known:
+            score += 0.3
+
+        y = runs.ys[i]
+        in_margin = y < y_min + margin or y > y_max - margin
+        if in_margin:
+            score -= 0.15
+        if page_count >= 3:
+            # Running headers and footers, in the margins or on most of the pages
+            pages = len(text_pages[normalized])
+            if pages > max(2, (0.3 if in_margin else 0.6) * page_count):
+                score -= 0.6
+        if len(styles[key]) > 0.3 * run_count:
+            score -= 0.3
+
+        if stripped[0].islower():
+            score -= 0.3
+        if stripped[-1] in ",;" or (stripped[-1] == "." and len(stripped) > 40):
+            score -= 0.2
+        if sum(c.isdigit() for c in stripped) * 2 > len(stripped):
+            # Page numbers, table cells and the like
+            score -= 0.5
+        if len(stripped) > 80:
+            score -= 0.2
+
+        if (
+            size == largest_size
+            and len(styles[key]) == 1
+            and runs.pages[i] == first_page
+            and not (numbering or known)
+        ):
+            # The title of the document
+            score -= 0.4
+
+        scored.append((i, stripped, key, score, numbering, known))
+
+    # Headings share their style, a style whose runs are mostly numbered or known
+    # headings lifts its other runs, eg. an unnumbered "Related Work"
+    style_support: Dict[Tuple[int, float], List[int]] = dict()
+    for _, _, key, score, numbering, known in scored:
+        support = style_support.setdefault(key, [0, 0])
+        support[0] += 1
+        support[1] += bool(numbering or known)
+
+    heading_styles = set()
+    headings = []
+    ambiguous = 0
+    relevant = 0
+    supported = 0
+    for i, stripped, key, score, numbering, known in scored:
+        total, hits = style_support[key]
+        if hits >= 2 and hits * 2 >= total:
+            score += 0.2
+        score = min(1.0, max(0.0, score))
+
+        if score >= threshold - 0.2:
+            relevant += 1
+            if score < threshold + 0.2:
+                ambiguous += 1
+        if score < threshold:
+            continue
+
+        heading_styles.add(key)
+        supported += bool(numbering or known)
+        depth = (
+            numbering.group(1).count(".") + 1
+            if numbering and numbering.group(1)
+            else None
+        )
+        headings.append((stripped, key, score, runs.pages[i], depth))
+
+    if len(headings) < 2:
+        return HeadingClassification([], 0.0)
+
+    # Unnumbered headings get the rank of their style, the largest style first
+    style_levels = {
+        key: level
+        for level, key in enumerate(
+            sorted(heading_styles, key=lambda key: -key[1]), start=1
+        )
+    }
+
+    confidence = (1 - ambiguous / relevant) * (0.5 + 0.5 * supported / len(headings))
+    return HeadingClassification(
+        [
+            Heading(stripped, depth or style_levels[key], score, page)
+            for stripped, key, score, page, depth in headings
+        ],
+        confidence,
+    )
@@ -1,54 +1,65 @@
-from typing import Dict, List, Set, Tuple, Union
+from typing import Dict, Tuple
+
+from .fontruns import FontRunStore
+
+# Section titles found in most scientific papers
+KNOWN_TEXTS = [
+    "abstract",
+    "introduction",
+    "approach",
+    "methodology",
+    "conclusion",
+    "references",
+    "future work",
+    "acknowledgements",
+]
 
 
 def try_to_find_known_text_that_can_be_a_subtitle(
-    fontmap: Dict[str, Dict[str, Union[List[float], Set[float], Dict[float, List[str]]]]]
+    runs: FontRunStore,
 ) -> Tuple[str, float]:
     """
     Tries to find known text that can be a subtitle.
 
+    The runs are scanned once, counting the known texts per (font family, font size).
+
     Parameters:
     ----------
 
-    fontmap: Dict[str, Dict[str, Union[List[float], Set[float], Dict[float, List[str]]]]]
-        The fontmap that is extracted from the PDF file.
+    runs: FontRunStore
+        The text runs that are extracted from the PDF file.
 
     Returns:
     ----------
     Tuple[str, float]
         The font family and font size that is most likely to be a subtitle.
     """
-    known_texts = [
-        "abstract",
-        "introduction",
-        "approach",
-        "methodology",
-        "conclusion",
-        "references",
-        "future work",
-        "acknowledgements",
-    ]
+    hit_counts: Dict[Tuple[int, float], int] = dict()
+    text = runs.text
 
-    top_hit_font_size = 0
-    top_hit_font_family = ""
+    for i, key in enumerate(zip(runs.font_ids, runs.sizes)):
+        hit_count = hit_counts.setdefault(key, 0)
 
-    max_hit_count = -1
+        start, end = runs.starts[i], runs.ends[i]
+        if end - start > 50 or end - start < 5:
+            # Skip the text if it's too long or too short to be a subtitle
+            continue
 
-    for font_family in fontmap.keys():
-        for fontsize in fontmap[font_family]["fontsizes"]:
-            hit_count = 0
+        lowered = text[start:end].lower()
+        for known_text in KNOWN_TEXTS:
+            if known_text in lowered:
+                hit_count += 1
+        hit_counts[key] = hit_count
 
-            for text in fontmap[font_family]["texts"][fontsize]:
-                if len(text) > 50 or len(text) < 5:
-                    # Skip the text if it's too long or too short to be a subtitle
-                    continue
+    top_hit_font_size = 0
+    top_hit_font_family = ""
 
-                for known_text in known_texts:
-                    if known_text in text.lower():
-                        hit_count += 1
+    max_hit_count = -1
 
-            if hit_count > max_hit_count:
-                max_hit_count = hit_count
-                top_hit_font_size = fontsize
-                top_hit_font_family = font_family
+    # The groups are in order of first appearance, so ties go to the earliest font
+    for (font_id, fontsize), hit_count in hit_counts.items():
+        if hit_count > max_hit_count:
+            max_hit_count = hit_count
+            top_hit_font_size = fontsize
+            top_hit_font_family = runs.fonts[font_id]
     return top_hit_font_family, top_hit_font_size
@@ -1,37 +1,100 @@
-from PyPDF2 import PdfReader
+import bisect
+import re
 from io import BufferedReader
+from typing import Dict, List, Tuple
 
+from .document import ingest_pdf
 
-def read_whole_text(pdf_file: BufferedReader):
+
+def read_whole_text(pdf_file: BufferedReader, workers: int = 1, cache=None):
     """
     Reads the whole text from a PDF file.
 
+    Note: This parses the whole PDF, prefer `ingest_pdf` when the font map is needed too.
+
     Parameters:
     ----------
     pdf_file: BufferedReader
         The PDF file that is read.
+    workers: int
+        The number of worker processes to extract the pages with.
+    cache: Optional[ExtractionCache]
+        The cache of ingested documents, None to always extract the pages.
 
     Returns:
     ----------
     str
         The text that is extracted from the PDF file.
     """
-    reader = PdfReader(pdf_file)
-    text_pages = []
+    return ingest_pdf(pdf_file, workers=workers, cache=cache).text
 
-    for page in reader.pages:
-        text_pages.append(page.extract_text())
 
-    # Concatenate all the text pages into a single string
-    text_pages = "".join(text_pages)
+def find_section_spans(
+    text: str, section_headers: List[str]
+) -> Dict[str, Tuple[int, int]]:
+    """
+    Locates the sections in the text in a single scan.
 
-    return text_pages
+    All the headers are searched at once with one compiled alternation, then every
+    header is assigned to its first occurrence after the previous located header.
+    Headers that can not be found are left out, a header that occurs more than once
+    only gets the first occurrence, so the function never fails on odd documents.
+
+    Parameters:
+    ----------
+
+    text: str
+        The text that is split into sections.
+    section_headers: List[str]
+        The section headers in document order.
+
+    Returns:
+    ----------
+    Dict[str, Tuple[int, int]]
+        The start and end offsets of the body of every located section, ie. the
+        section text is text[start:end] and does not include its header.
+    """
+    headers = [header for header in dict.fromkeys(section_headers) if header]
+    if not headers:
+        return dict()
+
+    # Longest headers first, so a header that contains another one wins
+    pattern = re.compile(
+        "|".join(re.escape(header) for header in sorted(headers, key=len, reverse=True))
+    )
+
+    occurrences = dict()
+    for match in pattern.finditer(text):
+        occurrences.setdefault(match.group(), []).append(match.start())
+
+    # Walk the headers in document order, picking the first occurrence of each one
+    # after the previous located header
+    located = []
+    position = -1
+    for header in headers:
+        starts = occurrences.get(header)
+        if not starts:
+            continue
+        i = bisect.bisect_right(starts, position)
+        if i == len(starts):
+            continue
+        position = starts[i]
+        located.append((header, position))
+
+    spans = dict()
+    for i, (header, start) in enumerate(located):
+        end = located[i + 1][1] if i + 1 < len(located) else len(text)
+        spans[header] = (start + len(header), end)
+
+    return spans
 
 
 def split_text_into_sections(text: str, section_headers: list):
     """
     Splits the text into sections using the section headers.
 
+    Headers that are not found in the text are left out of the result.
+
     Parameters:
     ----------
 
@@ -45,15 +108,7 @@ def split_text_into_sections(text: str, section_headers: list):
     dict of str, str
         The sections that are extracted from the text.
     """
-    sections = dict()
-
-    for i in range(len(section_headers)):
-        if i < len(section_headers) - 1:
-            first_division = text.split(section_headers[i])[1]
-            second_division = first_division.split(section_headers[i + 1])[0]
-            sections[section_headers[i]] = second_division
-        else:
-            first_division = text.split(section_headers[i])[1]
-            sections[section_headers[i]] = first_division
-
-    return sections
+    return {
+        header: text[start:end]
+        for header, (start, end) in find_section_spans(text, section_headers).items()
+    }
@@ -0,0 +1,629 @@
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .ai_helpers import (
+    accept_summary,
+    filter_section_names,
+    summarize_section,
+    summarize_sections_within_budget,
+)
+from .llm_backends.cachedBackend import CachedBackend
+from .llm_backends.cascadeBackend import CascadeBackend
+from .llm_backends.llmBackendBase import LLMBase
+from .llm_backends.modelRegistry import registry
+from .llm_backends.openRouter import OpenRouter
+from .llm_backends import openrouter_models
+from .llm_backends.rateLimitedBackend import RateLimitedBackend
+from .llm_backends.rateLimiter import RateLimiter
+from .llm_backends.resilientBackend import ResilientBackend
+from .llm_backends.routerBackend import RouterBackend
+from .metrics import metrics
+from .pdf_tools.cache import ExtractionCache
+from .pdf_tools.cleaning import (
+    PageFurniture,
+    clean_pages,
+    collapse_spaces,
+    normalize_text,
+)
+from .pdf_tools.document import Document, PageRanges, PageRecord, iter_pages
+from .pdf_tools.fontruns import FontRunStore, to_float32
+from .pdf_tools.headings import classify_headings
+from .pdf_tools.heuristics import try_to_find_known_text_that_can_be_a_subtitle
+from .pdf_tools.pdfutils import find_section_spans
+from .tokens import estimate_tokens
+
+
+def is_summarizable(section: str) -> bool:
+    """
+    Returns whether a section is worth summarizing, ie. it is not references or
+    appendix.
+    """
+    return "references" not in section.lower() and "appendix" not in section.lower()
+
+
+def default_concurrency(models: Sequence[str]) -> int:
+    """
+    Returns the number of calls the given models serve at the same time, according to
+    the `ModelRegistry`.
+    """
+    return sum(registry.get(name).max_concurrency for name in models)
+
+
+def create_backend(
+    concurrency: Optional[int] = None,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    cache_path: Optional[str] = None,
+    models: Sequence[str] = ("Mixtral8x7bInstructBeta",),
+    hedge: bool = False,
+    timeout: Optional[float] = 180.0,
+    cascade: bool = False,
+) -> LLMBase:
+    """
+    Creates the default backend of the pipeline, rate limited and optionally cached.
+
+    Every model is rate limited and sized with its own capabilities from the
+    `ModelRegistry`, so every model is driven at its own limits.
+
+    Parameters
+    ----------
+    concurrency : Optional[int]
+        The number of calls every model serves at the same time, the other calls
+        wait. By default the `max_concurrency` of the model.
+    requests_per_minute : Optional[float]
+        A requests per minute limit of the account, shared by all the models on top
+        of their own limits. None for no account limit.
+    tokens_per_minute : Optional[float]
+        A tokens per minute limit of the account, shared by all the models on top of
+        their own limits. None for no account limit.
+    cache_path : Optional[str]
+        Where the responses are cached, None to not cache them.
+    models : Sequence[str]
+        The names of the `openrouter_models` to use, with more than one model the
+        calls are routed to the fastest healthy one.
+    hedge : bool
+        Whether to hedge slow calls on another model, see `RouterBackend`. It can
+        not be used with `cascade`.
+    timeout : Optional[float]
+        The number of seconds a call may take before it is retried, None for no
+        timeout. Server errors are retried too and every model has a circuit breaker,
+        see `ResilientBackend`. With several models, every model gets an equal share
+        of the timeout and one retry before the call moves to the next model.
+    cascade : bool
+        With more than one model, send every call to the fastest model according to
+        the `ModelRegistry` and escalate the summaries failing `accept_summary` to
+        the slower ones in turn, instead of routing the calls, see `CascadeBackend`.
+
+    Returns
+    -------
+    LLMBase
+        The backend.
+    """
+    if hedge and cascade:
+        raise ValueError("Hedging and the cascade can not be used together")
+
+    account_limiter = None
+    if requests_per_minute is not None or tokens_per_minute is not None:
+        account_limiter = RateLimiter(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+        )
+
+    # With several models a failing model is left to the router or the cascade, which
+    # move on to the next model, instead of being retried for minutes: every model
+    # gets its share of the timeout and a single retry
+    route_timeout, max_retries = timeout, 4
+    if len(models) > 1:
+        route_timeout = timeout / len(models) if timeout else None
+        max_retries = 1
+
+    backends = []
+    for name in models:
+        model = getattr(openrouter_models, name)()
+        capabilities = model.capabilities
+        max_concurrency = concurrency or capabilities.max_concurrency
+        backend = RateLimitedBackend(
+            # The rate limit errors are left to the rate limiter, it backs off for
+            # every caller at once
+            ResilientBackend(
+                OpenRouter(model, pool_size=max_concurrency),
+                timeout=route_timeout,
+                max_retries=max_retries,
+                retry_rate_limits=False,
+            ),
+            RateLimiter(
+                requests_per_minute=capabilities.requests_per_minute,
+                tokens_per_minute=capabilities.tokens_per_minute,
+            ),
+            max_concurrency=max_concurrency,
+        )
+        if account_limiter is not None:
+            backend = RateLimitedBackend(backend, account_limiter)
+        backends.append(backend)
+
+    if len(backends) == 1:
+        backend = backends[0]
+    elif cascade:
+        # The fastest model first, the order of the models breaks the ties
+        backend = CascadeBackend(
+            sorted(
+                backends,
+                key=lambda backend: -backend.model.capabilities.tokens_per_second,
+            ),
+            accept=accept_summary,
+        )
+    else:
+        backend = RouterBackend(backends, hedge=hedge)
+    if cache_path:
+        # Cache outside of the rate limiter, so cache hits are not throttled
+        backend = CachedBackend(backend, path=cache_path)
+    return backend
+
+
+def find_sections(
+    document: Document,
+    backend: LLMBase,
+    is_verbose: bool = False,
+    cache: Optional[ExtractionCache] = None,
+    min_confidence: float = 0.5,
+    max_level: int = 1,
+    clean: bool = True,
+) -> Dict[str, str]:
+    """
+    Finds the sections of a document, ie. classifies its headings and splits the text
+    into sections.
+
+    The text is cleaned before it is split, see `clean_pages`, and the report of the
+    cleaning is kept in `document.cleaning`.
+
+    The headings are classified locally, see `classify_headings`. Only when the
+    classification is not confident enough, the header font is detected and the AI
+    filters the header candidates.
+
+    Parameters
+    ----------
+    document : Document
+        The ingested document.
+    backend : LLMBase
+        The backend to use for the AI operations.
+    cache : Optional[ExtractionCache]
+        The cache the document was ingested through, the section spans are cached
+        along with it.
+    min_confidence : float
+        The confidence the local classification needs for the AI filter to be
+        skipped.
+    max_level : int
+        The deepest heading level that starts a section when the headings are
+        classified locally, the deeper ones stay in the text of their section.
+    clean : bool
+        Whether to remove the running headers, footers and page numbers, rejoin the
+        hyphenated words and collapse the whitespace of the text.
+
+    Returns
+    -------
+    Dict[str, str]
+        The section names and their texts, in document order.
+    """
+    with metrics.span("header_detection"):
+        classification = classify_headings(document.runs)
+        headings = list(
+            dict.fromkeys(
+                heading.text
+                for heading in classification.headings
+                if heading.level <= max_level
+            )
+        )
+
+    if classification.confidence >= min_confidence and len(headings) >= 2:
+        metrics.incr("section_filter_skipped")
+        candidates = sections_to_process = headings
+    else:
+        with metrics.span("header_detection"):
+            family, size = try_to_find_known_text_that_can_be_a_subtitle(
+                document.runs
+            )
+            candidates = document.runs.texts(family, size)
+
+        # Filter the sections
+        with metrics.span("section_filter"):
+            sections_to_process = (
+                filter_section_names(candidates, backend, is_verbose) or []
+            )
+
+    if clean:
+        with metrics.span("cleaning"):
+            text, document.cleaning = clean_pages(document.page_texts)
+            # The whitespace of the headers is collapsed like the one of the text
+            candidates = [collapse_spaces(header) for header in candidates]
+            sections_to_process = [
+                collapse_spaces(section) for section in sections_to_process
+            ]
+        metrics.incr("tokens_before_cleaning", document.cleaning.tokens_before)
+        metrics.incr("tokens_saved_by_cleaning", document.cleaning.tokens_saved)
+        if is_verbose:
+            import rich
+
+            rich.print(
+                f"Cleaning removed {document.cleaning.lines_removed} lines, "
+                f"saving {document.cleaning.tokens_saved} of "
+                f"{document.cleaning.tokens_before} tokens"
+            )
+    else:
+        text = document.text
+
+    with metrics.span("split"):
+        use_cache = cache is not None and document.cache_key is not None
+        # The spans of the cleaned text are not the ones of the raw text
+        spans_key = f"{document.cache_key}-clean" if clean else document.cache_key
+        spans = cache.load_spans(spans_key, candidates) if use_cache else None
+        if spans is None:
+            spans = find_section_spans(text, candidates)
+            if use_cache:
+                cache.store_spans(spans_key, candidates, spans)
+        sections_text = {
+            header: text[start:end] for header, (start, end) in spans.items()
+        }
+
+    # Sections whose header could not be located in the text are skipped
+    sections = {
+        section: sections_text[section]
+        for section in sections_to_process
+        if section in sections_text
+    }
+    metrics.incr("sections", len(sections))
+    return sections
+
+
+def summarize_document(
+    document: Document,
+    backend: LLMBase,
+    max_concurrency: int = 4,
+    is_verbose: bool = False,
+    on_result: Optional[Callable[[str, str], None]] = None,
+    cache: Optional[ExtractionCache] = None,
+    clean: bool = True,
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Finds the sections of a document and summarizes them.
+
+    Parameters
+    ----------
+    document : Document
+        The ingested document.
+    backend : LLMBase
+        The backend to use for the AI operations.
+    max_concurrency : int
+        The maximum number of summaries generated at the same time.
+    on_result : Optional[Callable[[str, str], None]]
+        Called with the section name and its summary as soon as a summary is ready.
+    cache : Optional[ExtractionCache]
+        The cache the document was ingested through.
+    clean : bool
+        Whether to strip the boilerplate of the text, see `find_sections`.
+
+    Returns
+    -------
+    Tuple[Dict[str, str], Dict[str, str]]
+        The sections and their texts, and the sections and their summaries. Sections
+        that are not summarized, ie. references, have an empty summary.
+    """
+    sections = find_sections(document, backend, is_verbose, cache, clean=clean)
+
+    summaries = {section: "" for section in sections}
+    with metrics.span("summarization"):
+        summaries.update(
+            summarize_sections_within_budget(
+                {
+                    section: text
+                    for section, text in sections.items()
+                    if is_summarizable(section)
+                },
+                backend,
+                max_concurrency=max_concurrency,
+                is_verbose=is_verbose,
+                on_result=on_result,
+            )
+        )
+    return sections, summaries
+
+
+def detect_header_font(
+    pages: Iterator[PageRecord], sample_pages: int = 10
+) -> Tuple[str, float, List[PageRecord]]:
+    """
+    Detects the font of the section headers from the first pages of the document.
+
+    Parameters
+    ----------
+    pages : Iterator[PageRecord]
+        The pages of the document, only the first `sample_pages` are consumed.
+    sample_pages : int
+        The number of pages to detect the header font from.
+
+    Returns
+    -------
+    Tuple[str, float, List[PageRecord]]
+        The font family and size of the headers, and the pages that were consumed so
+        that the caller can feed them to the rest of the pipeline.
+    """
+    sampled = list(itertools.islice(pages, sample_pages))
+    family, size = try_to_find_known_text_that_can_be_a_subtitle(
+        FontRunStore().extend(sampled)
+    )
+    return family, size, sampled
+
+
+def iter_sections(
+    pages: Iterable[PageRecord],
+    family: str,
+    size: float,
+    max_section_chars: Optional[int] = None,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Assembles the sections of the document from a stream of pages.
+
+    A section is yielded as soon as the header of the next one shows up, so only the
+    text of the current section is held in memory. Sections larger than
+    `max_section_chars` are yielded in parts, named "<header> (part n)".
+
+    Parameters
+    ----------
+    pages : Iterable[PageRecord]
+        The pages of the document, in document order.
+    family : str
+        The font family of the section headers.
+    size : float
+        The font size of the section headers.
+    max_section_chars : Optional[int]
+        The maximum number of characters buffered for a section, None for no limit.
+
+    Yields
+    ------
+    Tuple[str, str]
+        The section names and their texts, in document order.
+    """
+    size = to_float32(size)
+
+    header = None
+    part = 0
+    buffer: List[str] = []
+    buffered = 0
+
+    def section_name() -> str:
+        return header if part == 0 else f"{header} (part {part + 1})"
+
+    for page in pages:
+        cursor = 0
+        for run in page.runs:
+            # Headers are short runs in the header font, the same bounds the header
+            # font detection uses
+            if (
+                run.font != family
+                or to_float32(run.size) != size
+                or not 5 <= len(run.text) <= 50
+            ):
+                continue
+
+            position = page.text.find(run.text, cursor)
+            if position < 0:
+                continue
+
+            if header is not None:
+                buffer.append(page.text[cursor:position])
+                text = "".join(buffer)
+                # A section that was already flushed in parts may have nothing left
+                if part == 0 or text.strip():
+                    yield section_name(), text
+
+            # The text before the first header, ie. title and authors, is dropped
+            header = run.text
+            part = 0
+            buffer = []
+            buffered = 0
+            cursor = position + len(run.text)
+
+        if header is None:
+            continue
+
+        buffer.append(page.text[cursor:])
+        buffered += len(page.text) - cursor
+
+        if max_section_chars is not None and buffered > max_section_chars:
+            yield section_name(), "".join(buffer)
+            part += 1
+            buffer = []
+            buffered = 0
+
+    if header is not None:
+        text = "".join(buffer)
+        if part == 0 or text.strip():
+            yield section_name(), text
+
+
+def stream_summaries(
+    sections: Iterable[Tuple[str, str]],
+    backend: LLMBase,
+    max_in_flight: int = 4,
+    is_verbose: bool = False,
+    summarize: Callable[[str, LLMBase, bool], str] = summarize_section,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Summarizes a stream of sections, a summary request goes out as soon as a section
+    is yielded by `sections`.
+
+    At most `max_in_flight` sections wait for their summary, once that many are
+    pending the stream stops pulling sections, ie. stops reading pages, until the
+    oldest one is done. The summaries are yielded in document order.
+
+    Parameters
+    ----------
+    sections : Iterable[Tuple[str, str]]
+        The section names and their texts, in document order.
+    backend : LLMBase
+        The backend to use for the AI operations.
+    max_in_flight : int
+        The maximum number of pending summaries.
+    summarize : Callable[[str, LLMBase, bool], str]
+        The function that summarizes one section.
+
+    Yields
+    ------
+    Tuple[str, str]
+        The section names and their summaries, in document order.
+    """
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for section, text in sections:
+            if not is_summarizable(section):
+                continue
+
+            pending.append(
+                (section, executor.submit(summarize, text, backend, is_verbose))
+            )
+
+            if len(pending) >= max_in_flight:
+                section, future = pending.popleft()
+                yield section, future.result()
+
+        while pending:
+            section, future = pending.popleft()
+            yield section, future.result()
+
+
+def _strip_furniture(
+    pages: Iterable[PageRecord], furniture: PageFurniture
+) -> Iterator[PageRecord]:
+    for page in pages:
+        text, removed = furniture.strip(page.text)
+        if removed:
+            metrics.incr(
+                "tokens_saved_by_cleaning",
+                estimate_tokens(page.text) - estimate_tokens(text),
+            )
+            page = page._replace(text=text)
+        yield page
+
+
+def _normalize_sections(
+    sections: Iterable[Tuple[str, str]]
+) -> Iterator[Tuple[str, str]]:
+    for section, text in sections:
+        normalized, _ = normalize_text(text)
+        metrics.incr(
+            "tokens_saved_by_cleaning",
+            estimate_tokens(text) - estimate_tokens(normalized),
+        )
+        yield section, normalized
+
+
+def stream_sections(
+    pdf_file,
+    max_section_chars: Optional[int] = None,
+    sample_pages: int = 10,
+    pages: Optional[PageRanges] = None,
+    clean: bool = True,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Streams the sections of a PDF without the LLM:
+    extract pages -> detect headers -> assemble sections -> emit.
+
+    Parameters
+    ----------
+    pdf_file : Union[str, BufferedReader]
+        The path of the PDF file or the PDF file itself.
+    max_section_chars : Optional[int]
+        The number of characters a section is cut at, None for no limit.
+    sample_pages : int
+        The number of pages the header font is detected from.
+    pages : Optional[PageRanges]
+        The page ranges to read, see `page_ranges`, None for every page.
+    clean : bool
+        Whether to remove the running headers, footers and page numbers, rejoin the
+        hyphenated words and collapse the whitespace of the text.
+
+    Yields
+    ------
+    Tuple[str, str]
+        The section names and their texts, in document order.
+    """
+    records = iter_pages(pdf_file, pages)
+    with metrics.span("header_detection"):
+        family, size, sampled = detect_header_font(records, sample_pages)
+
+    records = itertools.chain(sampled, records)
+    if clean:
+        records = _strip_furniture(
+            records, PageFurniture([page.text for page in sampled])
+        )
+
+    sections = iter_sections(records, family, size, max_section_chars)
+    if clean:
+        sections = _normalize_sections(sections)
+
+    yield from sections
+
+
+def stream_document(
+    pdf_file,
+    backend: LLMBase,
+    max_in_flight: int = 4,
+    memory_limit: Optional[int] = None,
+    sample_pages: int = 10,
+    is_verbose: bool = False,
+    pages: Optional[PageRanges] = None,
+    clean: bool = True,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Summarizes a PDF as a bounded-memory generator pipeline:
+    extract pages -> detect headers -> assemble sections -> summarize -> emit.
+
+    The page furniture is learnt from the sampled pages and stripped from every page,
+    the sections are normalized before they are summarized, see `stream_sections`.
+
+    The memory ceiling is split between the pending sections and the section being
+    assembled, counting roughly two bytes per buffered character to leave room for
+    the prompt that is built from it.
+
+    Parameters
+    ----------
+    pdf_file : Union[str, BufferedReader]
+        The path of the PDF file or the PDF file itself.
+    backend : LLMBase
+        The backend to use for the AI operations.
+    max_in_flight : int
+        The maximum number of pending summaries.
+    memory_limit : Optional[int]
+        The approximate number of bytes the buffered section texts may take, None for
+        no limit.
+    sample_pages : int
+        The number of pages the header font is detected from.
+    pages : Optional[PageRanges]
+        The page ranges to summarize, see `page_ranges`, None for every page. The
+        other pages are never parsed.
+    clean : bool
+        Whether to remove the running headers, footers and page numbers, rejoin the
+        hyphenated words and collapse the whitespace of the text.
+
+    Yields
+    ------
+    Tuple[str, str]
+        The section names and their summaries, in document order.
+    """
+    max_section_chars = None
+    if memory_limit is not None:
+        max_section_chars = max(1, memory_limit // 2 // (max_in_flight + 1))
+
+    sections = stream_sections(pdf_file, max_section_chars, sample_pages, pages, clean)
+    yield from stream_summaries(sections, backend, max_in_flight, is_verbose)
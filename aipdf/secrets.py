@@ -1,4 +1,3 @@
-import keyring
 import typer
 from typing_extensions import Annotated
 
@@ -24,6 +23,8 @@ def get_secret(service: str) -> str:
     str
         The secret for the service.
     """
+    import keyring
+
     secret = keyring.get_password(service, "api-key")
     if secret is None:
         raise Exception(f"Secret not set for service {service}")
@@ -53,6 +54,8 @@ def set_secret(service: str, secret: str, force: bool) -> None:
     None
     """
 
+    import keyring
+
     # Check if the secret is already set
     try:
         get_secret(service)
@@ -0,0 +1,478 @@
+"""
+A long running summarization service, the backend, its connection pool, caches and
+rate limiter are shared by every job instead of being set up again for every PDF.
+
+Usage: python -m aipdf.service [--port 8765 | --unix_socket PATH] [--workers 2]
+                                [--path_root DIR]
+
+Endpoints:
+    POST /jobs              Submits a job, the raw PDF with ?priority=0, or a JSON
+                            body {"path": ..., "priority": 0} for a PDF under
+                            --path_root
+    GET  /jobs              The status of every job
+    GET  /jobs/<id>         The status of a job
+    GET  /jobs/<id>/result  The sections and summaries of a finished job
+    GET  /health            Liveness and queue depth
+    GET  /metrics           The stage timings and counters in Prometheus format
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import socketserver
+import stat
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, List, Optional, Union
+from urllib.parse import parse_qs, urlparse
+
+from .cli import add_backend_arguments, backend_from_args, extraction_cache_from_args
+from .llm_backends.llmBackendBase import LLMBase
+from .metrics import metrics
+from .pdf_tools.cache import ExtractionCache
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, source: Union[str, bytes], priority: int = 0):
+        """
+        A summarization job, ie. one PDF and its result once it has been processed.
+
+        Parameters
+        ----------
+        source : Union[str, bytes]
+            The path of the PDF on the service's machine or the PDF itself.
+        priority : int
+            Jobs with a lower priority are processed first, jobs with the same
+            priority in submission order.
+        """
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.priority = priority
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "pdf": self.source if isinstance(self.source, str) else None,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+
+class SummarizationService:
+    def __init__(
+        self,
+        backend: LLMBase,
+        workers: int = 2,
+        max_concurrency: int = 4,
+        extract_workers: int = 1,
+        cache: Optional[ExtractionCache] = None,
+        max_finished_jobs: int = 1000,
+        is_verbose: bool = False,
+    ):
+        """
+        A priority queue of summarization jobs processed by a bounded pool of worker
+        threads, every job goes through the same backend.
+
+        Parameters
+        ----------
+        backend : LLMBase
+            The backend shared by all the jobs.
+        workers : int
+            The number of jobs processed at the same time.
+        max_concurrency : int
+            The maximum number of summaries generated at the same time for one job.
+        extract_workers : int
+            The number of processes extracting the pages of one job.
+        cache : Optional[ExtractionCache]
+            The cache of ingested documents.
+        max_finished_jobs : int
+            The number of finished jobs kept for their results, the oldest ones are
+            forgotten first.
+        """
+        self.backend = backend
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.extract_workers = extract_workers
+        self.cache = cache
+        self.max_finished_jobs = max_finished_jobs
+        self.is_verbose = is_verbose
+
+        self._queue = queue.PriorityQueue()
+        # Breaks the ties between jobs of the same priority, first in first out
+        self._sequence = itertools.count()
+        self._jobs: Dict[str, Job] = OrderedDict()
+        self._finished: List[str] = []
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"aipdf-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Processes the jobs already queued, then stops the workers.
+        """
+        for _ in self._threads:
+            # The stop signals sort after the jobs of every priority
+            self._queue.put((float("inf"), next(self._sequence), None))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, source: Union[str, bytes], priority: int = 0) -> Job:
+        job = Job(source, priority)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._queue.put((priority, next(self._sequence), job.id))
+        metrics.incr("jobs_submitted")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                return
+
+            job = self.get(job_id)
+            job.status = RUNNING
+            job.started = time.time()
+            try:
+                job.result = self._process(job)
+                job.status = DONE
+                metrics.incr("jobs_done")
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = FAILED
+                metrics.incr("jobs_failed")
+            finally:
+                job.finished = time.time()
+                # The PDF is not needed anymore, do not keep uploads in memory
+                if isinstance(job.source, bytes):
+                    job.source = None
+                metrics.observe("job", job.finished - job.started)
+                self._retire(job)
+
+    def _process(self, job: Job) -> dict:
+        from .pdf_tools.document import ingest_pdf
+        from .pipeline import summarize_document
+
+        pdf_file = BytesIO(job.source) if isinstance(job.source, bytes) else job.source
+        document = ingest_pdf(
+            pdf_file, workers=self.extract_workers, cache=self.cache
+        )
+        sections, summaries = summarize_document(
+            document,
+            self.backend,
+            self.max_concurrency,
+            self.is_verbose,
+            cache=self.cache,
+        )
+        return {
+            "pages": document.page_count,
+            "tokens_saved_by_cleaning": (
+                document.cleaning.tokens_saved if document.cleaning else 0
+            ),
+            "sections": list(sections),
+            "summaries": summaries,
+        }
+
+    def _retire(self, job: Job):
+        with self._lock:
+            self._finished.append(job.id)
+            while len(self._finished) > self.max_finished_jobs:
+                self._jobs.pop(self._finished.pop(0), None)
+
+
+# The default size limit of the uploaded PDFs
+DEFAULT_MAX_BODY_SIZE = 100 * 1024 * 1024
+
+
+def resolve_job_path(path: str, root: Optional[str]) -> Optional[str]:
+    """
+    Returns the real path of a PDF submitted by path, None if it is not under the
+    root directory or paths are not accepted, ie. the root is None.
+    """
+    if root is None or not isinstance(path, str):
+        return None
+    root = os.path.realpath(root)
+    # Symbolic links are resolved, they can not lead out of the root
+    path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Set on the subclass created by `make_server`
+    service: SummarizationService = None
+    path_root: Optional[str] = None
+    max_body_size: int = DEFAULT_MAX_BODY_SIZE
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, {"error": message})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._send_error(404, "Not found")
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return self._send_error(400, "Invalid Content-Length")
+        if length > self.max_body_size:
+            # The body is not read, the connection can not be reused
+            self.close_connection = True
+            return self._send_error(
+                413, f"The body is larger than {self.max_body_size} bytes"
+            )
+        body = self.rfile.read(length)
+        query = parse_qs(url.query)
+
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                request = json.loads(body)
+                source = resolve_job_path(request["path"], self.path_root)
+                if source is None:
+                    return self._send_error(
+                        403,
+                        "Paths are not accepted"
+                        if self.path_root is None
+                        else "The path is not under the root directory",
+                    )
+                priority = int(request.get("priority", 0))
+            else:
+                if not body.startswith(b"%PDF"):
+                    return self._send_error(400, "The body is not a PDF")
+                source = body
+                priority = int(query.get("priority", ["0"])[0])
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_error(400, f"Invalid job: {e}")
+
+        job = self.service.submit(source, priority)
+        self._send_json(202, job.to_dict())
+
+    def do_GET(self):
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+
+        if parts == ["health"]:
+            return self._send_json(
+                200, {"status": "ok", "queued": self.service.queue_depth()}
+            )
+
+        if parts == ["metrics"]:
+            data = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        if parts == ["jobs"]:
+            return self._send_json(
+                200, [job.to_dict() for job in self.service.jobs()]
+            )
+
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_error(404, "Unknown job")
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict())
+            if parts[2] == "result":
+                if job.status == DONE:
+                    return self._send_json(200, job.result)
+                if job.status == FAILED:
+                    return self._send_error(500, job.error)
+                return self._send_error(409, f"Job is {job.status}")
+
+        self._send_error(404, "Not found")
+
+    def address_string(self) -> str:
+        # The clients of a Unix socket have no address
+        return super().address_string() if self.client_address else "unix socket"
+
+    def log_message(self, format, *args):
+        if self.service.is_verbose:
+            super().log_message(format, *args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def make_server(
+    service: SummarizationService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Optional[str] = None,
+    path_root: Optional[str] = None,
+    max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+) -> Union[ThreadingHTTPServer, socketserver.ThreadingUnixStreamServer]:
+    """
+    Returns an HTTP server exposing the service, it is not started.
+
+    Parameters
+    ----------
+    service : SummarizationService
+        The service to expose.
+    host : str
+        The address to listen on.
+    port : int
+        The port to listen on.
+    unix_socket : Optional[str]
+        The path of a Unix socket to listen on instead of the TCP address, a stale
+        socket left at this path is replaced.
+    path_root : Optional[str]
+        The directory the PDFs submitted by path have to be in, None to only accept
+        uploaded PDFs.
+    max_body_size : int
+        The size limit of the request bodies in bytes, larger requests are answered
+        with HTTP 413.
+    """
+    handler = type(
+        "Handler",
+        (_Handler,),
+        {"service": service, "path_root": path_root, "max_body_size": max_body_size},
+    )
+    if unix_socket is None:
+        return ThreadingHTTPServer((host, port), handler)
+
+    try:
+        if stat.S_ISSOCK(os.stat(unix_socket).st_mode):
+            os.unlink(unix_socket)
+    except FileNotFoundError:
+        pass
+    return _UnixHTTPServer(unix_socket, handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PDF summarization jobs.")
+    parser.add_argument("--host", help="The address to listen on.", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="The port to listen on.", default=8765)
+    parser.add_argument(
+        "--unix_socket",
+        help="Listen on this Unix socket instead of --host and --port.",
+        default=None,
+    )
+    parser.add_argument(
+        "--path_root",
+        help="Accept jobs submitted by path for the PDFs under this directory, by "
+        "default only uploaded PDFs are accepted.",
+        default=None,
+    )
+    parser.add_argument(
+        "--max_upload_mb",
+        type=int,
+        help="Size limit of the uploaded PDFs, larger uploads are rejected.",
+        default=DEFAULT_MAX_BODY_SIZE // (1024 * 1024),
+    )
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Verbose mode.", default=False
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of jobs processed at the same time.",
+        default=2,
+    )
+    parser.add_argument(
+        "--extract_workers",
+        type=int,
+        help="Number of processes extracting the pages of a job.",
+        default=1,
+    )
+    add_backend_arguments(parser)
+
+    args = parser.parse_args()
+    # The service exposes its timings and counters on /metrics
+    metrics.enable()
+    backend = backend_from_args(parser, args, workers=args.workers)
+    service = SummarizationService(
+        backend,
+        workers=args.workers,
+        max_concurrency=args.concurrency,
+        extract_workers=args.extract_workers,
+        cache=extraction_cache_from_args(args),
+        is_verbose=args.verbose,
+    )
+    service.start()
+
+    server = make_server(
+        service,
+        args.host,
+        args.port,
+        unix_socket=args.unix_socket,
+        path_root=args.path_root,
+        max_body_size=args.max_upload_mb * 1024 * 1024,
+    )
+    if args.unix_socket:
+        print(f"Serving on unix:{args.unix_socket}")
+    else:
+        print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
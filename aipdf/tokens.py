@@ -0,0 +1,108 @@
+from typing import Dict, List
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens a text will be split into by the model.
+
+    Note: The models we use do not share a tokenizer and shipping all of them would be
+    overkill, roughly 4 characters per token holds well enough for English text.
+
+    Parameters
+    ----------
+    text : str
+        The text to estimate the token count of.
+
+    Returns
+    -------
+    int
+        The estimated number of tokens.
+    """
+    return len(text) // 4 + 1
+
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Splits a text into chunks of at most `max_tokens` estimated tokens, consecutive
+    chunks share `overlap_tokens` tokens so no sentence loses its context.
+
+    The chunks are cut at a paragraph or sentence boundary when there is one in the
+    last quarter of the chunk.
+
+    Parameters
+    ----------
+    text : str
+        The text to split.
+    max_tokens : int
+        The maximum number of estimated tokens in a chunk.
+    overlap_tokens : int
+        The number of estimated tokens consecutive chunks share.
+
+    Returns
+    -------
+    List[str]
+        The chunks, in order.
+    """
+    max_chars = max(1, max_tokens * 4)
+    overlap_chars = min(overlap_tokens * 4, max_chars // 2)
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+
+        if end < len(text):
+            floor = start + max_chars * 3 // 4
+            for separator in ("\n\n", "\n", ". "):
+                cut = text.rfind(separator, floor, end)
+                if cut >= 0:
+                    end = cut + len(separator)
+                    break
+
+        chunks.append(text[start:end])
+        if end == len(text):
+            break
+        next_start = max(start + 1, end - overlap_chars)
+        # Start the overlap at a sentence boundary too, if there is one
+        boundary = text.find(". ", next_start, end)
+        start = boundary + 2 if 0 <= boundary < end - 2 else next_start
+
+    return chunks
+
+
+def pack_texts(
+    texts: Dict[str, str], max_tokens: int, max_items: int = 8
+) -> List[List[str]]:
+    """
+    Packs texts into groups whose total estimated size stays under `max_tokens`,
+    keeping the document order.
+
+    Parameters
+    ----------
+    texts : Dict[str, str]
+        The texts keyed by name, in document order.
+    max_tokens : int
+        The maximum number of estimated tokens in a group.
+    max_items : int
+        The maximum number of texts in a group.
+
+    Returns
+    -------
+    List[List[str]]
+        The names of the texts of every group.
+    """
+    groups = []
+    group = []
+    group_tokens = 0
+    for name, text in texts.items():
+        tokens = estimate_tokens(name) + estimate_tokens(text)
+        if group and (group_tokens + tokens > max_tokens or len(group) == max_items):
+            groups.append(group)
+            group = []
+            group_tokens = 0
+        group.append(name)
+        group_tokens += tokens
+
+    if group:
+        groups.append(group)
+    return groups
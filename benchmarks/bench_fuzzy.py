@@ -0,0 +1,55 @@
+"""
+Benchmarks the fuzzy matching of `filter_section_names` on synthetic candidates.
+
+Usage: python -m benchmarks.bench_fuzzy
+"""
+import argparse
+import random
+import string
+import time
+
+from aipdf.ai_helpers import match_section_names
+
+
+def make_candidates(candidate_count: int, title_count: int, seed: int = 0):
+    """
+    Returns `candidate_count` candidate section names and `title_count` of them
+    slightly rewritten, as the AI would return them.
+    """
+    rng = random.Random(seed)
+    candidates = [
+        " ".join(
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+            for _ in range(rng.randint(1, 4))
+        ).title()
+        for _ in range(candidate_count)
+    ]
+    titles = [
+        candidate.upper() if rng.random() < 0.1 else candidate.rstrip(".") + " "
+        for candidate in rng.sample(candidates, title_count)
+    ]
+    return candidates, titles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fuzzy matcher.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'candidates':>10} {'titles':>8} {'matched':>8} {'time (s)':>10}")
+    for candidate_count, title_count in [(100, 20), (1000, 100), (10_000, 500)]:
+        candidates, titles = make_candidates(candidate_count, title_count)
+
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            matched = match_section_names(candidates, titles)
+            timings.append(time.perf_counter() - started)
+
+        print(
+            f"{candidate_count:>10} {title_count:>8} {len(matched):>8} {min(timings):>10.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Import time budget of the command line entry points.
+
+Every scenario runs in a fresh interpreter with `-X importtime`, the time spent
+importing modules on top of the interpreter startup is compared to its budget and the
+heavy dependencies that must not be loaded by the scenario are checked. The script
+exits with a non-zero status when a scenario is over budget, so it can run as a
+regression check.
+
+Usage: python -m benchmarks.bench_import [--repeat 5] [--scale 1.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The heavy dependencies, none of them is needed to parse the arguments
+HEAVY_MODULES = [
+    "PyPDF2",
+    "keyring",
+    "numpy",
+    "rapidfuzz",
+    "requests",
+    "rich",
+    "tqdm",
+    "typer",
+]
+
+# name: (code run in the fresh interpreter, budget in milliseconds, modules that must
+# not be imported)
+SCENARIOS = {
+    "main --help": (
+        "import runpy, sys; sys.argv = ['main.py', '--help']\n"
+        "try: runpy.run_path('main.py', run_name='__main__')\n"
+        "except SystemExit: pass",
+        60,
+        HEAVY_MODULES,
+    ),
+    "import aipdf.pipeline": (
+        "import aipdf.pipeline",
+        120,
+        HEAVY_MODULES,
+    ),
+    "import aipdf.pdf_tools.cache": (
+        "import aipdf.pdf_tools.cache",
+        60,
+        HEAVY_MODULES,
+    ),
+}
+
+# Printed by the scenarios on stdout, after their own output
+_MARKER = "__loaded_modules__"
+
+
+def _import_times(stderr: str) -> dict:
+    """
+    Returns the cumulative import time in microseconds of every top level import of an
+    `-X importtime` report.
+    """
+    times = dict()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith("  "):
+            # Imported by another module, already counted in its parent
+            continue
+        try:
+            times[name.strip()] = times.get(name.strip(), 0) + int(cumulative)
+        except ValueError:
+            # The header line of the report
+            continue
+    return times
+
+
+def _run(code: str) -> tuple:
+    script = (
+        code
+        + "\nimport json, sys\n"
+        + f"print({_MARKER!r} + json.dumps(sorted(sys.modules)))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    loaded = json.loads(result.stdout.rsplit(_MARKER, 1)[1])
+    return _import_times(result.stderr), set(loaded)
+
+
+def measure(code: str, repeat: int) -> tuple:
+    """
+    Returns the median time in milliseconds spent importing modules on top of the
+    interpreter startup, and the modules the code loaded.
+    """
+    startup, _ = _run("pass")
+    totals = []
+    for _ in range(repeat):
+        times, loaded = _run(code)
+        totals.append(
+            sum(time for name, time in times.items() if name not in startup) / 1000
+        )
+    return statistics.median(totals), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time budget.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplies every budget, eg. for slow CI machines.",
+    )
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+    print(f"{'scenario':<30} {'ms':>8} {'budget':>8}  status")
+    for name, (code, budget, forbidden) in SCENARIOS.items():
+        milliseconds, loaded = measure(code, args.repeat)
+        budget *= args.scale
+        heavy = sorted(module for module in forbidden if module in loaded)
+
+        status = "ok"
+        if milliseconds > budget:
+            status = "over budget"
+        if heavy:
+            status = "imports " + ", ".join(heavy)
+        failed = failed or status != "ok"
+
+        print(f"{name:<30} {milliseconds:>8.1f} {budget:>8.1f}  {status}")
+        results.append(
+            {
+                "scenario": name,
+                "milliseconds": milliseconds,
+                "budget": budget,
+                "heavy_modules": heavy,
+            }
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
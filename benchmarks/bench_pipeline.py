@@ -0,0 +1,150 @@
+"""
+End-to-end benchmark of the pipeline over generated PDFs of growing page count.
+
+Every document runs in its own process so the peak RSS is the one of that document.
+The LLM calls go to the offline `LocalBackend`, configure its latency to model a
+remote provider.
+
+Usage: python -m benchmarks.bench_pipeline [--pages 10 100 1000] [--latency 0.2]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+STAGES = ["extraction", "header detection", "fuzzy filter", "split", "summarization"]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def run_document(path: str, latency: float, jitter: float, concurrency: int) -> dict:
+    """
+    Runs every stage of the pipeline on one PDF and returns the timings.
+    """
+    from aipdf.ai_helpers import (
+        filter_section_names,
+        summarize_sections_within_budget,
+    )
+    from aipdf.llm_backends.localBackend import LocalBackend
+    from aipdf.pdf_tools.document import ingest_pdf
+    from aipdf.pdf_tools.headings import classify_headings
+    from aipdf.pdf_tools.heuristics import (
+        try_to_find_known_text_that_can_be_a_subtitle,
+    )
+    from aipdf.pdf_tools.pdfutils import split_text_into_sections
+
+    backend = LocalBackend(latency=latency, jitter=jitter)
+    timings = dict()
+
+    started = time.perf_counter()
+    document = ingest_pdf(path)
+    timings["extraction"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    classify_headings(document.runs)
+    timings["heading classification"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    family, size = try_to_find_known_text_that_can_be_a_subtitle(document.runs)
+    candidates = document.runs.texts(family, size)
+    timings["header detection"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    headers = filter_section_names(candidates, backend) or []
+    timings["fuzzy filter"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sections = split_text_into_sections(document.text, headers)
+    timings["split"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    summarize_sections_within_budget(sections, backend, max_concurrency=concurrency)
+    timings["summarization"] = time.perf_counter() - started
+
+    return {
+        "pages": document.page_count,
+        "sections": len(sections),
+        "llm_calls": backend.calls,
+        "timings": timings,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the whole pipeline.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument(
+        "--latency", type=float, help="Seconds per LLM call.", default=0.0
+    )
+    parser.add_argument(
+        "--jitter", type=float, help="Random extra seconds per call.", default=0.0
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--document", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.document:
+        # Child process, run one document and report back on stdout
+        result = run_document(args.document, args.latency, args.jitter, args.concurrency)
+        print(json.dumps(result))
+        return
+
+    from benchmarks.pdfgen import make_pdf
+
+    results = []
+    header = f"{'pages':>6} {'sections':>8} {'calls':>6} " + " ".join(
+        f"{stage:>16}" for stage in STAGES
+    )
+    print(header + f" {'pages/s':>8} {'peak RSS':>9}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in args.pages:
+            path = os.path.join(directory, f"synthetic-{pages}.pdf")
+            with open(path, "wb") as f:
+                f.write(make_pdf(pages))
+
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.bench_pipeline",
+                    "--document",
+                    path,
+                    "--latency",
+                    str(args.latency),
+                    "--jitter",
+                    str(args.jitter),
+                    "--concurrency",
+                    str(args.concurrency),
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+
+            timings = result["timings"]
+            throughput = result["pages"] / sum(timings.values())
+            print(
+                f"{result['pages']:>6} {result['sections']:>8} {result['llm_calls']:>6} "
+                + " ".join(f"{timings[stage]:>15.3f}s" for stage in STAGES)
+                + f" {throughput:>8.1f} {result['peak_rss_mb']:>7.1f}MB"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmarks `split_text_into_sections` against the repeated `str.split` splitter it
+replaced, on synthetic documents of growing size.
+
+Usage: python -m benchmarks.bench_split
+"""
+import argparse
+import random
+import string
+import time
+
+from aipdf.pdf_tools.pdfutils import split_text_into_sections
+
+
+def legacy_split_text_into_sections(text: str, section_headers: list):
+    """
+    The original splitter, it splits the whole text once per header.
+    """
+    sections = dict()
+
+    for i in range(len(section_headers)):
+        if i < len(section_headers) - 1:
+            first_division = text.split(section_headers[i])[1]
+            second_division = first_division.split(section_headers[i + 1])[0]
+            sections[section_headers[i]] = second_division
+        else:
+            first_division = text.split(section_headers[i])[1]
+            sections[section_headers[i]] = first_division
+
+    return sections
+
+
+def make_document(characters: int, header_count: int, seed: int = 0):
+    """
+    Returns a synthetic document of about `characters` characters and its headers.
+    """
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        for _ in range(2000)
+    ]
+    headers = [f"{i + 1}. Section {i + 1}" for i in range(header_count)]
+
+    body_length = characters // header_count
+    parts = []
+    for header in headers:
+        parts.append("\n" + header + "\n")
+        body = []
+        length = 0
+        while length < body_length:
+            word = rng.choice(words)
+            body.append(word)
+            length += len(word) + 1
+        parts.append(" ".join(body))
+
+    return "".join(parts), headers
+
+
+def best_of(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the section splitter.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'chars':>10} {'headers':>8} {'legacy (s)':>12} {'new (s)':>10} {'speedup':>8}")
+    for characters, header_count in [
+        (100_000, 10),
+        (1_000_000, 50),
+        (5_000_000, 200),
+        (20_000_000, 500),
+    ]:
+        text, headers = make_document(characters, header_count)
+
+        assert split_text_into_sections(
+            text, headers
+        ) == legacy_split_text_into_sections(text, headers)
+
+        legacy = best_of(
+            lambda: legacy_split_text_into_sections(text, headers), args.repeat
+        )
+        new = best_of(lambda: split_text_into_sections(text, headers), args.repeat)
+        print(
+            f"{len(text):>10} {header_count:>8} {legacy:>12.4f} {new:>10.4f} {legacy / new:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
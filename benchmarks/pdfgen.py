@@ -0,0 +1,143 @@
+"""
+Generates synthetic, paper-like PDFs for the benchmarks, without any PDF library.
+
+Every page has a running header and a page number footer, the body is split into
+numbered sections whose headers are set in a bold font, like a scientific paper.
+"""
+import random
+import string
+from typing import List
+
+KNOWN_SECTIONS = [
+    "Abstract",
+    "Introduction",
+    "Related Work",
+    "Methodology",
+    "Approach",
+    "Experiments",
+    "Results",
+    "Discussion",
+    "Future Work",
+    "Conclusion",
+]
+
+LINES_PER_PAGE = 48
+LINE_HEIGHT = 14
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _words(rng: random.Random, count: int) -> List[str]:
+    return [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+        for _ in range(count)
+    ]
+
+
+def _page_lines(pages: int, rng: random.Random) -> List[List[tuple]]:
+    """
+    Lays the document out as a list of pages, every page a list of
+    (font, size, text) lines.
+    """
+    vocabulary = _words(rng, 3000)
+
+    # About one section every two pages, references at the end
+    section_count = max(3, pages // 2)
+    titles = [
+        f"{i + 1}. {KNOWN_SECTIONS[i % len(KNOWN_SECTIONS)]}"
+        + (f" {i // len(KNOWN_SECTIONS) + 1}" if i >= len(KNOWN_SECTIONS) else "")
+        for i in range(section_count)
+    ] + ["References"]
+    lines_per_section = max(4, -(-(pages * LINES_PER_PAGE) // len(titles)) - 1)
+
+    lines = [
+        ("F2", 18, "A Synthetic Study of Things"),
+        ("F1", 10, "Jane Doe, John Roe"),
+    ]
+    for title in titles:
+        lines.append(("F2", 14, title))
+        for _ in range(lines_per_section):
+            line = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 14)))
+            if rng.random() < 0.1:
+                # A hyphenated line break, like the ones justified text produces
+                line += " hyphen-"
+            lines.append(("F1", 10, line))
+
+    return [
+        lines[i : i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)
+    ][:pages] or [[]]
+
+
+def make_pdf(pages: int, seed: int = 0) -> bytes:
+    """
+    Returns the bytes of a synthetic PDF with the given number of pages.
+
+    Parameters
+    ----------
+    pages : int
+        The number of pages.
+    seed : int
+        The seed of the random text, the same seed gives the same document.
+
+    Returns
+    -------
+    bytes
+        The PDF.
+    """
+    rng = random.Random(seed)
+    layout = _page_lines(pages, rng)
+
+    contents = []
+    for number, page_lines in enumerate(layout):
+        ops = ["BT /F1 8 Tf 72 770 Td (Journal of Synthetic Results) Tj ET"]
+        y = 740
+        for font, size, text in page_lines:
+            ops.append(
+                "BT /%s %d Tf 72 %d Td (%s) Tj ET" % (font, size, y, _escape(text))
+            )
+            y -= LINE_HEIGHT
+        ops.append("BT /F1 8 Tf 300 30 Td (%d) Tj ET" % (number + 1))
+        contents.append("\n".join(ops).encode("latin-1"))
+
+    # 1: catalog, 2: page tree, 3-4: fonts, then a content stream and a page per page
+    objects = {
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Times-Roman >>",
+        4: b"<< /Type /Font /Subtype /Type1 /BaseFont /Times-Bold >>",
+    }
+    page_ids = []
+    for number, content in enumerate(contents):
+        content_id = 5 + 2 * number
+        page_id = content_id + 1
+        page_ids.append(page_id)
+        objects[content_id] = (
+            b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        )
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Contents %d 0 R /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>"
+            % content_id
+        )
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids),
+        len(page_ids),
+    )
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = dict()
+    for object_id in sorted(objects):
+        offsets[object_id] = len(data)
+        data += b"%d 0 obj\n" % object_id + objects[object_id] + b"\nendobj\n"
+
+    xref = len(data)
+    size = max(objects) + 1
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for object_id in range(1, size):
+        data += b"%010d 00000 n \n" % offsets[object_id]
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        size,
+        xref,
+    )
+    return bytes(data)
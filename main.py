@@ -1,21 +1,199 @@
 import argparse
+import sys
 import time
 
-import rich
-import tqdm
+# Only the modules needed to parse the arguments are imported here, the pipeline and
+# its dependencies are imported by the code paths that use them so `--help` and short
+# runs start fast
+from aipdf.cli import (
+    add_backend_arguments,
+    add_metrics_arguments,
+    backend_from_args,
+    enable_metrics,
+    extraction_cache_from_args,
+    write_metrics,
+)
+from aipdf.metrics import metrics
+from aipdf.pdf_tools.document import page_ranges
 
-from aipdf.pdf_tools.fontmap import extract_fontmap_from_pdf
-from aipdf.pdf_tools.heuristics import try_to_find_known_text_that_can_be_a_subtitle
-from aipdf.pdf_tools.pdfutils import read_whole_text, split_text_into_sections
 
-from aipdf.ai_helpers import filter_section_names, summarize_section
-from aipdf.llm_backends.openrouter_models import (
-    Mixtral8x7bInstructBeta,
-    Zephyr7b,
-    GPT4_Turbo,
-    Capybara7b,
-)
-from aipdf.llm_backends.openRouter import OpenRouter
+def print_streamed_summaries(
+    sections: dict, backend, is_verbose: bool = False, state=None
+) -> dict:
+    """
+    Summarizes the sections one after the other, printing every summary as it is
+    generated along with its time to first token.
+
+    With an incremental state, the stored summaries of unchanged sections are printed
+    as they are and only the changed sections are generated.
+    """
+    import rich
+
+    from aipdf.ai_helpers import summarize_section_stream
+    from aipdf.incremental import stored_summaries
+
+    summaries = dict()
+    fingerprints, stored = (
+        stored_summaries(sections, state) if state is not None else (dict(), dict())
+    )
+
+    for section, text in sections.items():
+        rich.print(f"[bold]{section}[/bold]")
+
+        if section in stored:
+            rich.print(f"{stored[section]}\n[dim](unchanged)[/dim]\n")
+            summaries[section] = stored[section]
+            continue
+
+        started = time.perf_counter()
+        time_to_first_token = None
+        deltas = []
+        for delta in summarize_section_stream(text, backend, is_verbose):
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - started
+            deltas.append(delta)
+            sys.stdout.write(delta)
+            sys.stdout.flush()
+
+        elapsed = time.perf_counter() - started
+        rich.print(
+            f"\n[dim]time to first token: {time_to_first_token or elapsed:.2f}s, "
+            f"total: {elapsed:.2f}s[/dim]\n"
+        )
+        summaries[section] = "".join(deltas)
+        if state is not None:
+            state.put_summary(fingerprints[section], summaries[section])
+            state.checkpoint()
+
+    return summaries
+
+
+def run(args, backend):
+    """
+    Summarizes the PDF of the command line arguments with the given backend.
+    """
+    import rich
+
+    from aipdf.ai_helpers import summarize_sections_within_budget
+    from aipdf.incremental import (
+        IncrementalState,
+        ingest_pdf_incremental,
+        summarize_changed_sections,
+    )
+    from aipdf.llm_backends.cachedBackend import CachedBackend
+    from aipdf.llm_backends.cascadeBackend import CascadeBackend
+    from aipdf.pdf_tools.document import ingest_pdf
+    from aipdf.pipeline import (
+        find_sections,
+        is_summarizable,
+        stream_document,
+        stream_sections,
+    )
+
+    if args.low_memory:
+        memory_limit = (
+            args.memory_limit_mb * 1024 * 1024 if args.memory_limit_mb else None
+        )
+        if args.dry_run:
+            # Only detect and split the sections, the LLM is never called
+            with metrics.span("split"):
+                for section, _ in stream_sections(
+                    args.pdf_file,
+                    sample_pages=args.sample_pages,
+                    pages=args.pages,
+                    clean=not args.keep_boilerplate,
+                ):
+                    rich.print(section)
+            return
+
+        # The pages are extracted, split and summarized together, so the whole
+        # pipeline is timed as the summarization
+        with metrics.span("summarization"):
+            for section, summary in stream_document(
+                args.pdf_file,
+                backend,
+                max_in_flight=args.concurrency,
+                memory_limit=memory_limit,
+                sample_pages=args.sample_pages,
+                is_verbose=args.verbose,
+                pages=args.pages,
+                clean=not args.keep_boilerplate,
+            ):
+                rich.print({section: summary})
+        return
+
+    # Only the pages and sections that changed since the previous run are processed
+    state = IncrementalState(args.incremental) if args.incremental else None
+
+    # Walk the PDF once, the font map and the text both come from the same pass. The
+    # file is memory mapped from its path, so the pages out of --pages are not read
+    cache = None
+    if state is not None:
+        document = ingest_pdf_incremental(args.pdf_file, state, pages=args.pages)
+    else:
+        cache = extraction_cache_from_args(args)
+        document = ingest_pdf(
+            args.pdf_file, workers=args.workers, cache=cache, pages=args.pages
+        )
+
+    sections_dict = find_sections(
+        document, backend, args.verbose, cache, clean=not args.keep_boilerplate
+    )
+
+    if not args.dry_run:
+        # For each section that is not a reference section, create a prompt and get the AI to generate summary text for that section using minimum tokens.
+        chapter_summaries = dict()
+
+        # copy keys from sections_dict to chapter_summaries
+        for key in sections_dict.keys():
+            chapter_summaries[key] = ""
+
+        # if section is not references or appendix
+        sections_to_summarize = {
+            section: text
+            for section, text in sections_dict.items()
+            if is_summarizable(section)
+        }
+
+        try:
+            if args.stream:
+                chapter_summaries.update(
+                    print_streamed_summaries(
+                        sections_to_summarize, backend, args.verbose, state
+                    )
+                )
+            else:
+                import tqdm
+
+                with metrics.span("summarization"), tqdm.tqdm(
+                    total=len(sections_to_summarize), desc="Generating summaries"
+                ) as progress:
+                    options = dict(
+                        max_concurrency=args.concurrency,
+                        is_verbose=args.verbose,
+                        on_result=lambda section, summary: progress.update(),
+                    )
+                    if state is not None:
+                        summaries = summarize_changed_sections(
+                            sections_to_summarize, backend, state, **options
+                        )
+                    else:
+                        summaries = summarize_sections_within_budget(
+                            sections_to_summarize, backend, **options
+                        )
+                    chapter_summaries.update(summaries)
+
+                rich.print(chapter_summaries)
+        finally:
+            # Keep what has been summarized even if the run fails half way
+            if state is not None:
+                state.save()
+
+    if args.verbose and isinstance(backend, CachedBackend):
+        rich.print(backend.stats())
+    cascade = backend.backend if isinstance(backend, CachedBackend) else backend
+    if args.verbose and isinstance(cascade, CascadeBackend):
+        rich.print(cascade.tier_stats())
 
 
 def main():
@@ -27,51 +205,74 @@ def main():
     parser.add_argument(
         "--dry_run", "-d", action="store_true", help="Dry run mode.", default=False
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        help="Number of processes to extract the pages with.",
+        default=1,
+    )
+    parser.add_argument(
+        "--pages",
+        "-p",
+        type=page_ranges,
+        help='Only process these pages, eg. "1-10,15,20-", the other pages are '
+        "never parsed.",
+        default=None,
+    )
+    add_backend_arguments(parser)
+    parser.add_argument(
+        "--keep_boilerplate",
+        action="store_true",
+        help="Send the text as extracted, without removing the running headers, "
+        "footers and page numbers or rejoining the hyphenated words.",
+        default=False,
+    )
+    parser.add_argument(
+        "--stream",
+        "-s",
+        action="store_true",
+        help="Print the summaries as they are generated, one section at a time.",
+        default=False,
+    )
+    parser.add_argument(
+        "--low_memory",
+        action="store_true",
+        help="Stream the pages through the pipeline and summarize every section as "
+        "soon as it is complete, the section headers are not filtered by the LLM.",
+        default=False,
+    )
+    parser.add_argument(
+        "--memory_limit_mb",
+        type=int,
+        help="Approximate memory ceiling for the buffered text in --low_memory mode.",
+        default=None,
+    )
+    parser.add_argument(
+        "--sample_pages",
+        type=int,
+        help="Number of pages the header font is detected from in --low_memory mode.",
+        default=10,
+    )
+    parser.add_argument(
+        "--incremental",
+        "-i",
+        help="Path of a state file from a previous run of the same document, only "
+        "the changed pages are extracted and the changed sections summarized. The "
+        "state is checkpointed during the run, so an interrupted run continues where "
+        "it stopped.",
+        default=None,
+    )
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    if args.low_memory and args.incremental:
+        parser.error("--incremental cannot be used with --low_memory")
 
-    with open(args.pdf_file, "rb") as f:
-        fonts = extract_fontmap_from_pdf(f)
-        family, size = try_to_find_known_text_that_can_be_a_subtitle(fonts)
-        # Print the text from max_hit_count
-        sections = []
-        for text in fonts[family]["texts"][size]:
-            sections.append(text)
-
-        # Filter the sections
-        backend = OpenRouter(Mixtral8x7bInstructBeta())
-        sections_to_process = filter_section_names(sections, backend, args.verbose)
-
-        whole_text = read_whole_text(f)
-        sections_text = split_text_into_sections(whole_text, sections)
-
-        # Create a dictionary of the sections and their corresponding text
-        sections_dict = dict()
-
-        for section in sections_to_process:
-            sections_dict[section] = sections_text[section]
-
-        if not args.dry_run:
-            # For each section that is not a reference section, create a prompt and get the AI to generate summary text for that section using minimum tokens.
-            chapter_summaries = dict()
-
-            # copy keys from sections_dict to chapter_summaries
-            for key in sections_dict.keys():
-                chapter_summaries[key] = ""
-
-            for section in tqdm.tqdm(sections_to_process, desc="Generating summaries"):
-                # delay for 5 seconds due to api limits
-                time.sleep(5)
-                # if section is not references or appendix
-                if (
-                    "references" not in section.lower()
-                    and "appendix" not in section.lower()
-                ):
-                    chapter_summaries[section] = summarize_section(
-                        sections_dict[section], backend, args.verbose
-                    )
-
-            rich.print(chapter_summaries)
+    enable_metrics(args)
+    backend = backend_from_args(parser, args)
+    run(args, backend)
+    write_metrics(args)
 
 
 if __name__ == "__main__":
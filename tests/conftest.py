@@ -0,0 +1,26 @@
+import pytest
+
+from aipdf.metrics import metrics
+from benchmarks.pdfgen import make_pdf
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    """
+    The path of a small synthetic PDF, the same one on every run.
+    """
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(make_pdf(5))
+    return str(path)
+
+
+@pytest.fixture
+def recorded_metrics():
+    """
+    The metrics registry of the pipeline, enabled and empty for the test.
+    """
+    metrics.reset()
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
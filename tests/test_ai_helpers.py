@@ -0,0 +1,35 @@
+from aipdf.ai_helpers import SYSTEM_MESSAGE, summarize_sections_within_budget
+from aipdf.llm_backends.local_models import LocalStandIn
+from aipdf.llm_backends.localBackend import LocalBackend
+from aipdf.tokens import estimate_tokens
+
+
+def test_every_prompt_fits_in_the_context():
+    prompts = []
+
+    def record(prompt):
+        prompts.append(prompt)
+        return LocalBackend.default_template(prompt)
+
+    model = LocalStandIn(context_length=1024, max_output_tokens=256)
+    backend = LocalBackend(model=model, template=record)
+    sections = {
+        "Introduction": "A long introduction to the subject. " * 600,
+        "Methods": "How the work was done. " * 100,
+        "Acknowledgements": "Thanks.",
+    }
+    # Enough short sections to fill the packed prompts up to the budget
+    sections.update({f"Table {i}": "A row of the table. " * 20 for i in range(30)})
+
+    summaries = summarize_sections_within_budget(sections, backend)
+
+    assert list(summaries) == list(sections)
+    # The introduction is chunked then reduced, the short sections are packed
+    assert len(prompts) < len(sections)
+    for prompt in prompts:
+        assert (
+            estimate_tokens(prompt)
+            + estimate_tokens(SYSTEM_MESSAGE)
+            + model.max_output_tokens
+            <= model.context_length
+        )
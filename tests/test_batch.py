@@ -0,0 +1,42 @@
+import json
+
+from aipdf import batch
+from aipdf.batch import result_path, run_batch
+from aipdf.llm_backends.localBackend import LocalBackend
+from benchmarks.pdfgen import make_pdf
+
+
+def make_pdfs(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f"paper-{i}.pdf"
+        path.write_bytes(make_pdf(3 + i))
+        paths.append(str(path))
+    return paths
+
+
+def test_resumes_where_the_previous_run_stopped(tmp_path):
+    done, todo = make_pdfs(tmp_path, 2)
+    output = str(tmp_path / "results")
+    list(run_batch([done], output, LocalBackend(), extract_workers=1))
+    with open(result_path(output, done)) as f:
+        previous = json.load(f)
+
+    written = list(run_batch([done, todo], output, LocalBackend(), extract_workers=1))
+
+    assert written == [result_path(output, todo)]
+    with open(result_path(output, done)) as f:
+        assert json.load(f) == previous
+
+
+def test_documents_without_sections_are_retried(tmp_path, monkeypatch):
+    (path,) = make_pdfs(tmp_path, 1)
+    output = str(tmp_path / "results")
+    # Like a section filter that keeps none of the candidates
+    monkeypatch.setattr(batch, "summarize_document", lambda *args, **kwargs: ({}, {}))
+
+    assert list(run_batch([path], output, LocalBackend(), extract_workers=1)) == []
+    monkeypatch.undo()
+    assert list(run_batch([path], output, LocalBackend(), extract_workers=1)) == [
+        result_path(output, path)
+    ]
@@ -0,0 +1,74 @@
+import pytest
+
+from aipdf.llm_backends.cachedBackend import CachedBackend
+from aipdf.llm_backends.cascadeBackend import CascadeBackend
+from aipdf.llm_backends.llmBackendBase import TransientBackendError
+from aipdf.llm_backends.localBackend import LocalBackend
+from aipdf.pipeline import create_backend
+
+
+def reject_short(prompt, answer, max_tokens):
+    return "too_short" if len(answer.split()) < 3 else None
+
+
+def test_acceptable_answers_stay_on_the_first_tier(recorded_metrics):
+    fast, slow = LocalBackend(), LocalBackend()
+    cascade = CascadeBackend([fast, slow], reject_short, names=["fast", "slow"])
+
+    assert cascade.completion("three words here") == "three words here"
+    assert (fast.calls, slow.calls) == (1, 0)
+    assert cascade.tier_stats()["fast"]["hit_rate"] == 1.0
+    assert recorded_metrics.counters["cascade.fast.accepted"] == 1
+
+
+def test_rejected_answers_escalate_to_the_next_tier(recorded_metrics):
+    fast = LocalBackend(template=lambda prompt: "short")
+    slow = LocalBackend()
+    cascade = CascadeBackend([fast, slow], reject_short, names=["fast", "slow"])
+
+    # The last tier is always accepted
+    assert cascade.completion("two words") == "two words"
+    assert (fast.calls, slow.calls) == (1, 1)
+    assert recorded_metrics.counters["cascade.rejected.too_short"] == 1
+    assert recorded_metrics.counters["cascade.slow.accepted"] == 1
+
+
+def test_failing_tiers_escalate_and_are_counted(recorded_metrics):
+    cascade = CascadeBackend(
+        [LocalBackend(error_rate=1.0), LocalBackend()],
+        reject_short,
+        names=["fast", "slow"],
+    )
+
+    assert cascade.completion("three words here") == "three words here"
+    assert cascade.tier_stats()["fast"]["errors"] == 1
+    assert recorded_metrics.counters["cascade.rejected.error"] == 1
+    assert recorded_metrics.counters["cascade.fast.rejected"] == 1
+
+
+def test_raises_the_errors_of_the_last_tier():
+    cascade = CascadeBackend(
+        [LocalBackend(), LocalBackend(error_rate=1.0)], lambda *args: "rejected"
+    )
+    with pytest.raises(TransientBackendError):
+        cascade.completion("prompt")
+
+
+def test_cascaded_answers_have_their_own_cache_key(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cascade = CascadeBackend(
+        [LocalBackend(), LocalBackend()], reject_short, names=["fast", "slow"]
+    )
+    cascaded = CachedBackend(cascade, path=path)
+    single = CachedBackend(LocalBackend(), path=path)
+
+    # The tiers are in order, the same models in another order are another cascade
+    assert cascade.cache_name == "cascade:fast,slow"
+    assert cascaded.cache_key("prompt", 16, 0.8, None) != single.cache_key(
+        "prompt", 16, 0.8, None
+    )
+
+
+def test_cascade_cannot_be_hedged():
+    with pytest.raises(ValueError):
+        create_backend(models=["Zephyr7b", "GPT4_Turbo"], hedge=True, cascade=True)
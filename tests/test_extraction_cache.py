@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+
+from aipdf.pdf_tools.cache import ExtractionCache
+from aipdf.pdf_tools.document import ingest_pdf
+
+
+def test_store_and_load(tmp_path, pdf_path):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    document = ingest_pdf(pdf_path)
+    key = cache.key(pdf_path)
+
+    cache.store(key, document)
+    cache.store_spans(key, ["Intro"], {"Intro": (0, 10)})
+
+    loaded = cache.load(key)
+    assert loaded.page_texts == document.page_texts
+    assert loaded.cache_key == key
+    assert cache.load_spans(key, ["Intro"]) == {"Intro": (0, 10)}
+    assert cache.load_spans(key, ["Other"]) is None
+
+
+def test_concurrent_stores_of_the_same_document(tmp_path, pdf_path):
+    directory = tmp_path / "cache"
+    cache = ExtractionCache(str(directory))
+    document = ingest_pdf(pdf_path)
+    errors = []
+
+    def store():
+        try:
+            for _ in range(10):
+                cache.store("key", document)
+        except Exception as e:
+            errors.append(e)
+
+    # Like the worker threads of the service summarizing the same PDF
+    threads = [threading.Thread(target=store) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert os.listdir(directory) == ["key.doc"]
+    assert cache.load("key").page_texts == document.page_texts
+
+
+def test_evicts_the_least_recently_used_files(tmp_path, pdf_path):
+    directory = tmp_path / "cache"
+    cache = ExtractionCache(str(directory))
+    document = ingest_pdf(pdf_path)
+
+    cache.store("a", document)
+    size = os.path.getsize(directory / "a.doc")
+    old = time.time() - 100
+    os.utime(directory / "a.doc", (old, old))
+    cache.store("b", document)
+    os.utime(directory / "b.doc", (old - 10, old - 10))
+    # Loading a file makes it the most recently used
+    assert cache.load("b") is not None
+
+    cache.max_size = 2 * size
+    cache.store("c", document)
+    assert sorted(os.listdir(directory)) == ["b.doc", "c.doc"]
+
+
+def test_evicts_the_expired_files(tmp_path, pdf_path):
+    directory = tmp_path / "cache"
+    ExtractionCache(str(directory)).store("a", ingest_pdf(pdf_path))
+    old = time.time() - 100
+    os.utime(directory / "a.doc", (old, old))
+
+    ExtractionCache(str(directory), ttl=50)
+    assert os.listdir(directory) == []
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+import main
+from aipdf.incremental import (
+    IncrementalState,
+    page_fingerprint,
+    section_fingerprint,
+    summarize_changed_sections,
+)
+from aipdf.llm_backends.llmBackendBase import TransientBackendError
+from aipdf.llm_backends.localBackend import LocalBackend
+
+SECTIONS = {f"Section {i}": f"The text of section {i}. " * 20 for i in range(5)}
+
+
+def stored_state(path) -> IncrementalState:
+    state = IncrementalState(str(path))
+    for section, text in SECTIONS.items():
+        state.put_summary(section_fingerprint(section, text), f"Summary of {section}")
+    state.save()
+    return IncrementalState(str(path))
+
+
+def test_only_changed_sections_are_summarized(tmp_path):
+    state = stored_state(tmp_path / "state.json")
+    sections = dict(SECTIONS, **{"Section 2": "A new text. " * 20})
+    backend = LocalBackend()
+
+    summaries = summarize_changed_sections(sections, backend, state)
+
+    assert backend.calls == 1
+    assert summaries["Section 0"] == "Summary of Section 0"
+    assert summaries["Section 2"] != "Summary of Section 2"
+    with open(tmp_path / "state.json") as f:
+        assert len(json.load(f)["summaries"]) == 5
+
+
+def test_interrupted_stream_keeps_the_unchanged_summaries(tmp_path, capsys):
+    state = stored_state(tmp_path / "state.json")
+    sections = dict(SECTIONS, **{"Section 2": "A new text. " * 20})
+
+    # The provider fails on the changed section, like main.py the state is saved
+    with pytest.raises(TransientBackendError):
+        try:
+            main.print_streamed_summaries(
+                sections, LocalBackend(error_rate=1.0), state=state
+            )
+        finally:
+            state.save()
+
+    with open(tmp_path / "state.json") as f:
+        summaries = json.load(f)["summaries"]
+    # The sections after the failure were not reached but did not change
+    assert sorted(summaries.values()) == [
+        f"Summary of Section {i}" for i in (0, 1, 3, 4)
+    ]
+
+
+def form_page(text: bytes):
+    writer = PdfWriter()
+    page = writer.add_blank_page(100, 100)
+    form = DecodedStreamObject()
+    form.set_data(text)
+    form.update(
+        {
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+        }
+    )
+    page[NameObject("/Resources")] = DictionaryObject(
+        {
+            NameObject("/XObject"): DictionaryObject(
+                {NameObject("/Fm0"): writer._add_object(form)}
+            )
+        }
+    )
+    return page
+
+
+def test_fingerprint_covers_form_xobjects():
+    # The content stream of the pages is the same, only the form they draw differs
+    assert page_fingerprint(form_page(b"BT (a) Tj ET")) != page_fingerprint(
+        form_page(b"BT (b) Tj ET")
+    )
+    assert page_fingerprint(form_page(b"BT (a) Tj ET")) == page_fingerprint(
+        form_page(b"BT (a) Tj ET")
+    )
@@ -0,0 +1,14 @@
+from aipdf.llm_backends.localBackend import LocalBackend
+
+
+def test_streams_are_counted_like_completions(recorded_metrics):
+    backend = LocalBackend()
+    backend.completion("three words here")
+    completed = dict(recorded_metrics.counters)
+
+    recorded_metrics.reset()
+    assert "".join(backend.stream_completion("three words here")) == "three words here"
+
+    assert recorded_metrics.counters == completed
+    assert recorded_metrics.spans["backend.stream"]["count"] == 1
+    assert recorded_metrics.spans["backend.time_to_first_token"]["count"] == 1
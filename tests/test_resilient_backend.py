@@ -0,0 +1,186 @@
+import threading
+import time
+
+import pytest
+
+from aipdf.llm_backends.llmBackendBase import (
+    CircuitOpenError,
+    LLMBackendError,
+    RateLimitError,
+    TransientBackendError,
+)
+from aipdf.llm_backends.localBackend import LocalBackend
+from aipdf.llm_backends.resilientBackend import CircuitBreaker, ResilientBackend
+
+
+def resilient(backend, failure_threshold=2, reset_timeout=0.05, **kwargs):
+    options = dict(timeout=None, max_retries=0, base_delay=0.0)
+    options.update(kwargs)
+    return ResilientBackend(
+        backend,
+        circuit_breaker=CircuitBreaker(failure_threshold, reset_timeout),
+        **options
+    )
+
+
+def test_half_open_trial_closes_the_circuit_on_success():
+    local = LocalBackend(error_rate=1.0)
+    backend = resilient(local)
+
+    for _ in range(2):
+        with pytest.raises(TransientBackendError):
+            backend.completion("prompt")
+    assert backend.circuit_breaker.is_open
+
+    # Rejected without calling the provider while the circuit is open
+    with pytest.raises(CircuitOpenError):
+        backend.completion("prompt")
+    assert local.calls == 2
+
+    time.sleep(0.06)
+    local.error_rate = 0.0
+    assert backend.completion("prompt")
+    assert not backend.circuit_breaker.is_open
+
+
+def test_half_open_trial_lets_one_call_through():
+    local = LocalBackend(error_rate=1.0)
+    backend = resilient(local, failure_threshold=1)
+    with pytest.raises(TransientBackendError):
+        backend.completion("prompt")
+
+    time.sleep(0.06)
+    local.error_rate = 0.0
+    local.latency = 0.2
+    trial = threading.Thread(target=backend.completion, args=("prompt",))
+    trial.start()
+    time.sleep(0.05)
+    # The trial is still in flight, the other calls wait for its outcome
+    with pytest.raises(CircuitOpenError, match="probed"):
+        backend.completion("prompt")
+    trial.join()
+
+    assert not backend.circuit_breaker.is_open
+    assert local.calls == 2
+
+
+def test_failed_half_open_trial_opens_the_circuit_again():
+    local = LocalBackend(error_rate=1.0)
+    backend = resilient(local, failure_threshold=3)
+    for _ in range(3):
+        with pytest.raises(TransientBackendError):
+            backend.completion("prompt")
+
+    time.sleep(0.06)
+    with pytest.raises(TransientBackendError):
+        backend.completion("prompt")
+    # A single failed trial is enough, the threshold does not apply
+    with pytest.raises(CircuitOpenError):
+        backend.completion("prompt")
+
+
+def test_rate_limits_count_as_success():
+    local = LocalBackend(error_rate=1.0)
+    backend = resilient(local, retry_rate_limits=False)
+    with pytest.raises(TransientBackendError):
+        backend.completion("prompt")
+
+    # The provider answers 429, it is up: the failure count is reset
+    local.error_rate, local.rate_limit_rate = 0.0, 1.0
+    for _ in range(5):
+        with pytest.raises(RateLimitError):
+            backend.completion("prompt")
+
+    local.error_rate, local.rate_limit_rate = 1.0, 0.0
+    with pytest.raises(TransientBackendError):
+        backend.completion("prompt")
+    assert not backend.circuit_breaker.is_open
+
+
+def test_rejected_requests_do_not_open_the_circuit():
+    def unauthorized(prompt):
+        raise LLMBackendError("OpenRouter returned HTTP 401")
+
+    local = LocalBackend(template=unauthorized)
+    backend = resilient(local, max_retries=3)
+    for _ in range(5):
+        with pytest.raises(LLMBackendError):
+            backend.completion("prompt")
+
+    # Neither retried nor counted as failures
+    assert local.calls == 5
+    assert not backend.circuit_breaker.is_open
+
+
+class FailingStream(LocalBackend):
+    """
+    Fails after the first words of the stream, like a dropped connection.
+    """
+
+    def stream_completion(self, prompt, *args, **kwargs):
+        words = super().stream_completion(prompt, *args, **kwargs)
+        yield next(words)
+        raise TransientBackendError("Dropped connection")
+
+
+def test_stream_is_not_retried_after_the_first_delta():
+    local = FailingStream()
+    backend = resilient(local, max_retries=3)
+
+    deltas = []
+    with pytest.raises(TransientBackendError):
+        for delta in backend.stream_completion("some words to stream"):
+            deltas.append(delta)
+
+    # The caller already got a delta, a retry would yield it twice
+    assert deltas == ["some "]
+    assert local.calls == 1
+
+
+def test_stream_is_retried_before_the_first_delta():
+    local = LocalBackend(error_rate=1.0)
+    backend = resilient(local, max_retries=3, failure_threshold=5)
+
+    original = local._simulate
+
+    def recover():
+        # Fails once, then the retry succeeds
+        local.error_rate = 0.0 if local.calls else 1.0
+        original()
+
+    local._simulate = recover
+    assert "".join(backend.stream_completion("two words")) == "two words"
+    assert local.calls == 2
+
+
+@pytest.mark.parametrize(
+    "error", [ValueError("bad JSON"), KeyError("choices"), CircuitOpenError("open")]
+)
+def test_other_errors_are_neither_failures_nor_successes(error):
+    def broken(prompt):
+        raise error
+
+    local = LocalBackend(error_rate=1.0)
+    backend = resilient(local)
+    with pytest.raises(TransientBackendError):
+        backend.completion("prompt")
+
+    # The failure count is not reset by the errors the provider did not answer
+    local.error_rate, local.template = 0.0, broken
+    for _ in range(3):
+        with pytest.raises(type(error)):
+            backend.completion("prompt")
+    local.error_rate = 1.0
+    with pytest.raises(TransientBackendError):
+        backend.completion("prompt")
+    assert backend.circuit_breaker.is_open
+
+    # Nor do they close a half-open circuit, but the next call may probe again
+    time.sleep(0.06)
+    local.error_rate = 0.0
+    with pytest.raises(type(error)):
+        backend.completion("prompt")
+    assert backend.circuit_breaker.is_open
+    local.template = LocalBackend.default_template
+    assert backend.completion("two words") == "two words"
+    assert not backend.circuit_breaker.is_open
@@ -0,0 +1,54 @@
+import pytest
+
+from aipdf.llm_backends.cachedBackend import CachedBackend
+from aipdf.llm_backends.llmBackendBase import TransientBackendError
+from aipdf.llm_backends.localBackend import LocalBackend
+from aipdf.llm_backends.routerBackend import RouterBackend
+from aipdf.pipeline import create_backend
+
+
+def test_fails_over_to_the_next_route():
+    broken = LocalBackend(error_rate=1.0)
+    working = LocalBackend()
+    router = RouterBackend([broken, working], names=["broken", "working"])
+
+    for _ in range(3):
+        assert router.completion("some words") == "some words"
+    assert working.calls == 3
+
+
+def test_raises_when_every_route_fails():
+    router = RouterBackend(
+        [LocalBackend(error_rate=1.0), LocalBackend(error_rate=1.0)],
+        names=["a", "b"],
+    )
+    with pytest.raises(TransientBackendError):
+        router.completion("prompt")
+
+
+def test_routed_answers_have_their_own_cache_key(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    router = RouterBackend([LocalBackend(), LocalBackend()], names=["b", "a"])
+    routed = CachedBackend(router, path=path)
+    single = CachedBackend(LocalBackend(), path=path)
+
+    assert router.cache_name == "router:a,b"
+    assert routed.cache_key("prompt", 16, 0.8, None) != single.cache_key(
+        "prompt", 16, 0.8, None
+    )
+
+
+def resilient_route(backend):
+    # The route is the rate limited resilient backend of one model
+    return backend.backend
+
+
+def test_routes_leave_the_failover_to_the_router():
+    router = create_backend(models=["Zephyr7b", "GPT4_Turbo"], timeout=180.0)
+    for route in router.backends:
+        assert resilient_route(route).max_retries == 1
+        assert resilient_route(route).timeout == 90.0
+
+    single = create_backend(models=["Zephyr7b"], timeout=180.0)
+    assert resilient_route(single).max_retries == 4
+    assert resilient_route(single).timeout == 180.0
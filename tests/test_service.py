@@ -0,0 +1,68 @@
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+from aipdf.llm_backends.localBackend import LocalBackend
+from aipdf.service import SummarizationService, make_server, resolve_job_path
+
+
+def test_paths_are_resolved_under_the_root(tmp_path):
+    (tmp_path / "papers").mkdir()
+    root = str(tmp_path / "papers")
+
+    assert resolve_job_path("paper.pdf", root) == os.path.join(
+        os.path.realpath(root), "paper.pdf"
+    )
+    assert resolve_job_path("../secret.pdf", root) is None
+    assert resolve_job_path("/etc/passwd", root) is None
+    # Paths are only accepted with a root
+    assert resolve_job_path("paper.pdf", None) is None
+
+
+def test_symbolic_links_do_not_lead_out_of_the_root(tmp_path):
+    (tmp_path / "papers").mkdir()
+    (tmp_path / "secret.pdf").write_bytes(b"%PDF")
+    os.symlink(tmp_path / "secret.pdf", tmp_path / "papers" / "link.pdf")
+
+    assert resolve_job_path("link.pdf", str(tmp_path / "papers")) is None
+
+
+@pytest.fixture
+def server(tmp_path):
+    # The workers are not started, the submitted jobs stay queued
+    service = SummarizationService(LocalBackend())
+    server = make_server(service, port=0, path_root=str(tmp_path), max_body_size=1024)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body: bytes, content_type: str = "application/json"):
+    connection = http.client.HTTPConnection(*server.server_address)
+    connection.request(
+        "POST", "/jobs", body=body, headers={"Content-Type": content_type}
+    )
+    response = connection.getresponse()
+    status, data = response.status, json.loads(response.read())
+    connection.close()
+    return status, data
+
+
+def test_jobs_are_accepted_by_path_under_the_root(server):
+    status, job = post(server, json.dumps({"path": "paper.pdf"}).encode())
+    assert status == 202
+    assert job["status"] == "queued"
+
+    status, _ = post(server, json.dumps({"path": "../paper.pdf"}).encode())
+    assert status == 403
+
+
+def test_large_uploads_are_rejected(server):
+    status, error = post(server, b"%PDF" + b"0" * 2048, "application/pdf")
+    assert status == 413
+    assert "1024" in error["error"]